@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# async_parallax.py                                                           #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold an asyncio interface to run a Parallax Servo            #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import asyncio
+
+###############################################################################
+# Main class
+
+class AsyncParallax:
+    """
+    asyncio front end for a Parallax servo.
+
+    Calls that talk to the pigpio daemon or block for a while (run(),
+    calibrate()...) are sent to a worker thread, so the event loop keeps
+    serving other tasks meanwhile.
+
+    The feedback callback is bridged into the event loop without creating
+    a task per edge: on each new feedback period the callback thread
+    schedules a single wake-up on the loop (unless one is already pending),
+    which resolves the future every waiting task is awaiting. Thousands of
+    tasks can share the feedback stream that way.
+    """
+
+    def __init__(self, parallax, loop = None):
+        self.parallax = parallax
+
+        self.__loop = loop
+        self.__future = None # Resolved on the next feedback period, shared by every waiting task
+        self.__wake_pending = False
+        self.__listening = False
+
+        # Bound once, so the very object registered is the one removed by close().
+
+        self.__listener = self.__on_feedback
+
+    ###########################################################################
+    # Feedback bridge
+
+    def __on_feedback(self):
+        # Runs on the pigpio callback thread, once per feedback period. At most one wake-up is
+        # scheduled on the loop, no matter how many periods arrive before it runs, and none at all while no
+        # task is waiting. A task starting to wait right after this check is woken up on the next period.
+
+        if self.__wake_pending or self.__future is None:
+            return
+
+        self.__wake_pending = True
+
+        try:
+            self.__loop.call_soon_threadsafe(self.__wake)
+        except RuntimeError: # The loop was closed
+            self.__wake_pending = False
+
+    def __wake(self):
+        # Runs on the event loop.
+
+        self.__wake_pending = False
+
+        future, self.__future = self.__future, None
+
+        if future is not None and not future.done():
+            future.set_result(self.sample())
+
+    def __listen(self):
+        if self.__listening:
+            return
+
+        if self.__loop is None:
+            self.__loop = asyncio.get_running_loop()
+
+        self.parallax.add_feedback_listener(self.__listener)
+        self.__listening = True
+
+    async def next_sample(self):
+        """
+        Waits for the next feedback period and returns its sample (see sample()).
+        """
+
+        self.__listen()
+
+        if self.__future is None:
+            self.__future = self.__loop.create_future()
+
+        return await asyncio.shield(self.__future)
+
+    def sample(self):
+        """
+        Returns the last feedback sample as (tick, duty cycle, angle).
+        """
+
+        return (self.parallax.get_feedback_tick(), self.parallax.get_feedback_duty_cycle(), self.parallax.get_angle())
+
+    async def feedback(self):
+        """
+        Asynchronous iterator over the feedback samples. Slow consumers get
+        the latest sample instead of a backlog.
+        """
+
+        while True:
+            yield await self.next_sample()
+
+    ###########################################################################
+    # Servo control
+
+    async def run(self, power = None):
+        return await asyncio.to_thread(self.parallax.run, power)
+
+    async def stop(self):
+        await asyncio.to_thread(self.parallax.stop)
+
+    async def calibrate(self, **calibrate_kwargs):
+        await asyncio.to_thread(self.parallax.calibrate, **calibrate_kwargs)
+
+    async def load_or_calibrate(self, *args, **kwargs):
+        return await asyncio.to_thread(self.parallax.load_or_calibrate, *args, **kwargs)
+
+    async def wait_for_angle(self, angle, tolerance = 2.0, timeout = None):
+        """
+        Waits until the axle is within tolerance degrees of the given angle.
+        Raises asyncio.TimeoutError if timeout seconds pass first.
+        """
+
+        async def wait():
+            while True:
+                error = ((self.parallax.get_angle() - angle + 180.0) % 360.0) - 180.0
+
+                if abs(error) <= tolerance:
+                    return
+
+                await self.next_sample()
+
+        await asyncio.wait_for(wait(), timeout)
+
+    def close(self):
+        """
+        Detaches from the feedback stream. The Parallax object is left as is.
+        """
+
+        if self.__listening:
+            self.parallax.remove_feedback_listener(self.__listener)
+            self.__listening = False
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# backend.py                                                                  #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold the GPIO backends a Parallax Servo can be driven with   #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import heapq, itertools, threading, time, pigpio
+
+###############################################################################
+# Backend interface
+
+class _Timer:
+
+    def __init__(self, when, func):
+        self.when = when
+        self.func = func
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Backend:
+    """
+    The set of GPIO operations used by the Parallax class and the
+    PWM reader. It mirrors the subset of pigpio.pi used by this
+    project, plus a clock (time() and sleep()) so the code driving
+    the servo can run against simulated time as well.
+    """
+
+    connected = False
+
+    def __init__(self):
+        # Timers set by call_later(), run by a single thread started on the first one.
+
+        self.__timers = [] # Heap of (monotonic time, order, _Timer)
+        self.__timer_order = itertools.count()
+        self.__timer_cond = threading.Condition()
+        self.__timer_thread = None
+        self.__timers_running = True
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        """
+        Starts (500-2500 μs) or stops (0) servo pulses on the gpio.
+        """
+        raise NotImplementedError
+
+    def get_servo_pulsewidth(self, gpio):
+        """
+        Returns the servo pulse width being used on the gpio.
+        """
+        raise NotImplementedError
+
+    def set_servo_pulsewidths(self, pulsewidths):
+        """
+        Sets the servo pulse width of many gpios at once, given a
+        dictionary gpio -> pulse width. Backends able to batch the
+        changes should override this.
+        """
+        for gpio, pulsewidth in pulsewidths.items():
+            self.set_servo_pulsewidth(gpio, pulsewidth)
+
+    def set_mode(self, gpio, mode):
+        """
+        Sets the gpio mode (pigpio.INPUT, pigpio.OUTPUT...).
+        """
+        raise NotImplementedError
+
+    def callback(self, gpio, edge, func):
+        """
+        Calls func(gpio, level, tick) whenever the given edge is
+        detected on the gpio. Returns an object with a cancel() method.
+        """
+        raise NotImplementedError
+
+    def get_current_tick(self):
+        """
+        Returns the current tick (μs since boot, wrapping every 2^32 μs).
+        """
+        raise NotImplementedError
+
+    def time(self):
+        """
+        Returns the current time in seconds.
+        """
+        raise NotImplementedError
+
+    def clock(self):
+        """
+        Returns the current time in seconds, like time(), but cheap and
+        without side effects, so it can be read from callbacks.
+        """
+        return time.perf_counter()
+
+    def sleep(self, seconds):
+        """
+        Suspends the caller for the given number of seconds.
+        A zero value just yields to other threads.
+        """
+        raise NotImplementedError
+
+    def call_later(self, delay, func):
+        """
+        Calls func() from the timer thread of the backend once delay
+        seconds have passed. Every timer runs on that same thread (no
+        thread is started per timer), so func() should return quickly.
+        Returns an object with a cancel() method.
+        """
+        timer = _Timer(time.monotonic() + delay, func)
+
+        with self.__timer_cond:
+            heapq.heappush(self.__timers, (timer.when, next(self.__timer_order), timer))
+
+            if self.__timer_thread is None:
+                self.__timer_thread = threading.Thread(target=self.__run_timers, name="backend-timers", daemon=True)
+                self.__timer_thread.start()
+
+            # Only the earliest deadline matters to the timer thread.
+
+            if self.__timers[0][2] is timer:
+                self.__timer_cond.notify()
+
+        return timer
+
+    def _stop_timers(self):
+        # Stops the timer thread, dropping every timer left.
+
+        with self.__timer_cond:
+            self.__timers_running = False
+            self.__timers = []
+            self.__timer_cond.notify()
+
+    def __run_timers(self):
+        while True:
+            with self.__timer_cond:
+                timer = None
+
+                while timer is None:
+                    if not self.__timers_running:
+                        return
+
+                    while self.__timers and self.__timers[0][2].cancelled:
+                        heapq.heappop(self.__timers)
+
+                    if not self.__timers:
+                        self.__timer_cond.wait()
+                        continue
+
+                    delay = self.__timers[0][0] - time.monotonic()
+
+                    if delay > 0:
+                        self.__timer_cond.wait(delay)
+                        continue
+
+                    timer = heapq.heappop(self.__timers)[2]
+
+            # Out of the lock, so func() may set new timers.
+
+            if not timer.cancelled:
+                timer.func()
+
+    def wait_for(self, condition, predicate, timeout = None):
+        """
+        Blocks until predicate() is true or timeout seconds have passed.
+        The condition must be notified whenever the predicate might have
+        changed. Returns the last value of the predicate.
+        """
+        with condition:
+            return condition.wait_for(predicate, timeout)
+
+    def stop(self):
+        """
+        Releases the resources held by the backend.
+        """
+        raise NotImplementedError
+
+###############################################################################
+# pigpio backend
+
+class PigpioBackend(Backend):
+    """
+    Backend talking to a real Raspberry Pi through the pigpio daemon.
+    Remember to launch it first with "sudo pigpiod".
+    """
+
+    SCRIPT_PARAMS = 10 # Maximum number of parameters of a pigpio script
+
+    def __init__(self, host = None, port = None):
+        super().__init__()
+
+        kwargs = {}
+
+        if host is not None:
+            kwargs["host"] = host
+        if port is not None:
+            kwargs["port"] = port
+
+        self.pi = pigpio.pi(**kwargs)
+
+        # Scripts stored on the daemon to set many servo pulse widths in a single command, by set of gpios.
+
+        self.__scripts = {}
+
+    @property
+    def connected(self):
+        return self.pi.connected
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        return self.pi.set_servo_pulsewidth(gpio, pulsewidth)
+
+    def get_servo_pulsewidth(self, gpio):
+        return self.pi.get_servo_pulsewidth(gpio)
+
+    def set_servo_pulsewidths(self, pulsewidths):
+        # Each call to the daemon is a socket round trip, so the pulse widths are sent as the parameters
+        # of a script which sets them all. A script takes up to 10 parameters, so bigger batches are split.
+
+        gpios = sorted(pulsewidths)
+
+        for i in range(0, len(gpios), self.SCRIPT_PARAMS):
+            chunk = tuple(gpios[i:i + self.SCRIPT_PARAMS])
+
+            try:
+                self.pi.run_script(self.__script(chunk), [pulsewidths[gpio] for gpio in chunk])
+            except pigpio.error: # Scripts unavailable (or busy), one command per servo then.
+                for gpio in chunk:
+                    self.pi.set_servo_pulsewidth(gpio, pulsewidths[gpio])
+
+    def __script(self, gpios):
+        if gpios not in self.__scripts:
+            code = " ".join("SERVO {} p{}".format(gpio, i) for i, gpio in enumerate(gpios))
+            self.__scripts[gpios] = self.pi.store_script(code.encode())
+
+        return self.__scripts[gpios]
+
+    def set_mode(self, gpio, mode):
+        return self.pi.set_mode(gpio, mode)
+
+    def callback(self, gpio, edge, func):
+        return self.pi.callback(gpio, edge, func)
+
+    def get_current_tick(self):
+        return self.pi.get_current_tick()
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+
+    def stop(self):
+        for script_id in self.__scripts.values():
+            self.pi.delete_script(script_id)
+
+        self._stop_timers()
+        self.pi.stop()
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# benchmark.py                                                                #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will measure the performance of the Parallax Servo code           #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import argparse, json, math, os, platform, subprocess, sys, time
+import parallax, read_PWM, simulation
+
+###############################################################################
+# Global methods
+
+def synthetic_edges(count, speed = 600.0, frequency = 910.0, min_dc = 2.9, max_dc = 97.1, glitch_every = 0):
+    # Returns a list of (level, tick) edges of a feedback signal whose axle turns at the given
+    # speed (degrees per second). If glitch_every is not zero, a short spurious pulse is inserted
+    # every that many periods.
+
+    period = 1000000.0 / frequency
+    edges = []
+
+    tick = 0.0
+    angle = 0.0
+    n = 0
+
+    while len(edges) < count:
+        high = period * (min_dc + (max_dc - min_dc) * (angle % 360.0) / 360.0) / 100.0
+
+        edges.append((1, int(tick) & 0xFFFFFFFF))
+        edges.append((0, int(tick + high) & 0xFFFFFFFF))
+
+        n += 1
+
+        if glitch_every and n % glitch_every == 0:
+            glitch = tick + high + (period - high) / 2
+            edges.append((1, int(glitch) & 0xFFFFFFFF))
+            edges.append((0, int(glitch + 3) & 0xFFFFFFFF))
+
+        tick += period
+        angle += speed * period / 1000000.0
+
+    return edges[:count]
+
+def bench_reader_filters(count = 200000):
+    # Feeds the same synthetic edges to readers using every filter (with and without period gating),
+    # and returns the time spent per edge (μs) by the callback of each one.
+
+    edges = synthetic_edges(count, glitch_every = 100)
+
+    modes = {"ewma": read_PWM.EWMA, "circular": read_PWM.CIRCULAR, "median": read_PWM.MEDIAN}
+    results = {}
+
+    for gating in (False, True):
+        for name, mode in modes.items():
+            reader = read_PWM.reader(simulation.SimulatedPi(), 0, weighting = 0.5, filter_mode = mode, period_gating = gating)
+            cbf = reader._cbf
+
+            start = time.perf_counter()
+
+            for level, tick in edges:
+                cbf(0, level, tick)
+
+            elapsed = time.perf_counter() - start
+
+            results[name + ("+gating" if gating else "")] = elapsed * 1000000.0 / count
+
+            reader.cancel()
+
+    # Turn counting on top of the filter used by Parallax.
+
+    reader = read_PWM.reader(simulation.SimulatedPi(), 0, filter_mode = read_PWM.MEDIAN, period_gating = True, turn_counting = True)
+    cbf = reader._cbf
+
+    start = time.perf_counter()
+
+    for level, tick in edges:
+        cbf(0, level, tick)
+
+    results["median+gating+turns"] = (time.perf_counter() - start) * 1000000.0 / count
+
+    reader.cancel()
+
+    return results
+
+def bench_feedback_throughput(rates = (1, 10, 100), duration = 1.0):
+    # Drives the reader callback (configured as Parallax does) with synthetic edges paced in real time at
+    # the given multiples of the feedback rate (1820 edges per second), for duration seconds each. For each
+    # rate it returns the edges per second delivered, the share of the time spent inside the callback, and
+    # the worst lag (μs) of an edge behind its schedule, which grows if the callback can not keep up.
+    # The unpaced throughput (as many edges per second as possible) is returned too.
+
+    results = {}
+
+    for rate in rates:
+        frequency = 910.0 * rate
+        count = int(2 * frequency * duration)
+        edges = synthetic_edges(count, frequency = frequency)
+
+        reader = read_PWM.reader(simulation.SimulatedPi(), 0, filter_mode = read_PWM.MEDIAN, period_gating = True,
+                                 nominal_frequency = frequency, turn_counting = True)
+        cbf = reader._cbf
+
+        interval = 1.0 / (2 * frequency)
+        busy = 0.0
+        max_lag = 0.0
+
+        start = time.perf_counter()
+
+        for n, (level, tick) in enumerate(edges):
+            due = start + n * interval
+
+            while True:
+                now = time.perf_counter()
+
+                if now >= due:
+                    break
+
+            max_lag = max(max_lag, now - due)
+
+            cbf(0, level, tick)
+            busy += time.perf_counter() - now
+
+        elapsed = time.perf_counter() - start
+
+        results[str(rate) + "x"] = {
+            "edges_per_second": count / elapsed,
+            "callback_load": busy / elapsed,
+            "max_lag_us": max_lag * 1000000.0,
+            "periods_read": reader.periods()
+        }
+
+        reader.cancel()
+
+    edges = synthetic_edges(200000)
+    reader = read_PWM.reader(simulation.SimulatedPi(), 0, filter_mode = read_PWM.MEDIAN, period_gating = True, turn_counting = True)
+    cbf = reader._cbf
+
+    start = time.perf_counter()
+
+    for level, tick in edges:
+        cbf(0, level, tick)
+
+    results["unpaced"] = {"edges_per_second": len(edges) / (time.perf_counter() - start)}
+
+    reader.cancel()
+
+    return results
+
+def bench_run(count = 100000):
+    # Returns the time spent per Parallax.run() call (μs) on a simulated servo, sweeping every integer
+    # power from -100 to 100. The pulse widths are computed but not sent (apply=False), so the cost of
+    # the backend is left out as much as possible.
+
+    pi = simulation.SimulatedPi()
+    pi.attach(simulation.ServoPlant(), 14, 15)
+
+    servo = parallax.Parallax(14, 15, backend = pi)
+    run = servo.run
+
+    start = time.perf_counter()
+
+    for i in range(count):
+        run(i % 201 - 100, apply = False)
+
+    elapsed = time.perf_counter() - start
+
+    servo.destroy()
+
+    return elapsed * 1000000.0 / count
+
+def bench_instrumentation(count = 200000):
+    # Returns the cost (μs) of the reader callback per edge and of Parallax.run() per call, with
+    # instrumentation disabled and enabled. Disabled, the plain callback is registered and run() only
+    # checks an attribute, so both should match their uninstrumented cost.
+
+    edges = synthetic_edges(count, glitch_every = 100)
+
+    pi = simulation.SimulatedPi()
+    pi.attach(simulation.ServoPlant(), 14, 15)
+
+    servo = parallax.Parallax(14, 15, backend = pi)
+    reader = read_PWM.reader(simulation.SimulatedPi(), 0, filter_mode = read_PWM.MEDIAN, period_gating = True, turn_counting = True)
+
+    results = {}
+
+    for enabled in (False, True):
+        if enabled:
+            reader.set_instrumentation(servo.enable_instrumentation())
+
+        cbf = reader._callback()
+
+        start = time.perf_counter()
+
+        for level, tick in edges:
+            cbf(0, level, tick)
+
+        results["callback" + ("+instrumentation" if enabled else "")] = (time.perf_counter() - start) * 1000000.0 / count
+
+        run = servo.run
+        runs = count // 2
+
+        start = time.perf_counter()
+
+        for i in range(runs):
+            run(i % 201 - 100)
+
+        results["run" + ("+instrumentation" if enabled else "")] = (time.perf_counter() - start) * 1000000.0 / runs
+
+    reader.cancel()
+    servo.destroy()
+
+    return results
+
+def bench_calibration(strategies = None):
+    # Runs the whole calibration procedure on a simulated servo (the scripted fake pigpio of simulation.py)
+    # with every given strategy (name -> calibrate() keyword arguments), returning the wall time and the
+    # simulated time (what it would take on a real servo) in seconds, along with the values found.
+
+    if strategies is None:
+        strategies = {
+            "linear": {},
+            "bisection+adaptive": {"stop_search": parallax.Parallax.BISECTION_SEARCH, "limit_search": parallax.Parallax.ADAPTIVE_SEARCH}
+        }
+
+    results = {}
+
+    for name, calibrate_kwargs in strategies.items():
+        pi = simulation.SimulatedPi()
+        pi.attach(simulation.ServoPlant(seed = 1), 14, 15)
+
+        servo = parallax.Parallax(14, 15, backend = pi)
+        servo.verbose = False
+
+        start = time.perf_counter()
+        simulated_start = pi.time()
+
+        servo.calibrate(**calibrate_kwargs)
+
+        results[name] = {
+            "wall_time": time.perf_counter() - start,
+            "simulated_time": pi.time() - simulated_start,
+            "values": servo.get_calibration()
+        }
+
+        servo.destroy()
+
+    return results
+
+def _commit():
+    # Returns the git commit of this tree, if any, so results can be told apart.
+
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)),
+                              capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_all(quick = False):
+    # Runs every benchmark, returning their results as a JSON-serializable dictionary.
+
+    import_time, numpy_loaded = bench_import()
+
+    results = {
+        "meta": {
+            "commit": _commit(),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")
+        },
+        "reader_filters_us": bench_reader_filters(20000 if quick else 200000),
+        "feedback_throughput": bench_feedback_throughput(duration = 0.2 if quick else 1.0),
+        "run_us": bench_run(10000 if quick else 100000),
+        "instrumentation_us": bench_instrumentation(20000 if quick else 200000),
+        "import_parallax": {"ms": import_time, "numpy": numpy_loaded}
+    }
+
+    if not quick:
+        results["calibration"] = bench_calibration()
+
+    return results
+
+def bench_import(module = "parallax", repeat = 5):
+    # Returns the best time (ms) spent importing the given module on a fresh interpreter, and whether
+    # NumPy was imported along with it.
+
+    code = ("import sys, time; start = time.perf_counter(); import " + module + "; "
+            "print(time.perf_counter() - start, 'numpy' in sys.modules)")
+
+    best = math.inf
+    numpy_loaded = False
+
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                capture_output = True, text = True, check = True).stdout.split()
+
+        best = min(best, float(output[0]) * 1000.0)
+        numpy_loaded = output[1] == "True"
+
+    return best, numpy_loaded
+
+###############################################################################
+# Main program
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmarks of the Parallax Servo code")
+    parser.add_argument("--json", metavar="PATH", nargs="?", const="-", help="write the results as JSON to PATH (or stdout)")
+    parser.add_argument("--quick", action="store_true", help="smaller runs, calibration left out")
+    args = parser.parse_args()
+
+    results = run_all(args.quick)
+
+    if args.json is not None:
+        if args.json == "-":
+            json.dump(results, sys.stdout, indent=2)
+            print()
+        else:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+        sys.exit(0)
+
+    print("Reader callback cost per edge:")
+
+    for name, cost in results["reader_filters_us"].items():
+        print("\t{:<28}{:.2f} μs".format(name, cost))
+
+    print("Feedback throughput:")
+
+    for name, result in results["feedback_throughput"].items():
+        if "callback_load" in result:
+            print("\t{:<28}{:.0f} edges/s, {:.1f} % load, max lag {:.0f} μs".format(name, result["edges_per_second"],
+                                                                                 100.0 * result["callback_load"], result["max_lag_us"]))
+        else:
+            print("\t{:<28}{:.0f} edges/s".format(name, result["edges_per_second"]))
+
+    print("Parallax.run() cost: {:.2f} μs".format(results["run_us"]))
+
+    print("Instrumentation cost:")
+
+    for name, cost in results["instrumentation_us"].items():
+        print("\t{:<28}{:.2f} μs".format(name, cost))
+
+    print("import parallax: {:.1f} ms (NumPy {})".format(results["import_parallax"]["ms"],
+                                                         "imported" if results["import_parallax"]["numpy"] else "not imported"))
+
+    if "calibration" in results:
+        print("Calibration time:")
+
+        for name, result in results["calibration"].items():
+            print("\t{:<28}{:.1f} s wall, {:.1f} s simulated".format(name, result["wall_time"], result["simulated_time"]))
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# calibration_profile.py                                                      #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will store calibration values of Parallax Servos on disk          #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import json, os, time
+
+###############################################################################
+# Global variables
+
+# Every profile lives on the same JSON file, one entry per servo.
+
+DEFAULT_PROFILE_PATH = os.path.join(os.path.expanduser("~"), ".parallax", "profiles.json")
+
+# Profiles older than this (in seconds) are considered stale and will trigger a new calibration.
+
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+###############################################################################
+# Global methods
+
+def profile_key(servo_id, control_pin, feedback_pin):
+    # The same servo might be wired to other pins, and other servo might be wired to the same pins,
+    # so all of them are part of the key.
+
+    return "{}:{}:{}".format(servo_id, control_pin, feedback_pin)
+
+def _read_profiles(path):
+    try:
+        with open(path) as f:
+            profiles = json.load(f)
+    except (OSError, ValueError): # No file yet, or a corrupted one. Both mean "no profiles".
+        return {}
+
+    if not isinstance(profiles, dict):
+        return {}
+
+    return profiles
+
+def _write_profiles(profiles, path):
+    # Written to a temporary file first, so an interrupted write never leaves a broken profile behind.
+
+    tmp_path = path + ".tmp"
+
+    with open(tmp_path, "w") as f:
+        json.dump(profiles, f, indent=4, sort_keys=True)
+
+    os.replace(tmp_path, path)
+
+def load_profile(key, path = DEFAULT_PROFILE_PATH, max_age = DEFAULT_MAX_AGE):
+    """
+    Returns the calibration values stored under the given key, or None if
+    there is no profile or it is older than max_age seconds.
+    """
+
+    entry = _read_profiles(path).get(key)
+
+    if not isinstance(entry, dict) or "values" not in entry or "timestamp" not in entry:
+        return None
+
+    if max_age is not None and time.time() - entry["timestamp"] > max_age:
+        return None
+
+    return entry["values"]
+
+def save_profile(key, values, path = DEFAULT_PROFILE_PATH):
+    """
+    Stores the calibration values under the given key, keeping the
+    profiles of any other servo found on the same file.
+    """
+
+    profiles = _read_profiles(path)
+    profiles[key] = {"timestamp": time.time(), "values": values}
+
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    _write_profiles(profiles, path)
+
+def delete_profile(key, path = DEFAULT_PROFILE_PATH):
+    """
+    Removes the profile stored under the given key, if any.
+    """
+
+    profiles = _read_profiles(path)
+
+    if profiles.pop(key, None) is not None:
+        _write_profiles(profiles, path)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# calibration_scheduler.py                                                    #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will calibrate many Parallax Servos at the same time              #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+###############################################################################
+# Global methods
+
+def _calibrate_servo(servo, calibrate_kwargs):
+    # Runs on a worker thread. The calibration procedure spends almost all its time waiting for the
+    # feedback signal (sleeping on a condition, see read_PWM.reader.wait_for_periods()), so the calibration
+    # of every servo overlaps with the others.
+
+    start = servo.get_time()
+    servo.calibrate(**calibrate_kwargs)
+
+    return servo.get_calibration(), servo.get_time() - start
+
+def calibrate_all(servos, max_workers = None, verbose = True, **calibrate_kwargs):
+    """
+    Calibrates every given Parallax servo concurrently, one worker thread
+    per servo (or max_workers), passing calibrate_kwargs to calibrate().
+
+    Returns a dictionary with:
+     - "results": servo_id -> {"values": calibration values, "time": s}
+     - "failures": servo_id -> exception raised by its calibration
+     - "wall_time": total time (s) spent calibrating them all
+
+    Each servo's time is measured by its own backend clock. Note that
+    servos sharing a SimulatedPi share its simulated clock too: a sleep of
+    any of them moves it for all, so their waits mostly overlap (three such
+    servos take ~44 s of simulated time, against ~37 s for one) but each
+    time measured includes the others' interleaved steps. Give each
+    simulated servo its own SimulatedPi to time each calibration alone.
+    """
+
+    servos = list(servos)
+
+    results = {}
+    failures = {}
+
+    # Progress messages of many servos would be interleaved, so they are muted while calibrating.
+
+    verbosity = {servo: servo.verbose for servo in servos}
+
+    for servo in servos:
+        servo.verbose = False
+
+    start = time.time()
+
+    try:
+        with ThreadPoolExecutor(max_workers = max_workers or max(len(servos), 1)) as executor:
+            futures = {servo: executor.submit(_calibrate_servo, servo, calibrate_kwargs) for servo in servos}
+
+            for servo, future in futures.items():
+                try:
+                    values, elapsed = future.result()
+                except Exception as e: # Any failure is reported, without stopping the other calibrations
+                    failures[servo.servo_id] = e
+
+                    if verbose:
+                        print(servo.servo_id, "calibration failed:", e)
+                else:
+                    results[servo.servo_id] = {"values": values, "time": elapsed}
+
+                    if verbose:
+                        print(servo.servo_id, "calibrated in", round(elapsed, 1), "s")
+    finally:
+        for servo in servos:
+            servo.verbose = verbosity[servo]
+
+    wall_time = time.time() - start
+
+    if verbose:
+        print("Calibrated", len(results), "of", len(servos), "servos in", round(wall_time, 1), "s")
+
+    return {"results": results, "failures": failures, "wall_time": wall_time}
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# command_writer.py                                                           #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will limit the pulse width commands sent to a Parallax Servo      #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import threading
+
+###############################################################################
+# Main class
+
+class CommandWriter:
+    """
+    Sends the pulse width commands of a single servo, saving the daemon
+    the ones that can never reach it:
+     - A value equal to the one already applied is not sent.
+     - The servo only reads the pulse width once per PWM period, so a
+       burst of commands within min_interval is collapsed into its latest
+       value, sent when the interval is over (using Backend.call_later()).
+     - If frame_aligned is set, every change is applied on a frame
+       boundary (multiples of min_interval since the first command).
+
+    Counters of sent and suppressed commands are kept (see stats()).
+    """
+
+    def __init__(self, backend, gpio, min_interval = 0.02, frame_aligned = False, instrumentation = None):
+        self.backend = backend
+        self.gpio = gpio
+
+        # If set, the round trip of every command is measured (see instrumentation.py).
+
+        self.instrumentation = instrumentation
+
+        self.min_interval = min_interval
+        self.frame_aligned = frame_aligned
+
+        self.__pulse_width = None # Last pulse width applied
+        self.__pending = None # Latest pulse width waiting for its time slot
+        self.__timer = None
+        self.__timer_id = 0 # Tells a stale timer (one that fired while being cancelled) from the current one
+
+        # Times are read with Backend.clock(), which has no side effects (time() moves the simulated clock).
+
+        self.__last_send = None # Backend clock of the last command sent
+        self.__frame_start = None # Backend clock of the first frame boundary
+
+        # The simulated backend runs the timers from the very thread asking for the time, so the lock
+        # must be reentrant.
+
+        self.__lock = threading.RLock()
+
+        # Counters
+
+        self.__requested = 0
+        self.__sent = 0
+        self.__unchanged = 0 # Equal to the value already applied
+        self.__coalesced = 0 # Overwritten by a later value before being sent
+
+    def write(self, pulse_width, immediate = False):
+        # Asks for the given pulse width to be applied. Unless "immediate" is set, it might be sent later
+        # (or not at all). Returns True if it was sent right away.
+
+        with self.__lock:
+            self.__requested += 1
+
+            if immediate:
+                self.__cancel_timer()
+
+                if self.__pending is not None:
+                    self.__pending = None
+                    self.__coalesced += 1
+
+                return self.__send(pulse_width)
+
+            if self.__pending is not None:
+                # A command is already waiting for its slot: it is replaced by this one.
+
+                self.__pending = pulse_width
+                self.__coalesced += 1
+
+                return False
+
+            if pulse_width == self.__pulse_width:
+                self.__unchanged += 1
+
+                return False
+
+            delay = self.__delay()
+
+            if delay <= 0.0:
+                return self.__send(pulse_width)
+
+            self.__pending = pulse_width
+            self.__timer_id += 1
+
+            timer_id = self.__timer_id
+            self.__timer = self.backend.call_later(delay, lambda: self.__expire(timer_id))
+
+            return False
+
+    def flush(self):
+        # Sends the pending command, if any, right away.
+
+        with self.__lock:
+            self.__cancel_timer()
+
+            if self.__pending is None:
+                return
+
+            pulse_width, self.__pending = self.__pending, None
+
+            self.__send(pulse_width)
+
+    def record(self, pulse_width):
+        # Notes a pulse width sent from outside this writer (e.g. a batched update of a ParallaxGroup),
+        # dropping any pending command.
+
+        with self.__lock:
+            self.__cancel_timer()
+            self.__pending = None
+
+            self.__pulse_width = pulse_width
+            self.__last_send = self.backend.clock()
+
+            if self.__frame_start is None:
+                self.__frame_start = self.__last_send
+
+    def cancel(self):
+        # Drops the pending command, if any.
+
+        with self.__lock:
+            self.__cancel_timer()
+            self.__pending = None
+
+    def get_pulse_width(self):
+        # Returns the latest pulse width asked for, sent or not.
+
+        pending = self.__pending
+
+        return self.__pulse_width if pending is None else pending
+
+    def stats(self):
+        # Returns the number of commands asked for, sent and suppressed (the ones equal to the value already
+        # applied plus the ones collapsed into a later value).
+
+        return {
+            "requested": self.__requested,
+            "sent": self.__sent,
+            "suppressed": self.__unchanged + self.__coalesced,
+            "unchanged": self.__unchanged,
+            "coalesced": self.__coalesced
+        }
+
+    def __delay(self):
+        # Time (s) to wait before the next command can be sent.
+
+        if self.__last_send is None:
+            return 0.0
+
+        now = self.backend.clock()
+
+        if self.frame_aligned:
+            frames = int((now - self.__frame_start) / self.min_interval) + 1
+
+            return self.__frame_start + frames * self.min_interval - now
+
+        return self.__last_send + self.min_interval - now
+
+    def __send(self, pulse_width):
+        if pulse_width == self.__pulse_width:
+            self.__unchanged += 1
+
+            return False
+
+        stats = self.instrumentation
+
+        if stats is None:
+            self.backend.set_servo_pulsewidth(self.gpio, pulse_width)
+        else:
+            start = stats.clock()
+            self.backend.set_servo_pulsewidth(self.gpio, pulse_width)
+            stats.observe("command_rtt_us", (stats.clock() - start) * 1000000.0)
+            stats.count("commands_sent")
+
+        self.__pulse_width = pulse_width
+        self.__last_send = self.backend.clock()
+        self.__sent += 1
+
+        if self.__frame_start is None:
+            self.__frame_start = self.__last_send
+
+        return True
+
+    def __expire(self, timer_id):
+        with self.__lock:
+            if timer_id == self.__timer_id:
+                self.flush()
+
+    def __cancel_timer(self):
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+            self.__timer_id += 1
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# controller.py                                                               #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold a closed-loop controller for a Parallax Servo           #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import threading
+
+###############################################################################
+# Main class
+
+class Controller:
+    """
+    Closed-loop position and velocity control of a Parallax servo, running
+    once per feedback period on a dedicated thread.
+
+    Position mode is a PID on the unwrapped (multi-turn) angle of the axle.
+    Velocity mode is a feed-forward term, taken from the maximum speed found
+    by calibration, plus a PI on the measured angular velocity. Both clamp
+    their integral terms (anti-windup) and stop integrating while the output
+    is saturated.
+
+    Angles and velocities follow the feedback signal: positive means
+    counter-clockwise, which is a negative power for Parallax.run().
+    """
+
+    POSITION = "position"
+    VELOCITY = "velocity"
+
+    def __init__(self, parallax, reader,
+                 position_gains = (1.2, 0.8, 0.02),
+                 velocity_gains = (0.02, 0.4),
+                 velocity_smoothing = 0.9,
+                 max_power = 100):
+
+        self.parallax = parallax
+        self.reader = reader
+
+        self.kp, self.ki, self.kd = position_gains
+        self.velocity_kp, self.velocity_ki = velocity_gains
+
+        self.velocity_smoothing = velocity_smoothing # EWMA weighting of the measured velocity
+        self.max_power = max_power
+
+        self.__mode = None
+        self.__target = 0.0 # Degrees (position mode) or degrees per second (velocity mode)
+        self.__integral = 0.0
+
+        self.__position = None # Unwrapped angle of the axle
+        self.__last_angle = None
+        self.__last_tick = None
+        self.__velocity = 0.0
+        self.__power = None
+
+        self.__lock = threading.Lock()
+        self.__running = False
+        self.__thread = None
+
+        # Loop statistics
+
+        self.__loops = 0
+        self.__missed_periods = 0
+        self.__last_wake = None
+        self.__jitter_sum = 0.0
+        self.__jitter_max = 0.0
+
+    ###########################################################################
+    # Public API
+
+    def goto_angle(self, angle):
+        """
+        Moves the axle to the given angle (0º-360º) the shortest way, and
+        holds it there.
+        """
+
+        self.__start()
+
+        with self.__lock:
+            error = ((angle - self.__current_angle() + 180.0) % 360.0) - 180.0
+            self.__set_target(self.POSITION, self.__position + error)
+
+    def goto_position(self, position):
+        """
+        Moves the axle to the given unwrapped (multi-turn) position, in
+        degrees, and holds it there.
+        """
+
+        self.__start()
+
+        with self.__lock:
+            self.__set_target(self.POSITION, position)
+
+    def hold(self):
+        """
+        Holds the axle at its current position.
+        """
+
+        self.__start()
+
+        with self.__lock:
+            self.__set_target(self.POSITION, self.__position)
+
+    def set_velocity(self, velocity):
+        """
+        Keeps the axle running at the given angular velocity (degrees per
+        second, positive means counter-clockwise).
+        """
+
+        self.__start()
+
+        with self.__lock:
+            self.__set_target(self.VELOCITY, velocity)
+
+    def get_position(self):
+        return self.__position
+
+    def get_velocity(self):
+        return self.__velocity
+
+    def get_mode(self):
+        return self.__mode
+
+    def stats(self):
+        """
+        Returns a dictionary with the number of loops run, the number of
+        feedback periods the loop missed, and the mean and max jitter (s)
+        of the loop wake-ups relative to the feedback period.
+        """
+
+        loops = max(self.__loops - 1, 1)
+
+        return {
+            "loops": self.__loops,
+            "missed_periods": self.__missed_periods,
+            "mean_jitter": self.__jitter_sum / loops,
+            "max_jitter": self.__jitter_max
+        }
+
+    def stop(self):
+        """
+        Stops the control loop. The servo is left at its last command.
+        """
+
+        self.__running = False
+
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+        self.__thread = None
+        self.__mode = None
+
+    ###########################################################################
+    # Control loop
+
+    def __current_angle(self):
+        return self.parallax.get_angle()
+
+    def __set_target(self, mode, target):
+        if mode != self.__mode:
+            self.__integral = 0.0
+
+        self.__mode = mode
+        self.__target = target
+
+    def __start(self):
+        if self.__running:
+            return
+
+        # The position is initialized before the thread starts, so targets relative to it can be set right away.
+
+        if not self.reader.wait_for_periods(2, 0.5):
+            raise TimeoutError("No feedback signal")
+
+        self.__last_angle = self.__current_angle()
+        self.__position = self.__last_angle
+        self.__last_tick = self.reader.tick()
+        self.__velocity = 0.0
+        self.__power = None
+
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__loop, name="parallax-controller", daemon=True)
+        self.__thread.start()
+
+    def __loop(self):
+        period = 1.0 / 910.0
+        last_periods = self.reader.periods()
+
+        while self.__running:
+            # Sleeps until the next feedback period. A generous timeout bounds the latency if the signal is lost.
+
+            if not self.reader.wait_for_periods(1, 0.1):
+                continue
+
+            now = self.parallax.get_clock() # Monotonic, unlike time.time(), and not moving the simulated clock
+
+            periods = self.reader.periods()
+            self.__missed_periods += max(periods - last_periods - 1, 0)
+            last_periods = periods
+
+            if self.__last_wake is not None:
+                jitter = abs(now - self.__last_wake - period)
+                self.__jitter_sum += jitter
+                self.__jitter_max = max(self.__jitter_max, jitter)
+
+            self.__last_wake = now
+            self.__loops += 1
+
+            with self.__lock:
+                self.__update()
+
+    def __update(self):
+        # Feedback: the angle is unwrapped (assuming less than half a lap between periods, which holds up to
+        # ~160000 º/s), and the velocity is derived from it using the feedback ticks as time base.
+
+        angle = self.__current_angle()
+        tick = self.reader.tick()
+
+        step = ((angle - self.__last_angle + 180.0) % 360.0) - 180.0
+        self.__position += step
+        self.__last_angle = angle
+
+        dt = ((tick - self.__last_tick) & 0xFFFFFFFF) / 1000000.0 if tick is not None and self.__last_tick is not None else 0.0
+        self.__last_tick = tick
+
+        if dt <= 0.0:
+            return
+
+        self.__velocity = self.velocity_smoothing * self.__velocity + (1.0 - self.velocity_smoothing) * step / dt
+
+        if self.__mode == self.POSITION:
+            error = self.__target - self.__position
+            output = self.kp * error - self.kd * self.__velocity
+            ki = self.ki
+        elif self.__mode == self.VELOCITY:
+            error = self.__target - self.__velocity
+            output = self.__target * 100.0 / self.parallax.get_max_speed(self.__target) + self.velocity_kp * error
+            ki = self.velocity_ki
+        else:
+            return
+
+        # Anti-windup: the integral only grows while the output is not saturated in the same direction,
+        # and it can never push the output beyond its limits on its own.
+
+        saturated = abs(output + ki * self.__integral) >= self.max_power and (output + ki * self.__integral) * error > 0
+
+        if not saturated:
+            self.__integral += error * dt
+
+        if ki > 0:
+            limit = self.max_power / ki
+            self.__integral = max(-limit, min(limit, self.__integral))
+
+        output += ki * self.__integral
+        output = max(-self.max_power, min(self.max_power, output))
+
+        # Positive outputs mean counter-clockwise, which is a negative power. The pulse width resolution is
+        # about one power unit, so the command is only sent when it changes by that much.
+
+        power = -round(output)
+
+        if power != self.__power:
+            self.__power = power
+            self.parallax.run(power)
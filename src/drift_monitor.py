@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# drift_monitor.py                                                            #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will keep the calibration of a Parallax Servo up to date          #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import threading
+
+###############################################################################
+# Main class
+
+class DriftMonitor:
+    """
+    Watches a Parallax servo during normal use, comparing the power
+    commanded with the speed measured from the feedback signal:
+     - A low power that does not move the axle means the stop boundary of
+       that direction drifted outwards (the dead band grew). The axle is
+       considered stopped if it travels less than min_displacement degrees
+       in stall_window seconds, looser than the motion test of calibration
+       (see Parallax.is_moving()), so any speed calibration took for motion
+       is never taken for a stall.
+     - Full power running slower than the maximum speed known, or a power
+       short of 100 already running at it, means the limit boundary (the
+       saturation knee) drifted.
+
+    Suspect boundaries are never fixed by a full calibration: once the
+    servo has been stopped for idle_time seconds, a few short probes
+    around the boundary move it step μs at a time. Stop boundaries are
+    probed with the very motion test of calibration. Probing is given up as
+    soon as the servo is used again.
+
+    Every finding and adjustment is published as an event (a dictionary
+    passed to the functions given to add_listener(), from the monitor
+    thread) and counted (see stats()).
+    """
+
+    def __init__(self, parallax,
+                 check_interval = 0.25,
+                 settle_time = 0.3,
+                 idle_time = 1.0,
+                 low_power = 10,
+                 min_displacement = 3.0,
+                 stall_window = 1.0,
+                 speed_tolerance = 0.05,
+                 step = 2,
+                 max_steps = 10):
+
+        self.parallax = parallax
+
+        self.check_interval = check_interval
+        self.settle_time = settle_time # Time (s) a command is left alone before judging it
+        self.idle_time = idle_time
+        self.low_power = low_power # Powers up to this one are expected to move the axle slowly
+        self.min_displacement = min_displacement # º the axle must travel in stall_window seconds not to be stalled
+        self.stall_window = stall_window
+        self.speed_tolerance = speed_tolerance # Relative speed loss considered noticeable
+        self.step = step # μs each boundary is moved per probe
+        self.max_steps = max_steps # Probes per boundary and idle period
+
+        self.__suspects = {} # (boundary kind, rotation direction) -> reason
+        self.__listeners = []
+
+        self.__counters = {"checks": 0, "stalls": 0, "saturation_mismatches": 0, "probes": 0, "adjustments": 0}
+
+        self.__running = False
+        self.__thread = None
+
+    ###########################################################################
+    # Public API
+
+    def start(self):
+        if self.__running:
+            return
+
+        self.__running = True
+
+        self.__thread = threading.Thread(target=self.__loop, name="parallax-drift-monitor", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        self.__running = False
+
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
+
+        self.__thread = None
+
+    def add_listener(self, func):
+        # Calls func(event) from the monitor thread on every finding and adjustment.
+
+        self.__listeners = self.__listeners + [func]
+
+    def remove_listener(self, func):
+        self.__listeners = [f for f in self.__listeners if f != func] # Bound methods are new objects on every access
+
+    def stats(self):
+        # Returns the number of checks done, stalls and saturation mismatches found, probes run and boundary
+        # adjustments made.
+
+        return dict(self.__counters)
+
+    def suspects(self):
+        # Returns the boundaries waiting to be probed: (kind, rotation direction) -> reason.
+
+        return dict(self.__suspects)
+
+    ###########################################################################
+    # Monitoring
+
+    def __loop(self):
+        parallax = self.parallax
+
+        last_command = None
+        command_time = parallax.get_time()
+
+        last_position = None
+        last_tick = None
+
+        window = None # (time, position) the stall window started at
+
+        while self.__running:
+            parallax.sleep(self.check_interval) # On the backend clock, so simulated servos can be monitored too
+
+            if not self.__running:
+                return
+
+            now = parallax.get_time()
+
+            power = parallax.get_power()
+            rotation_dir = parallax.rotation_direction
+            command = (power, rotation_dir)
+
+            position = parallax.get_position()
+            tick = parallax.get_feedback_tick()
+
+            if command != last_command:
+                last_command = command
+                command_time = now
+                last_position, last_tick = position, tick
+                window = None
+                continue
+
+            if position is None or tick is None or last_tick is None:
+                last_position, last_tick = position, tick
+                continue
+
+            if now - command_time >= self.settle_time and tick != last_tick:
+                self.__counters["checks"] += 1
+                self.__count("drift.checks")
+
+                speed = (position - last_position) / (((tick - last_tick) & 0xFFFFFFFF) / 1000000.0)
+
+                if power == 0:
+                    if self.__suspects and now - command_time >= self.idle_time:
+                        self.__probe_suspects()
+
+                        # The probes moved the axle: the next measure starts afresh.
+
+                        last_command = None
+                        continue
+                else:
+                    # Displacement over the last stall window, once it is complete.
+
+                    moved = None
+
+                    if window is None:
+                        window = (now, position)
+                    elif now - window[0] >= self.stall_window:
+                        moved = abs(position - window[1])
+                        window = (now, position)
+
+                    self.__check(power, rotation_dir, speed, moved)
+
+            last_position, last_tick = position, tick
+
+    def __check(self, power, rotation_dir, speed, moved):
+        parallax = self.parallax
+
+        # Positive speeds are counter-clockwise, so both directions are compared as positive speeds.
+
+        if rotation_dir is parallax.CLOCKWISE:
+            speed = -speed
+            max_speed = parallax.get_max_speed(-1)
+        else:
+            max_speed = parallax.get_max_speed(1)
+
+        if power <= self.low_power and moved is not None and moved < self.min_displacement:
+            self.__counters["stalls"] += 1
+            self.__suspect("stop", rotation_dir, "stall", power=power, speed=speed, moved=moved)
+
+        elif power >= 100 and speed < max_speed * (1.0 - self.speed_tolerance):
+            self.__counters["saturation_mismatches"] += 1
+            self.__suspect("limit", rotation_dir, "slow at full power", power=power, speed=speed, max_speed=max_speed)
+
+        elif speed >= max_speed * (1.0 + self.speed_tolerance) or (power <= 90 and speed >= max_speed * (1.0 - self.speed_tolerance)):
+            self.__counters["saturation_mismatches"] += 1
+            self.__suspect("limit", rotation_dir, "saturated before full power", power=power, speed=speed, max_speed=max_speed)
+
+    def __suspect(self, kind, rotation_dir, reason, **details):
+        key = (kind, rotation_dir)
+        new = key not in self.__suspects
+
+        self.__suspects[key] = reason
+
+        if new:
+            self.__publish("suspect", kind=kind, direction=rotation_dir.name, reason=reason, **details)
+
+        self.__count("drift." + ("stalls" if kind == "stop" else "saturation_mismatches"))
+
+    ###########################################################################
+    # Probing
+
+    def __idle(self):
+        # The servo is still stopped and nobody else is using it.
+
+        return self.__running and self.parallax.get_power() == 0
+
+    def __probe(self, pulse_width):
+        self.__counters["probes"] += 1
+        self.__count("drift.probes")
+
+        return abs(self.parallax.probe_speed(pulse_width))
+
+    def __probe_motion(self, pulse_width):
+        self.__counters["probes"] += 1
+        self.__count("drift.probes")
+
+        moving = self.parallax.is_moving(pulse_width)
+
+        # The motion test leaves the probe pulse width applied: the power commanded (zero, or whatever the user
+        # asked for meanwhile) is sent again, as probe_speed() does.
+
+        self.parallax.run()
+
+        return moving
+
+    def __probe_suspects(self):
+        for key in list(self.__suspects):
+            if not self.__idle():
+                return
+
+            kind, rotation_dir = key
+
+            if kind == "stop":
+                self.__probe_stop_boundary(rotation_dir)
+            else:
+                self.__probe_limit_boundary(rotation_dir)
+
+            if self.__idle(): # Otherwise the probes were interrupted and the boundary is still suspect
+                del self.__suspects[key]
+
+    def __walk(self, name, outwards, works):
+        # Moves the given boundary step μs at a time: outwards while its pulse width does not work (does not
+        # move the axle, or does not reach the maximum speed), or inwards while the next one still works.
+        # At most max_steps probes are run, and the boundary is only updated if the servo stayed idle.
+
+        pulse_width = self.parallax.get_calibration()[name]
+
+        if works(pulse_width):
+            step = -outwards
+        else:
+            step = outwards
+            pulse_width += step
+
+            while not works(pulse_width):
+                pulse_width += step
+
+                if not self.__idle() or abs(pulse_width - self.parallax.get_calibration()[name]) > self.max_steps * self.step:
+                    return
+
+            if self.__idle():
+                self.__adjust(name, pulse_width)
+            return
+
+        for _ in range(self.max_steps):
+            if not self.__idle() or not works(pulse_width + step):
+                break
+
+            pulse_width += step
+
+        if self.__idle():
+            self.__adjust(name, pulse_width)
+
+    def __probe_stop_boundary(self, rotation_dir):
+        # The stop boundary is the pulse width closest to the dead band still moving the axle, as told by the
+        # motion test of calibration itself, so both always agree on where the dead band is.
+
+        cw = rotation_dir is self.parallax.CLOCKWISE
+
+        self.__walk("min_cw_pw" if cw else "min_ccw_pw", -self.step if cw else self.step, self.__probe_motion)
+
+    def __probe_limit_boundary(self, rotation_dir):
+        # The limit boundary (the saturation knee) is the pulse width closest to the dead band still running at
+        # maximum speed, which is measured first a bit beyond the limit.
+
+        cw = rotation_dir is self.parallax.CLOCKWISE
+        name = "max_cw_pw" if cw else "max_ccw_pw"
+
+        max_speed = self.__probe(round(self.parallax.get_calibration()[name] * (0.995 if cw else 1.005)))
+
+        if not self.__idle():
+            return
+
+        self.__adjust("max_cw_speed" if cw else "max_ccw_speed", max_speed)
+
+        threshold = max_speed * (1.0 - self.speed_tolerance)
+
+        self.__walk(name, -self.step if cw else self.step,
+                    lambda pulse_width: self.__probe(pulse_width) >= threshold)
+
+    def __adjust(self, name, value):
+        values = self.parallax.get_calibration()
+        old = values[name]
+
+        if old == value:
+            return
+
+        values[name] = value
+
+        # The speed curve of that direction was measured between the old boundaries, so it is dropped.
+
+        if name.endswith("_pw"):
+            values["cw_speed_curve" if "_cw_" in name else "ccw_speed_curve"] = None
+
+        self.parallax.set_calibration(values)
+
+        self.__counters["adjustments"] += 1
+        self.__count("drift.adjustments")
+        self.__publish("adjust", value_name=name, old=old, new=value)
+
+    ###########################################################################
+    # Events
+
+    def __publish(self, event_type, **details):
+        event = dict(details, type=event_type, time=self.parallax.get_time())
+
+        for listener in self.__listeners:
+            listener(event)
+
+    def __count(self, name):
+        # Counters are also kept by the instrumentation of the servo, if enabled.
+
+        instrumentation = self.parallax.get_instrumentation()
+
+        if instrumentation is not None:
+            instrumentation.count(name)
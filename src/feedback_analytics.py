@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# feedback_analytics.py                                                       #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will analyze batches of feedback edges of a Parallax Servo        #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import numpy as np
+
+###############################################################################
+# Global variables
+
+FEEDBACK_FREQUENCY = 910.0 # Hz, according to the datasheet
+NOMINAL_PERIOD = 1000000.0 / FEEDBACK_FREQUENCY # μs
+
+TICK_WRAP = 1 << 32 # pigpio ticks are 32 bit microsecond counters
+
+###############################################################################
+# Global methods
+
+def unwrap_ticks(ticks):
+    """
+    Returns the ticks as a monotonic int64 array of microseconds relative
+    to the first one, undoing the 32 bit wrap of pigpio ticks.
+    """
+
+    ticks = np.asarray(ticks, dtype=np.int64)
+
+    if ticks.size == 0:
+        return ticks
+
+    deltas = np.diff(ticks) % TICK_WRAP
+
+    return np.concatenate(([0], np.cumsum(deltas)))
+
+def periods(ticks, levels):
+    """
+    Splits a batch of edges into complete PWM periods.
+
+    Returns (start, high, period), being start the time (μs, relative to
+    the first edge of the batch) of the rising edge opening each period,
+    high the time the signal was high and period the time until the next
+    rising edge. Periods with missing edges are left out.
+    """
+
+    times = unwrap_ticks(ticks)
+    levels = np.asarray(levels)
+
+    if times.size < 3:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, empty
+
+    # A complete period is a rising edge followed by a falling edge and the next rising edge.
+
+    complete = (levels[:-2] == 1) & (levels[1:-1] == 0) & (levels[2:] == 1)
+    index = np.flatnonzero(complete)
+
+    start = times[index]
+    high = times[index + 1] - start
+    period = times[index + 2] - start
+
+    return start, high, period
+
+def duty_cycles(high, period):
+    """
+    Returns the duty cycle (%) of each period.
+    """
+
+    return 100.0 * np.asarray(high, dtype=np.float64) / np.asarray(period, dtype=np.float64)
+
+def frequency(period):
+    """
+    Returns the frequency (Hz) of a signal given the length (μs) of its
+    periods, from their median so a few glitches do not change it, or 0.0
+    if there are no periods.
+    """
+
+    period = np.asarray(period, dtype=np.float64)
+
+    if period.size == 0:
+        return 0.0
+
+    return 1000000.0 / float(np.median(period))
+
+def angles(duty_cycles, min_dc, max_dc):
+    """
+    Maps feedback duty cycles to angular positions (0º-360º) given the
+    duty cycles read at both ends of a lap.
+    """
+
+    angle = (np.asarray(duty_cycles, dtype=np.float64) - min_dc) * 360.0 / (max_dc - min_dc)
+
+    return np.clip(angle, 0.0, 360.0)
+
+def unwrap_angles(angles, start = 0.0):
+    """
+    Returns the multi-turn position (degrees) of the axle, assuming it never
+    moves more than half a lap between consecutive samples. The first sample
+    is placed at the given start angle.
+    """
+
+    angles = np.asarray(angles, dtype=np.float64)
+
+    if angles.size == 0:
+        return angles
+
+    steps = (np.diff(angles) + 180.0) % 360.0 - 180.0
+
+    return np.concatenate(([start], start + np.cumsum(steps)))
+
+def angular_velocity(times, positions):
+    """
+    Returns the angular velocity (degrees per second) at every sample,
+    being times in μs and positions unwrapped angles in degrees.
+    """
+
+    times = np.asarray(times, dtype=np.float64)
+
+    if times.size < 2:
+        return np.zeros(times.size)
+
+    return np.gradient(np.asarray(positions, dtype=np.float64), times / 1000000.0)
+
+def mean_velocity(times, positions):
+    """
+    Returns the least squares slope (degrees per second) of the positions
+    over the times (μs), or 0.0 if there are not enough samples.
+    """
+
+    times = np.asarray(times, dtype=np.float64) / 1000000.0
+    positions = np.asarray(positions, dtype=np.float64)
+
+    if times.size < 2 or np.ptp(times) == 0:
+        return 0.0
+
+    times = times - times.mean()
+
+    return float(np.dot(times, positions - positions.mean()) / np.dot(times, times))
+
+def outlier_mask(high, period, min_dc = None, max_dc = None, period_tolerance = 0.1, dc_tolerance = 1.0):
+    """
+    Returns a boolean mask, True for periods that should not be trusted:
+    those whose length is further than period_tolerance (relative) from the
+    nominal feedback period and, if the duty cycle bounds are given, those
+    whose duty cycle is further than dc_tolerance (%) beyond them.
+    """
+
+    period = np.asarray(period, dtype=np.float64)
+
+    mask = np.abs(period - NOMINAL_PERIOD) > period_tolerance * NOMINAL_PERIOD
+
+    if min_dc is not None and max_dc is not None:
+        dc = duty_cycles(high, period)
+        mask |= (dc < min_dc - dc_tolerance) | (dc > max_dc + dc_tolerance)
+
+    return mask
+
+def analyze(ticks, levels, min_dc, max_dc, start_angle = None):
+    """
+    Runs the whole analysis over a batch of edges. Returns a dictionary with
+    the per period arrays "time" (μs), "duty_cycle", "angle", "position"
+    (unwrapped angle) and "velocity", computed only over the valid periods,
+    plus the "outliers" mask over every complete period found.
+    """
+
+    start, high, period = periods(ticks, levels)
+
+    outliers = outlier_mask(high, period, min_dc, max_dc)
+    valid = ~outliers
+
+    dc = duty_cycles(high[valid], period[valid])
+    angle = angles(dc, min_dc, max_dc)
+
+    if start_angle is None:
+        start_angle = angle[0] if angle.size else 0.0
+
+    position = unwrap_angles(angle, start_angle)
+
+    return {
+        "time": start[valid],
+        "duty_cycle": dc,
+        "angle": angle,
+        "position": position,
+        "velocity": angular_velocity(start[valid], position),
+        "outliers": outliers
+    }
+
+def fit_fopdt(times, positions, groups = None, dead_times = None, time_constants = None, resolution = 0.001):
+    """
+    Fits a first order plus dead time model to a batch of step responses
+    of an axle starting at rest: dead_time seconds after the step, its
+    velocity goes gain·(1 - exp(-t/time_constant)). times holds an array of
+    sample times (s, relative to the step) per response and positions the
+    matching unwrapped angles (degrees). Responses sharing the same value
+    on groups (e.g. repetitions of the same step) are averaged and fitted
+    as one, so their noise cancels out.
+
+    The position of the model is linear on the gain, so every response is
+    resampled on a common grid and fitted at once against every pair of
+    dead time and time constant candidates, the gain being solved by least
+    squares. Returns the arrays (gain, dead_time, time_constant, rms), the
+    gain in degrees per second and the rms error in degrees, one per
+    response (or per group, sorted by its value).
+    """
+
+    if dead_times is None:
+        dead_times = np.arange(0.0, 0.0405, 0.0005)
+
+    if time_constants is None:
+        time_constants = np.geomspace(0.002, 0.5, 120)
+
+    dead_times = np.asarray(dead_times, dtype=np.float64)
+    time_constants = np.asarray(time_constants, dtype=np.float64)
+
+    duration = min(float(t[-1]) for t in times)
+    grid = np.arange(0.0, duration, resolution)
+
+    # Responses relative to the position at the step: (responses, samples)
+
+    responses = np.stack([np.interp(grid, t, p) - np.interp(0.0, t, p) for t, p in zip(times, positions)])
+
+    if groups is not None:
+        keys, index = np.unique(groups, return_inverse=True)
+
+        sums = np.zeros((keys.size, grid.size))
+        np.add.at(sums, index, responses)
+
+        responses = sums / np.bincount(index)[:, None]
+
+    # Unit gain model for every candidate: (dead times, time constants, samples)
+
+    lag = np.maximum(grid[None, None, :] - dead_times[:, None, None], 0.0)
+    tau = time_constants[None, :, None]
+
+    models = (lag - tau * (1.0 - np.exp(-lag / tau))).reshape(-1, grid.size)
+
+    energy = np.einsum("ij,ij->i", models, models)
+    valid = energy > 0
+
+    correlation = responses @ models.T
+    sse = np.einsum("ij,ij->i", responses, responses)[:, None] - np.where(valid, correlation ** 2 / np.where(valid, energy, 1.0), -np.inf)
+
+    best = np.argmin(sse, axis=1)
+    rows = np.arange(best.size)
+
+    gain = correlation[rows, best] / energy[best]
+    dead_time = dead_times[best // time_constants.size]
+    time_constant = time_constants[best % time_constants.size]
+    rms = np.sqrt(np.maximum(sse[rows, best], 0.0) / grid.size)
+
+    return gain, dead_time, time_constant, rms
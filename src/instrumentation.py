@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# instrumentation.py                                                          #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold counters and timers to profile a Parallax Servo         #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import sys, threading, time
+
+###############################################################################
+# Classes
+
+class Histogram:
+    """
+    Counts values (e.g. μs) on power of two buckets: [0, 1), [1, 2),
+    [2, 4), [4, 8)... The last bucket holds every value beyond.
+    """
+
+    def __init__(self, buckets = 24):
+        self.counts = [0] * buckets
+
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        index = int(value).bit_length() if value >= 1 else 0
+
+        if index >= len(self.counts):
+            index = len(self.counts) - 1
+
+        self.counts[index] += 1
+
+        self.count += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, fraction):
+        # Returns the upper bound of the bucket holding the given fraction (0-1) of the values.
+
+        target = fraction * self.count
+        seen = 0
+
+        for index, count in enumerate(self.counts):
+            seen += count
+
+            if count and seen >= target:
+                return float(1 << index)
+
+        return 0.0
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": {"<" + str(1 << index): count for index, count in enumerate(self.counts) if count}
+        }
+
+class _Phase:
+
+    def __init__(self, owner, name):
+        self.__owner = owner
+        self.__name = name
+
+    def __enter__(self):
+        self.__start = self.__owner.clock()
+
+    def __exit__(self, *exc):
+        self.__owner.add_time(self.__name, self.__owner.clock() - self.__start)
+
+class Instrumentation:
+    """
+    Counters, histograms and phase timers shared by the hot paths of
+    read_PWM.reader, command_writer.CommandWriter and Parallax.
+
+    Every piece of code only touches it if one was given, so nothing is
+    measured (and almost nothing is spent) unless instrumentation is
+    enabled. clock() must be cheap and free of side effects, since it is
+    called from the pigpio callback thread (see Backend.clock()).
+    """
+
+    def __init__(self, clock = time.perf_counter):
+        self.clock = clock
+
+        self.counters = {}
+        self.histograms = {}
+        self.phases = {} # name -> [calls, total time (s), last time (s)]
+
+        self.__dump_thread = None
+        self.__dumping = threading.Event()
+
+    def count(self, name, amount = 1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        histogram = self.histograms.get(name)
+
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+
+        histogram.add(value)
+
+    def phase(self, name):
+        # Returns a context manager timing its body as the given phase.
+
+        return _Phase(self, name)
+
+    def add_time(self, name, seconds):
+        phase = self.phases.get(name)
+
+        if phase is None:
+            phase = self.phases[name] = [0, 0.0, 0.0]
+
+        phase[0] += 1
+        phase[1] += seconds
+        phase[2] = seconds
+
+    def snapshot(self):
+        """
+        Returns every counter, histogram and phase timer as a dictionary.
+        """
+
+        return {
+            "counters": dict(self.counters),
+            "histograms": {name: histogram.snapshot() for name, histogram in list(self.histograms.items())},
+            "phases": {name: {"calls": calls, "total": total, "last": last} for name, (calls, total, last) in list(self.phases.items())}
+        }
+
+    def dump(self, file = sys.stdout):
+        """
+        Writes the snapshot as human-readable text.
+        """
+
+        snapshot = self.snapshot()
+
+        for name, value in sorted(snapshot["counters"].items()):
+            print("{:<32}{}".format(name, value), file=file)
+
+        for name, histogram in sorted(snapshot["histograms"].items()):
+            print("{:<32}n={} mean={:.1f} p50<{:.0f} p99<{:.0f} max={:.1f}".format(name, histogram["count"], histogram["mean"],
+                                                                                   histogram["p50"], histogram["p99"], histogram["max"]), file=file)
+
+        for name, phase in sorted(snapshot["phases"].items()):
+            print("{:<32}{:.3f} s ({} calls, last {:.3f} s)".format(name, phase["total"], phase["calls"], phase["last"]), file=file)
+
+        file.flush()
+
+    def start_dump(self, interval = 5.0, file = sys.stdout):
+        """
+        Dumps the snapshot every interval seconds from a background thread,
+        until stop_dump() is called.
+        """
+
+        self.stop_dump()
+        self.__dumping.clear()
+
+        def loop():
+            while not self.__dumping.wait(interval):
+                self.dump(file)
+
+        self.__dump_thread = threading.Thread(target=loop, name="parallax-instrumentation", daemon=True)
+        self.__dump_thread.start()
+
+    def stop_dump(self):
+        if self.__dump_thread is not None:
+            self.__dumping.set()
+            self.__dump_thread.join()
+            self.__dump_thread = None
@@ -11,9 +11,10 @@
 ###############################################################################
 # Neccesary modules
 
-import signal
-import sys, tty, termios
-import parallax
+import argparse, os, selectors, sys, tempfile, time
+
+# parallax (and pigpio, NumPy...) are imported by main(), so importing this module is cheap and free of side
+# effects, and the import time can be told apart from the rest of the startup.
 
 ###############################################################################
 # Pinout management
@@ -27,22 +28,24 @@ feedback_pin = 15
 MAX_POWER = 100
 MIN_POWER = MAX_POWER * -1
 
-fd = termios.tcgetattr(sys.stdin)
-tty.setcbreak(sys.stdin)
+FRAME_RATE = 20 # Console refresh rate (Hz). Keys pressed within a frame make a single power update.
+
+# Calibration modes:
+#  - full: the whole procedure, scanning the pulse widths one by one.
+#  - quick: the whole procedure, with the probe based searches (bisection and adaptive).
+#  - cached: the stored profile if recent enough and passing the sanity probe, otherwise a full calibration.
+#  - skip: the stored profile as is (or the default values if there is none), without touching the servo.
 
-myParallax = parallax.Parallax(control_pin, feedback_pin)
+CALIBRATION_MODES = ("full", "quick", "cached", "skip")
 
 ###############################################################################
 # Global methods
 
-def callbackExit(signal, frame): # signal and frame when the interrupt was executed.
-    myParallax.destroy()
-    termios.tcsetattr(sys.stdin, termios.TCSADRAIN, fd)
-    sys.exit(0)
+def draw_gauge(value, angle = 0.0, rpm = 0.0):
+    # Returns the gauge line, built in a single string, along with the feedback angle and RPM.
 
-def draw_gauge(value):
     start_str = "min |"
-    end_str = "| max (Power: " + str(value) + "%)"
+    end_str = "| max (Power: {:4d}%) {:5.1f}º {:6.1f} RPM".format(value, angle % 360.0, rpm)
 
     total_char_count = 80
 
@@ -50,41 +53,236 @@ def draw_gauge(value):
 
     represented_value = round(max_width * ((value - MIN_POWER)/(MAX_POWER - MIN_POWER)))
 
-    print(start_str, end="")
+    gauge = [" "] * (max_width + 1)
+    gauge[represented_value] = "¤"
+
+    return start_str + "".join(gauge) + end_str
+
+class Console:
+    # Keeps the line drawn on the terminal, so only the cells changed since the last frame are
+    # written, in a single write.
+
+    def __init__(self, stream = sys.stdout):
+        self.stream = stream
+        self.line = ""
 
-    for i in range (0, max_width + 1):
-        if i == represented_value:
-            print("¤", end="")
+    def draw(self, line):
+        old = self.line
+
+        if line == old:
+            return
+
+        if len(line) != len(old): # Nothing to compare with, the whole line is drawn
+            self.stream.write("\r" + line)
         else:
-            print(" ", end="")
+            first = 0
+            while line[first] == old[first]:
+                first += 1
 
-    print(end_str, end="\r")
+            last = len(line)
+            while line[last - 1] == old[last - 1]:
+                last -= 1
 
+            # Back to the start of the line, and right to the first cell changed.
 
-###############################################################################
-# Main program
+            self.stream.write("\r" + ("\x1b[" + str(first) + "C" if first else "") + line[first:last])
 
-if __name__ == '__main__':
+        self.stream.flush()
+        self.line = line
+
+def calibrate(myParallax, mode, path):
+    # Calibrates the servo as the given mode says (see CALIBRATION_MODES), using the profiles stored on the given
+    # path. Returns True if a stored profile was used.
+
+    import calibration_profile
+
+    key = calibration_profile.profile_key(myParallax.servo_id, myParallax.control_pin, myParallax.feedback_pin)
+
+    if mode == "cached":
+        return myParallax.load_or_calibrate(path)
+
+    if mode == "skip":
+        values = calibration_profile.load_profile(key, path, max_age=None)
+
+        if values is not None:
+            myParallax.set_calibration(values)
+
+        return values is not None
+
+    if mode == "quick":
+        myParallax.calibrate(stop_search=myParallax.BISECTION_SEARCH, limit_search=myParallax.ADAPTIVE_SEARCH, back_to_back=True)
+    else:
+        myParallax.calibrate()
 
-    myParallax.calibrate()
+    calibration_profile.save_profile(key, myParallax.get_calibration(), path)
+
+    return False
+
+def control(myParallax):
+    # Runs the servo from the keyboard until ctrl+c is pressed.
 
     print("\nServo control:\n\t- 'd' for clockwise\n\t- 'a' for counter-clockwise\n\t- 'ctrl+c' to exit\n")
 
+    # Keys are read without blocking, so the console keeps being refreshed (and the feedback shown)
+    # while no key is pressed, and a burst of key-repeat makes a single power update per frame.
+
+    # Without a selectable stdin (e.g. a regular file, which epoll refuses) or once it is closed, no keys
+    # are read: the selector is left empty, so it just waits for the next frame.
+
+    selector = selectors.DefaultSelector()
+
+    try:
+        selector.register(sys.stdin, selectors.EVENT_READ)
+    except (OSError, ValueError):
+        pass
+
+    console = Console()
+    frame_period = 1 / FRAME_RATE
+
     power = 0
+    applied_power = None
+
+    next_frame = time.monotonic()
 
     while True:
 
-        draw_gauge(power)
+        for _ in selector.select(max(next_frame - time.monotonic(), 0)):
+            keys = os.read(sys.stdin.fileno(), 1024)
+
+            if not keys: # End of file, it would be readable forever
+                selector.unregister(sys.stdin)
+
+            for key_pressed in keys.decode(errors="ignore"):
+                if key_pressed == 'a':
+                    if power > MIN_POWER:
+                        power -= 1
+                elif key_pressed == 'd':
+                    if power < MAX_POWER:
+                        power += 1
+
+        now = time.monotonic()
+
+        if now < next_frame:
+            continue
+
+        if power != applied_power:
+            myParallax.run(power)
+            applied_power = power
+
+        console.draw(draw_gauge(power, myParallax.get_angle(), myParallax.get_rpm()))
+
+        next_frame = max(next_frame + frame_period, now)
+
+def write_profile(profiler, myParallax, path):
+    # Writes the profile of the calibration and the control loop: raw cProfile data if the path ends with
+    # ".prof" (for pstats, snakeviz...), otherwise a text report along with the servo instrumentation.
+
+    if path.endswith(".prof"):
+        profiler.dump_stats(path)
+        return
 
-        key_pressed = sys.stdin.read(1)[0]
+    import pstats
 
-        if key_pressed is 'a':
-            if power > MIN_POWER:
-                power -= 1
-        elif key_pressed is 'd':
-            if power < MAX_POWER:
-                power += 1
+    with open(path, "w") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.sort_stats("cumulative").print_stats(40)
 
-        myParallax.run(power)
+        if myParallax is not None and myParallax.get_instrumentation() is not None:
+            print("Instrumentation:", file=f)
+            myParallax.get_instrumentation().dump(f)
 
-        signal.signal(signal.SIGINT, callbackExit) # callback for CTRL+C
+def main(argv = None):
+    parser = argparse.ArgumentParser(description="Drives a Parallax Servo from the keyboard")
+    parser.add_argument("--control-pin", type=int, default=control_pin, help="control GPIO (default: %(default)s)")
+    parser.add_argument("--feedback-pin", type=int, default=feedback_pin, help="feedback GPIO (default: %(default)s)")
+    parser.add_argument("--calibration", choices=CALIBRATION_MODES, default="cached", help="calibration mode (default: %(default)s)")
+    parser.add_argument("--profile", metavar="PATH", help="profile the calibration and the control loop, writing the report to PATH (raw cProfile data if it ends with .prof)")
+    parser.add_argument("--simulate", action="store_true", help="drive a simulated servo instead")
+    args = parser.parse_args(argv)
+
+    profiler = None
+
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+    timings = []
+    myParallax = None
+    terminal = None
+
+    try:
+        time_milestone = time.perf_counter()
+
+        import calibration_profile, parallax
+
+        if args.simulate:
+            import simulation
+
+        timings.append(("imports", time.perf_counter() - time_milestone))
+        time_milestone = time.perf_counter()
+
+        backend = None
+        profile_path = calibration_profile.DEFAULT_PROFILE_PATH
+
+        if args.simulate:
+            # Simulated profiles are kept apart, so they never end up on a real servo.
+
+            profile_path = os.path.join(tempfile.gettempdir(), "parallax-simulated-profiles.json")
+
+            backend = simulation.SimulatedPi()
+            backend.attach(simulation.ServoPlant(), args.control_pin, args.feedback_pin)
+
+        myParallax = parallax.Parallax(args.control_pin, args.feedback_pin, backend=backend)
+
+        timings.append(("daemon connect", time.perf_counter() - time_milestone))
+        time_milestone = time.perf_counter()
+
+        if profiler is not None:
+            myParallax.enable_instrumentation()
+            profiler.enable()
+
+        calibrate(myParallax, args.calibration, profile_path)
+
+        timings.append(("calibration (" + args.calibration + ")", time.perf_counter() - time_milestone))
+
+        if backend is not None:
+            backend.start_realtime()
+
+        print("Startup time:", ", ".join("{} {:.0f} ms".format(name, seconds * 1000.0) for name, seconds in timings),
+              "(total {:.0f} ms)".format(sum(seconds for _, seconds in timings) * 1000.0))
+
+        if sys.stdin.isatty():
+            import termios, tty
+
+            terminal = termios.tcgetattr(sys.stdin)
+            tty.setcbreak(sys.stdin)
+
+        control(myParallax)
+
+    except KeyboardInterrupt: # ctrl+c
+        pass
+
+    finally:
+        if profiler is not None:
+            profiler.disable()
+
+        if myParallax is not None:
+            myParallax.destroy()
+
+        if terminal is not None:
+            import termios
+
+            termios.tcsetattr(sys.stdin, termios.TCSADRAIN, terminal)
+
+        print()
+
+        if profiler is not None:
+            write_profile(profiler, myParallax, args.profile)
+            print("Profile written to", args.profile)
+
+###############################################################################
+# Main program
+
+if __name__ == '__main__':
+    main()
@@ -12,9 +12,13 @@
 # Neccesary modules
 
 from enum import Enum
-import time, pigpio, read_PWM
+import read_PWM
 import math
-from numpy import interp
+import calibration_profile, controller, drift_monitor, telemetry
+from contextlib import nullcontext
+from instrumentation import Instrumentation
+from command_writer import CommandWriter
+from backend import PigpioBackend
 
 ###############################################################################
 # Main class
@@ -28,6 +32,15 @@ class Parallax:
     CLOCKWISE = __dir_of_rot.CLOCKWISE
     COUNTER_CLOCKWISE = __dir_of_rot.COUNTER_CLOCKWISE
 
+    class __search_mode(Enum): # Strategies available to find the calibration boundaries
+        LINEAR = 0
+        BISECTION = 1
+        ADAPTIVE = 2
+
+    LINEAR_SEARCH = __search_mode.LINEAR
+    BISECTION_SEARCH = __search_mode.BISECTION
+    ADAPTIVE_SEARCH = __search_mode.ADAPTIVE
+
     # VALUES BELOW ARE EXTRACTED FROM SERVO'S DATASHEET #
 
     # CAUTION: They will be overwritten by the calibration procedure
@@ -40,19 +53,38 @@ class Parallax:
     __PWM_FREQUENCY = 50
     __PWM_PERIOD = 1/__PWM_FREQUENCY
 
+    __FEEDBACK_FREQUENCY = 910
+    __FEEDBACK_PERIOD = 1/__FEEDBACK_FREQUENCY
+
+    # Number of feedback edges kept by the reader (two per period, ~18 s of feedback signal),
+    # so they can be analyzed in batches.
+
+    __FEEDBACK_BUFFER_SIZE = 32768
+
     __max_cw_pw = 1280.0
     __max_ccw_pw = 1720.0
 
     __min_cw_pw = 1480.0
     __min_ccw_pw = 1520.0
 
+    __max_cw_speed = 720.0 # Degrees per second (120 RPM)
+    __max_ccw_speed = 720.0
+
     # VALUES ABOVE ARE EXTRACTED FROM SERVO'S DATASHEET #
 
-    def __init__(self, c_pin, f_pin):
+    def __init__(self, c_pin, f_pin, backend = None, servo_id = "default", frame_aligned = False):
 
         self.control_pin = c_pin
         self.feedback_pin = f_pin
 
+        # Identifies this very servo among others, so its calibration profile can be stored and found later.
+
+        self.servo_id = servo_id
+
+        # Progress messages of the calibration procedure are printed only if this is set.
+
+        self.verbose = True
+
         # Default turn direction will be clockwise
         # CAUTION: Speed calculations (A.K.A. pulse width) will be influenced by this value
         # since upper and lower limits might vary from one direction to another.
@@ -64,29 +96,117 @@ class Parallax:
 
         self.__power = 0
 
-        self.__pi = pigpio.pi()
-        self.__pi.set_servo_pulsewidth(self.control_pin, 0) # Ensure that the control pin is low
+        # Number of probes and time spent by the last stop boundaries search, per rotation direction.
+        # Useful to compare search strategies.
+
+        self.stop_search_stats = {}
+        self.limit_search_stats = {}
+
+        # The backend holds every GPIO operation and the clock used by this class. By default a real
+        # Raspberry Pi is driven through the pigpio daemon, but any other backend (like the simulated
+        # one on simulation.py) can be injected.
+
+        # A backend given from outside (e.g. shared by a ParallaxGroup) is not stopped when this object is destroyed.
+
+        self.__owns_backend = backend is None
+
+        if backend is None:
+            backend = PigpioBackend()
+
+        self.__pi = backend
+        self.__destroyed = False
+
+        # Every pulse width goes through this writer, which skips unchanged values and collapses bursts
+        # faster than the PWM period (the servo could never notice them anyway). If "frame_aligned" is set,
+        # changes are applied on PWM period boundaries.
+
+        self.__writer = CommandWriter(self.__pi, self.control_pin, min_interval=self.__PWM_PERIOD, frame_aligned=frame_aligned)
+        self.__writer.write(0, immediate=True) # Ensure that the control pin is low
+
+        # Measured speed curve per rotation direction: (pulse width, speed) pairs from the stop boundary
+        # to the limit one, with the speed never decreasing (see characterize()). When present, power is
+        # mapped to a fraction of the maximum speed instead of linearly to pulse width.
+
+        self.__speed_curves = {}
+
+        # Step response models per rotation direction: one dictionary (power, pulse width, gain, dead time and
+        # time constant) per step size identified (see identify()).
+
+        self.__step_responses = {}
+
+        # Pulse width of every integer power (0-100) per rotation direction, so run() does not compute it
+        # every time. It must be rebuilt whenever the calibration values change.
 
-        # This object will track the feedback pin
+        self.__pulse_width_table = {}
+        self.__build_pulse_width_table()
 
-        self.__feedback_reader = read_PWM.reader(self.__pi, self.feedback_pin)
+        # This object will track the feedback pin. The duty cycle is filtered in angle space (so crossing
+        # the 0º/360º wrap does not produce nonsense values) and periods not matching the feedback frequency
+        # are dropped as glitches.
+
+        self.__feedback_reader = read_PWM.reader(self.__pi, self.feedback_pin, buffer_size=self.__FEEDBACK_BUFFER_SIZE,
+                                                 filter_mode=read_PWM.MEDIAN, period_gating=True,
+                                                 nominal_frequency=self.__FEEDBACK_FREQUENCY,
+                                                 dc_range=(self.__min_fb_dc, self.__max_fb_dc), turn_counting=True)
+
+        # Closed-loop controller, created on the first goto_angle(), hold() or set_velocity() call.
+
+        self.__controller = None
+
+        # Telemetry recorder, see start_recording().
+
+        self.__recorder = None
+
+        # Counters and timers, see enable_instrumentation().
+
+        self.__instrumentation = None
+
+        # Background drift monitor, see start_drift_monitor().
+
+        self.__drift_monitor = None
 
     def __del__(self):
         # Only "destroy" the object if it exists, since "destroy()" might be called before the
         # object destructor.
 
-        if self.__pi.connected:
+        if not self.__destroyed and self.__pi.connected:
             self.destroy()
 
     def destroy(self):
         # Stops the servo and calls the default destructors of classes involved.
 
+        if self.__controller is not None:
+            self.__controller.stop()
+
+        self.stop_drift_monitor()
+        self.stop_recording()
+
+        self.__writer.cancel()
         self.__pi.set_servo_pulsewidth(self.control_pin, 0)
+        self.__writer.record(0)
         self.__feedback_reader.cancel()
-        self.__pi.stop()
+        self.__destroyed = True
+
+        if self.__owns_backend:
+            self.__pi.stop()
+
+    def __print(self, *args, **kwargs):
+        if self.verbose:
+            print(*args, **kwargs)
 
     def __calculate_pulse_width(self, power):
 
+        # Integer powers (every power set by myServo.py, the controller...) are just looked up.
+
+        table = self.__pulse_width_table[self.rotation_direction]
+
+        if isinstance(power, int) and 0 <= power <= 100:
+            return table[power]
+
+        return self.__interpolate_pulse_width(power, self.rotation_direction)
+
+    def __interpolate_pulse_width(self, power, rotation_dir):
+
         if power == 0: # Will return a "safe" pulse width right in the middle of the "stop "
             return round((self.__min_cw_pw + self.__min_ccw_pw) / 2)
 
@@ -94,17 +214,41 @@ class Parallax:
         # and so will be the final result. This means that for the same "power" given,
         # the final pulse width will depend on the rotation direction.
 
-        if(self.rotation_direction is self.CLOCKWISE):
+        if(rotation_dir is self.CLOCKWISE):
             max = self.__max_cw_pw
             min = self.__min_cw_pw
             
-        elif(self.rotation_direction is self.COUNTER_CLOCKWISE):
+        elif(rotation_dir is self.COUNTER_CLOCKWISE):
             max = self.__max_ccw_pw
             min = self.__min_ccw_pw
 
-        # Linear approximation. According to pigpio, pulse width should be between 500-2500 μs, thus the round.
+        power = 100 if power > 100 else (1 if power < 1 else power)
+
+        curve = self.__speed_curves.get(rotation_dir)
+
+        if curve:
+            # The speed curve is inverted: the power is the percentage of the maximum speed wanted, and the
+            # pulse width is interpolated between the two points of the curve around that speed.
+
+            speed = curve[-1][1] * power / 100
+
+            if speed <= curve[0][1]:
+                return round(curve[0][0])
 
-        return round(interp(power,[1,100],[min,max]))
+            for (pw_a, speed_a), (pw_b, speed_b) in zip(curve, curve[1:]):
+                if speed_b >= speed:
+                    return round(pw_a + (pw_b - pw_a) * (speed - speed_a) / (speed_b - speed_a))
+
+            return round(curve[-1][0])
+
+        # Linear approximation between power 1 and 100 (clamped beyond them). According to pigpio, pulse width
+        # should be between 500-2500 μs, thus the round.
+
+        return round(min + (max - min) * (power - 1) / 99)
+
+    def __build_pulse_width_table(self):
+        for rotation_dir in (self.CLOCKWISE, self.COUNTER_CLOCKWISE):
+            self.__pulse_width_table[rotation_dir] = [self.__interpolate_pulse_width(power, rotation_dir) for power in range(0, 101)]
 
     def set_power(self, power, auto_refresh = False):
 
@@ -130,41 +274,300 @@ class Parallax:
 
         return round(self.__feedback_reader.duty_cycle(), 2)
 
-    def run(self, power = None):
+    def get_angle(self):
+        # Returns the angular position of the axle (0º-360º, increasing counter-clockwise) using the calibrated
+        # feedback bounds.
+
+        return (self.__feedback_reader.duty_cycle() - self.__min_fb_dc) * 360.0 / (self.__max_fb_dc - self.__min_fb_dc)
+
+    def get_feedback_tick(self):
+        # Returns the tick (μs) of the last feedback period read.
+
+        return self.__feedback_reader.tick()
+
+    def get_position(self):
+        # Returns the unwrapped angle of the axle (degrees, counting every turn, increasing counter-clockwise).
+
+        return self.__feedback_reader.position()
+
+    def get_turns(self):
+        # Returns the number of turns of the axle counted so far, positive if counter-clockwise. Every crossing
+        # of the 0º/360º boundary is timed by the feedback callback with the pigpio ticks.
+
+        return self.__feedback_reader.turns()
+
+    def get_turns_since(self, tick):
+        # Returns the number of turns of the axle since the given tick (see get_feedback_tick()).
+
+        return self.__feedback_reader.turns_since(tick)
+
+    def get_lap_period(self):
+        # Returns the time (μs) the last lap took, or None if no whole lap was seen in the same direction.
+
+        return self.__feedback_reader.lap_period()
+
+    def get_rpm(self):
+        # Returns the current speed of the axle in revolutions per minute, positive if counter-clockwise.
+
+        return self.__feedback_reader.rpm()
+
+    def add_feedback_listener(self, func):
+        # Calls func() from the feedback callback thread whenever a new feedback period is read.
+        # It should return as soon as possible.
+
+        self.__feedback_reader.add_listener(func)
+
+    def remove_feedback_listener(self, func):
+        self.__feedback_reader.remove_listener(func)
+
+    def get_max_speed(self, velocity):
+        # Returns the maximum speed (degrees per second) in the direction of the given velocity
+        # (positive means counter-clockwise).
+
+        return self.__max_ccw_speed if velocity >= 0 else self.__max_cw_speed
+
+    def sleep(self, seconds):
+        # Sleeps on the backend clock (which might be a simulated one).
+
+        self.__pi.sleep(seconds)
+
+    def get_time(self):
+        # Returns the time (s) of the backend's clock.
+
+        return self.__pi.time()
+
+    def get_clock(self):
+        # Returns the time (s) of the backend's monotonic clock, which has no side effects (see Backend.clock()).
+
+        return self.__pi.clock()
+
+    def __get_controller(self):
+        if self.__controller is None:
+            self.__controller = controller.Controller(self, self.__feedback_reader)
+
+        return self.__controller
+
+    def goto_angle(self, angle):
+        # Moves the axle to the given angle (0º-360º) and holds it there, in closed loop.
+
+        self.__get_controller().goto_angle(angle)
+
+    def hold(self):
+        # Holds the axle at its current position, in closed loop.
+
+        self.__get_controller().hold()
+
+    def set_velocity(self, velocity):
+        # Keeps the axle running at the given velocity (degrees per second, positive means counter-clockwise),
+        # in closed loop.
+
+        self.__get_controller().set_velocity(velocity)
+
+    def release(self):
+        # Stops the closed-loop controller, if running, so the servo follows run() again. The servo is left at
+        # its last command.
+
+        if self.__controller is not None:
+            self.__controller.stop()
+
+    def get_controller_stats(self):
+        # Returns the statistics of the closed-loop controller (see controller.Controller.stats()).
+
+        return self.__get_controller().stats()
+
+    def run(self, power = None, apply = True):
         # By default, the run() method will take the power attribute to calculate the final pulse width.
         # However this might be overwritten if a power is parsed, which will overwrite the attribute itself.
+        # The pulse width is returned. If "apply" is False it is not sent to the servo, so the caller can
+        # send it (e.g. a ParallaxGroup sending the pulse widths of many servos at once).
 
         if power is not None:
             self.__power = abs(power)
 
-        if power > 0:
-            self.rotation_direction = self.CLOCKWISE
-        elif power < 0:
-            self.rotation_direction = self.COUNTER_CLOCKWISE
+            if power > 0:
+                self.rotation_direction = self.CLOCKWISE
+            elif power < 0:
+                self.rotation_direction = self.COUNTER_CLOCKWISE
+
+        pulse_width = self.__calculate_pulse_width(self.__power)
+
+        if self.__recorder is not None:
+            self.__recorder.command(self.control_pin, pulse_width)
+
+        if apply:
+            self.__writer.write(pulse_width)
+        else:
+            self.__writer.record(pulse_width)
 
-        self.__pi.set_servo_pulsewidth(self.control_pin, self.__calculate_pulse_width(self.__power))
+        return pulse_width
+
+    def get_pulse_width(self, power):
+        # Returns the pulse width run() would send for the given power (negative means counter-clockwise),
+        # without changing the power attribute nor the rotation direction.
+
+        rotation_dir = self.COUNTER_CLOCKWISE if power < 0 else self.CLOCKWISE
+        power = abs(power)
+
+        if isinstance(power, int) and power <= 100:
+            return self.__pulse_width_table[rotation_dir][power]
+
+        return self.__interpolate_pulse_width(power, rotation_dir)
+
+    def get_power_for_velocity(self, velocity):
+        # Returns the power (-100 to 100, not rounded) running the axle at the given angular velocity (degrees
+        # per second, positive means counter-clockwise). It is exact only if the speed curve was characterized,
+        # since power is then a fraction of the maximum speed (see characterize()).
+
+        power = -velocity * 100.0 / self.get_max_speed(velocity)
+
+        return max(-100.0, min(100.0, power))
+
+    def send_pulse_width(self, pulse_width):
+        # Sends the given pulse width right away (e.g. one precomputed by trajectory.TrajectoryScheduler),
+        # leaving the power attribute as is.
+
+        if self.__recorder is not None:
+            self.__recorder.command(self.control_pin, pulse_width)
+
+        self.__writer.write(pulse_width, immediate=True)
+
+    def probe_speed(self, pulse_width, settle_time = 0.15, measure_time = 0.25):
+        # Runs the servo at the given pulse width for a moment, returning its angular velocity (degrees per
+        # second, positive means counter-clockwise) measured on the unwrapped position of the axle. The pulse
+        # width of the current power is restored afterwards.
+
+        reader = self.__feedback_reader
+
+        self.__run_and_wait(pulse_width)
+        self.__pi.sleep(settle_time)
+        self.__wait_for_feedback()
+
+        start_position, start_tick = reader.position(), reader.tick()
+
+        self.__pi.sleep(measure_time)
+        self.__wait_for_feedback()
+
+        speed = (reader.position() - start_position) / (((reader.tick() - start_tick) & 0xFFFFFFFF) / 1000000.0)
+
+        self.run()
+
+        return speed
+
+    def start_drift_monitor(self, **monitor_kwargs):
+        # Starts watching the servo in the background, adjusting the calibration values as they drift
+        # (see drift_monitor.DriftMonitor). Returns the monitor, so listeners can be added to it.
+
+        if self.__drift_monitor is None:
+            self.__drift_monitor = drift_monitor.DriftMonitor(self, **monitor_kwargs)
+            self.__drift_monitor.start()
+
+        return self.__drift_monitor
+
+    def stop_drift_monitor(self):
+        if self.__drift_monitor is not None:
+            self.__drift_monitor.stop()
+            self.__drift_monitor = None
+
+    def start_recording(self, path):
+        # Streams every feedback edge and every pulse width commanded into the given binary file, until
+        # stop_recording() is called. See telemetry.Replay to analyze it offline.
+
+        self.stop_recording()
+        self.__recorder = telemetry.Recorder(self.__pi, path, feedback_gpio=self.feedback_pin)
+
+        return self.__recorder
+
+    def stop_recording(self):
+        if self.__recorder is not None:
+            self.__recorder.close()
+            self.__recorder = None
+
+    def enable_instrumentation(self):
+        # Starts counting the feedback edges, glitches and missed periods, measuring the callback latency
+        # and the command round trips, and timing every calibration stage. Returns the Instrumentation
+        # object holding them (see its snapshot(), dump() and start_dump() methods).
+
+        if self.__instrumentation is None:
+            self.__instrumentation = Instrumentation(clock=self.__pi.clock)
+            self.__feedback_reader.set_instrumentation(self.__instrumentation)
+            self.__writer.instrumentation = self.__instrumentation
+
+        return self.__instrumentation
+
+    def disable_instrumentation(self):
+        if self.__instrumentation is not None:
+            self.__instrumentation.stop_dump()
+            self.__feedback_reader.set_instrumentation(None)
+            self.__writer.instrumentation = None
+            self.__instrumentation = None
+
+    def get_instrumentation(self):
+        return self.__instrumentation
+
+    def __phase(self, name):
+        # Times the calibration stage run inside a "with" block, if instrumentation is enabled.
+
+        if self.__instrumentation is None:
+            return nullcontext()
+
+        return self.__instrumentation.phase(name)
+
+    def get_command_stats(self):
+        # Returns the number of pulse width commands sent and suppressed (see command_writer.CommandWriter.stats()).
+
+        return self.__writer.stats()
 
     def stop(self):
         # Following the method calls, a procedure which will return a safe pulse width inside the "stop zone"
-        # if you try to run the servo at "0" power.
+        # if you try to run the servo at "0" power. The closed-loop controller, if running, is released first.
+
+        self.release()
 
         self.run(0)
 
-    def __run_and_wait(self, pulse_width):
+    def __run_and_wait(self, pulse_width, timeout = 1.0):
         # Sometimes the pulse width parsed might not be a whole number.
         pulse_width = round(pulse_width)
 
         # Applies the changes only when it is necessary, and waits for them to be applied before continue.
         # This is used on the calibration procedure.
 
-        if pulse_width != self.__pi.get_servo_pulsewidth(self.control_pin):
-                self.__pi.set_servo_pulsewidth(self.control_pin, pulse_width)
+        if self.__recorder is not None:
+            self.__recorder.command(self.control_pin, pulse_width)
+
+        if not self.__writer.write(pulse_width, immediate=True):
+            return
+
+        # The daemon is asked once per PWM period (instead of as fast as possible) until the change is applied.
+        # Even then, the servo will not notice it until the next PWM period starts, so that period is waited too.
+
+        time_milestone = self.__pi.time()
+
+        while self.__pi.get_servo_pulsewidth(self.control_pin) != pulse_width:
+            if self.__pi.time() - time_milestone >= timeout:
+                raise TimeoutError("Pulse width " + str(pulse_width) + " μs not applied on pin " + str(self.control_pin))
+
+            self.__pi.sleep(self.__PWM_PERIOD)
+
+        self.__pi.sleep(self.__PWM_PERIOD)
 
-                while self.__pi.get_servo_pulsewidth(self.control_pin) != pulse_width:
-                    pass
+    def __wait_for_feedback(self, periods = 1):
+        # Sleeps until the given number of new feedback periods have been read. The reader wakes this thread
+        # up from its callback, so no CPU is spent while waiting. If the feedback signal is lost the wait
+        # would last forever, so a generous timeout is set.
+
+        timeout = 0.1 + 2 * periods * self.__FEEDBACK_PERIOD
+
+        if not self.__feedback_reader.wait_for_periods(periods, timeout):
+            raise TimeoutError("No feedback signal on pin " + str(self.feedback_pin))
 
     def __get_feedback_dc_bounds(self):
 
+        # NumPy takes hundreds of ms to import on a Raspberry Pi, so feedback_analytics (which needs it) is
+        # only imported here and by the other calibration methods, instead of on top of the module.
+
+        import feedback_analytics
+
         # Safe values where the servo speed will be close to slowest and quickest possible.
         # Counter-clockwise is choosen since both upper and lower pulse width limits will be 
         # in boundaries afther applying the factor below.
@@ -185,34 +588,50 @@ class Parallax:
         min_dc = 100.0
         max_dc = 0.0
 
-        print("Analyzing feedback signal...")
+        self.__print("Analyzing feedback signal...")
+
+        batch_periods = 20 # Feedback periods analyzed at once
 
         self.__run_and_wait(fast_pulse_width)
 
-        time_milestone = time.time() # Sets a milestone to keep track of the test time.
+        time_milestone = self.__pi.time() # Sets a milestone to keep track of the test time.
+
+        seq = self.__feedback_reader.edges()
+
+        while self.__pi.time() - time_milestone < test_timeout: # While the time has not expired...
+            self.__wait_for_feedback(batch_periods) # Waits for a new batch of samples.
+
+            ticks, levels, next_seq = self.__feedback_reader.since(seq)
+            seq = next_seq - 2 # The last period of this batch is only complete on the next one.
+
+            start, high, period = feedback_analytics.periods(ticks, levels)
+            valid = ~feedback_analytics.outlier_mask(high, period) # Glitches are left out
+
+            if valid.any():
+                feedback_samples = feedback_analytics.duty_cycles(high[valid], period[valid])
+
+                # The bounds are refreshed with the extremes of the batch.
 
-        while time.time() - time_milestone < test_timeout: # While the time has not expired...
-            feedback_sample = round(self.__feedback_reader.duty_cycle(), 2) # Take a feedback duty cycle sample.
+                max_dc = max(max_dc, float(feedback_samples.max()))
+                min_dc = min(min_dc, float(feedback_samples.min()))
 
-            if feedback_sample != 0.0: # If that sample is not zero...
-                if feedback_sample < lower_dc_bound or feedback_sample > upper_dc_bound: # and its inside the "slow zone" ...
+                feedback_sample = feedback_samples[-1] # The current position of the axle
+
+                if feedback_sample < lower_dc_bound or feedback_sample > upper_dc_bound: # If its inside the "slow zone" ...
                     self.__run_and_wait(slow_pulse_width) # run the servo at low speed
                 else: # and its inside the "quick zone" ...
                     self.__run_and_wait(fast_pulse_width) # run the servo at high speed
 
-                if feedback_sample > max_dc: # If that sample is greater than the current maximum
-                    max_dc = feedback_sample # Refresh the maximun with the new value. Same goes for minimum.
-                elif feedback_sample < min_dc:
-                    min_dc = feedback_sample
-
-            print("Completed: ", round(((time.time() - time_milestone)*100)/test_timeout, 1), "%", end="\r")
+            self.__print("Completed: ", round(((self.__pi.time() - time_milestone)*100)/test_timeout, 1), "%", end="\r")
 
-        print("Feedback signal analyzed!") # Reach this point means that the timer set before has expired
+        self.__print("Feedback signal analyzed!") # Reach this point means that the timer set before has expired
 
         # Overwrite the default values with the new values found.
 
-        self.__min_fb_dc = min_dc
-        self.__max_fb_dc = max_dc
+        self.__min_fb_dc = round(min_dc, 2)
+        self.__max_fb_dc = round(max_dc, 2)
+
+        self.__feedback_reader.set_dc_range(self.__min_fb_dc, self.__max_fb_dc)
 
     def __find_stop_boundaries(self, rotation_dir = CLOCKWISE):
 
@@ -233,44 +652,193 @@ class Parallax:
         static_feedback_samples = []
 
         static_feedback_time = 1.0 # Time while feedback samples will be taken with the servo totally stopped in the current position.
-        static_feedback_time_milestone = time.time() # Time milestone used as a timer.
+        static_feedback_time_milestone = self.__pi.time() # Time milestone used as a timer.
 
-        while time.time() - static_feedback_time_milestone < static_feedback_time: # Take as many samples as possible
+        while self.__pi.time() - static_feedback_time_milestone < static_feedback_time: # Take one sample per feedback period
+            self.__wait_for_feedback()
             static_feedback_samples.append(self.get_feedback_duty_cycle())
 
         static_average_feedback = sum(static_feedback_samples)/len(static_feedback_samples)
 
         time_per_pw = 0.5 # Time while the given pulse width is tested
-        pw_time_milestone = time.time()
+        pw_time_milestone = self.__pi.time()
+
+        search_time_milestone = pw_time_milestone
+        probes = 1
 
         pulse_width = safe_stop_pulse_width
-        print("Trying with", pulse_width, "μs pulse width...", end="\r")
+        self.__print("Trying with", pulse_width, "μs pulse width...", end="\r")
 
         while math.isclose(self.get_feedback_duty_cycle(), static_average_feedback, abs_tol=1.0):
             # The hall sensor is very sensitive once the servo starts moving, so feedback samples will be taken continously
             # until there is a difference greater than a given value.
 
+            self.__wait_for_feedback()
             self.__run_and_wait(pulse_width)
 
-            if (time.time() - pw_time_milestone >= time_per_pw): # When the timer expires...
+            if (self.__pi.time() - pw_time_milestone >= time_per_pw): # When the timer expires...
                 pulse_width += pulse_width_step # Assume that the servo has not move with this pulse width and tries with next one
-                print("Trying with", pulse_width, "μs pulse width...", end="\r")
-                pw_time_milestone = time.time() # Resets the timer
+                probes += 1
+                self.__print("Trying with", pulse_width, "μs pulse width...", end="\r")
+                pw_time_milestone = self.__pi.time() # Resets the timer
+
+        self.__print("                                                                                                  ", end="\r")
 
-        print("                                                                                                  ", end="\r")
+        self.stop_search_stats[rotation_dir] = {"probes": probes, "time": self.__pi.time() - search_time_milestone}
 
         # Since this procedure should be done in both directions, recursivity is used with a parameter
         # indicating the rotation direction. Clockwise as default will be first, and then counter-clockwise.
         # If counter-clockwise is called, then the recursive call stops.
 
         if rotation_dir is self.CLOCKWISE:
-            print("Clockwise done!")
+            self.__print("Clockwise done!")
             self.__min_cw_pw = pulse_width
             self.__find_stop_boundaries(self.COUNTER_CLOCKWISE)
         elif rotation_dir is self.COUNTER_CLOCKWISE: # 
-            print("Counter-clockwise done!")
+            self.__print("Counter-clockwise done!")
             self.__min_ccw_pw = pulse_width
 
+    def __analyze_feedback(self, seq):
+        # Analyzes every feedback edge read since the given sequence number (See read_PWM.reader.since()),
+        # returning per period times, duty cycles, angles, unwrapped positions and velocities.
+
+        import feedback_analytics
+
+        ticks, levels, _ = self.__feedback_reader.since(seq)
+
+        return feedback_analytics.analyze(ticks, levels, self.__min_fb_dc, self.__max_fb_dc)
+
+    def __is_moving(self, pulse_width, settle_time = 0.2, test_time = 0.5, min_displacement = 3.0):
+        # A motion test robust to the feedback noise: instead of comparing single samples, the positions
+        # read at the beginning and at the end of the test are averaged, and the servo is considered to be
+        # moving only if the axle travelled more than "min_displacement" degrees between both averages.
+        # The servo is given some time to settle first, since it might be decelerating from a previous test.
+
+        self.__run_and_wait(pulse_width)
+        self.__pi.sleep(settle_time)
+
+        seq = self.__feedback_reader.edges()
+        self.__wait_for_feedback(round(test_time / self.__FEEDBACK_PERIOD))
+
+        # Unwrapped positions, so averaging samples close to the 0º/360º wrap does not give nonsense values.
+
+        position = self.__analyze_feedback(seq)["position"]
+
+        if position.size < 2:
+            return False
+
+        edge_size = max(1, position.size // 10)
+
+        start = position[:edge_size].mean()
+        end = position[-edge_size:].mean()
+
+        return abs(end - start) >= min_displacement
+
+    def is_moving(self, pulse_width):
+        # Runs the motion test of the calibration procedure (see __is_moving()) on the given pulse width,
+        # returning True if the axle moved. The pulse width is left applied.
+
+        return self.__is_moving(pulse_width)
+
+    def __find_stop_boundaries_bisection(self, rotation_dir = CLOCKWISE):
+
+        # Instead of moving the pulse width 1 μs at a time, the first pulse width that makes the servo
+        # move is bracketed between a pulse width that does not (starting from the safe stop value) and one
+        # that does, doubling the step each time. Then the bracket is halved until both ends are 1 μs apart,
+        # which takes O(log n) motion tests instead of O(n).
+
+        safe_stop_pulse_width = round((self.__min_cw_pw + self.__min_ccw_pw)/2)
+
+        if rotation_dir is self.CLOCKWISE: # Clockwise means lower pulse widths
+            direction = -1
+            limit_pulse_width = self.__max_cw_pw
+        elif rotation_dir is self.COUNTER_CLOCKWISE:
+            direction = 1
+            limit_pulse_width = self.__max_ccw_pw
+
+        search_time_milestone = self.__pi.time()
+        probes = 0
+
+        # Bracketing. "still" will always hold a pulse width where the servo does not move, and "moving"
+        # one where it does.
+
+        still = safe_stop_pulse_width
+        step = 2
+
+        while True:
+            candidate = safe_stop_pulse_width + direction * step
+
+            # The servo is moving for sure at its maximum speed, so the bracket never goes beyond that.
+
+            if direction * (candidate - limit_pulse_width) >= 0:
+                moving = round(limit_pulse_width)
+                break
+
+            self.__print("Bracketing with", candidate, "μs pulse width...", end="\r")
+
+            probes += 1
+
+            if self.__is_moving(candidate):
+                moving = candidate
+                break
+
+            still = candidate
+            step *= 2
+
+        # Bisection
+
+        while abs(moving - still) > 1:
+            candidate = (moving + still) // 2
+
+            self.__print("Trying with", candidate, "μs pulse width...  ", end="\r")
+
+            probes += 1
+
+            if self.__is_moving(candidate):
+                moving = candidate
+            else:
+                still = candidate
+
+        self.__run_and_wait(safe_stop_pulse_width)
+
+        self.__print("                                                                                                  ", end="\r")
+
+        self.stop_search_stats[rotation_dir] = {"probes": probes, "time": self.__pi.time() - search_time_milestone}
+
+        if rotation_dir is self.CLOCKWISE:
+            self.__print("Clockwise done!")
+            self.__min_cw_pw = moving
+            self.__find_stop_boundaries_bisection(self.COUNTER_CLOCKWISE)
+        elif rotation_dir is self.COUNTER_CLOCKWISE:
+            self.__print("Counter-clockwise done!")
+            self.__min_ccw_pw = moving
+
+    def __measure_lap_time(self, laps, batch_periods = 20, timeout = 30.0):
+        # Returns the average time (s) per lap of the axle, timing the given number of laps.
+        # The reader times every crossing of the 0º/360º boundary to the microsecond (see
+        # read_PWM.reader.lap_tick()), so the laps are timed from the first crossing seen on.
+        # If the laps are not completed before the timeout, the axle is considered to be (almost) stopped.
+
+        reader = self.__feedback_reader
+        time_milestone = self.__pi.time()
+
+        start_turns = reader.turns()
+        first_tick = None
+
+        while self.__pi.time() - time_milestone < timeout:
+            self.__wait_for_feedback(batch_periods)
+
+            turns = abs(reader.turns() - start_turns)
+
+            if first_tick is None:
+                if turns >= 1:
+                    first_tick = reader.lap_tick()
+                    start_turns = reader.turns()
+            elif turns >= laps:
+                return ((reader.lap_tick() - first_tick) & 0xFFFFFFFF) / 1000000.0 / turns
+
+        return float("inf")
+
     def __find_limit_boundaries(self, rotation_dir = CLOCKWISE):
 
         # The approach intended here is to run the servo a bit beyond its maximum limit
@@ -294,120 +862,526 @@ class Parallax:
             safe_limit_pulse_width = self.__max_ccw_pw * 1.005 # Subtly beyond the limit
             max_pulse_width = self.__max_ccw_pw
 
-        # Lap parameters
-
-        laps = 10
-        laps_counter = 0
-        lap_completed = False
+        laps = 10 # Laps timed for each pulse width
 
         pulse_width = safe_limit_pulse_width
 
-        self.__run_and_wait(pulse_width)
+        # Timer parameters
 
-        start_feedback_duty_cycle = self.get_feedback_duty_cycle() # The "home" position will be the current position of the axle.
+        avg_time_laps_at_max = []
+        average_lap_time_max_speed = None
 
-        # Waits until the feedback returns a number which is not zero. The reader class needs the servo to be running
-        # to set some values before returning valid values, otherwise it returns 0.
+        while True: # The loop will be broken eventually
+            self.__run_and_wait(pulse_width)
 
-        while start_feedback_duty_cycle == 0.0:
-            start_feedback_duty_cycle = self.get_feedback_duty_cycle()
+            average_lap_time = self.__measure_lap_time(laps) # The time per one lap is calculated
 
-        # Timer parameters
+            # All lap times are taken to calculate a median until the tested pulse width reaches the 
+            # theoretical maximum (Remember that the test started subtly beyond this maximum), then the lap time
+            # is compared to this median. Once the lap time increseases by a certain value, the loop is broken.
 
-        avg_time_laps_at_max = []
-        average_lap_time_max_speed = None
+            if round(pulse_width) == round(max_pulse_width) and average_lap_time_max_speed is None:
+                avg_time_laps_at_max.append(average_lap_time)
+                average_lap_time_max_speed = sum(avg_time_laps_at_max)/len(avg_time_laps_at_max)
+                self.__print("avg time per lap at maximun speed:", round(average_lap_time_max_speed, 4), "s")
+            elif average_lap_time_max_speed is not None and average_lap_time/average_lap_time_max_speed >= 1.03: break
 
-        start_time = time.time()
+            # If the loop is not broken by this line, then means that the speed remains constant and thus the next
+            # pulse width is being prepared.
 
-        while True: # The loop will be broken eventually
-            # The duty cycle loops between 0 and 100% (Actually the real limits are set on the datahseet/calibration procedure)
-            # The start point will be randomly at any value between those limits. Reading values above or below this position
-            # could mean a full lap. A flag is set as soon as the first value above the start position is readed,
-            # and reseted as soon as the first value below the start position is readed. This "flanges" are count as one lap.
-
-            if lap_completed is False and self.get_feedback_duty_cycle() >= start_feedback_duty_cycle:
-                lap_completed = True
-                laps_counter += 1
-            elif lap_completed is True and self.get_feedback_duty_cycle() < start_feedback_duty_cycle:
-                lap_completed = False
-
-            if laps_counter == laps - 1: # Once the target laps are reached...
-                average_lap_time = (time.time() - start_time)/laps # The time per one lap is calculated
-
-                # All lap times are taken to calculate a median until the tested pulse width reaches the 
-                # theoretical maximum (Remember that the test started subtly beyond this maximum), then the lap time
-                # is compared to this median. Once the lap time increseases by a certain value, the loop is broken.
-
-                if round(pulse_width) == round(max_pulse_width) and average_lap_time_max_speed is None:
-                    avg_time_laps_at_max.append(average_lap_time)
-                    average_lap_time_max_speed = sum(avg_time_laps_at_max)/len(avg_time_laps_at_max)
-                    print("avg time per lap at maximun speed:", round(average_lap_time_max_speed, 4), "s")
-                elif average_lap_time_max_speed is not None and average_lap_time/average_lap_time_max_speed >= 1.03: break
-
-                # If the loop is not broken by this line, then means that the speed remains constant and thus the next
-                # pulse width is being prepared.
-
-                # Resets lap parameters.
-
-                pulse_width += pulse_width_step
-                laps_counter = 0
-                lap_completed = False
-
-                if average_lap_time_max_speed is not None:
-                    print("(avg time per lap =", round(average_lap_time, 4), "s)", "Trying with", round(pulse_width), "μs pulse width...", end="\r")
-                
-                self.__run_and_wait(pulse_width)
-                
-                start_feedback_duty_cycle = self.get_feedback_duty_cycle()
-                
-                while start_feedback_duty_cycle == 0.0:
-                    start_feedback_duty_cycle = self.get_feedback_duty_cycle()
-                
-                start_time = time.time()
+            pulse_width += pulse_width_step
+
+            if average_lap_time_max_speed is not None:
+                self.__print("(avg time per lap =", round(average_lap_time, 4), "s)", "Trying with", round(pulse_width), "μs pulse width...", end="\r")
 
-        print("                                                                                                  ", end="\r")
+        self.__print("                                                                                                  ", end="\r")
 
         # Since this procedure should be done in both directions, recursivity is used with a parameter
         # indicating the rotation direction. Clockwise as default will be first, and then counter-clockwise.
         # If counter-clockwise is called, then the recursive call stops.
 
         if rotation_dir is self.CLOCKWISE:
-            print("Clockwise done!")
+            self.__print("Clockwise done!")
             self.__max_cw_pw = round(pulse_width - pulse_width_step)
             self.__find_limit_boundaries(self.COUNTER_CLOCKWISE)
         elif rotation_dir is self.COUNTER_CLOCKWISE:
-            print("Counter-clockwise done!")
+            self.__print("Counter-clockwise done!")
             self.__max_ccw_pw = round(pulse_width - pulse_width_step)
 
-    def calibrate(self):
+    def get_calibration(self):
+        # Returns the values found by the calibration procedure, so they can be stored and restored later.
+
+        return {
+            "min_fb_dc": self.__min_fb_dc,
+            "max_fb_dc": self.__max_fb_dc,
+            "min_cw_pw": self.__min_cw_pw,
+            "min_ccw_pw": self.__min_ccw_pw,
+            "max_cw_pw": self.__max_cw_pw,
+            "max_ccw_pw": self.__max_ccw_pw,
+            "max_cw_speed": self.__max_cw_speed,
+            "max_ccw_speed": self.__max_ccw_speed,
+            "cw_speed_curve": self.__speed_curves.get(self.CLOCKWISE),
+            "ccw_speed_curve": self.__speed_curves.get(self.COUNTER_CLOCKWISE),
+            "cw_step_response": self.__step_responses.get(self.CLOCKWISE),
+            "ccw_step_response": self.__step_responses.get(self.COUNTER_CLOCKWISE)
+        }
+
+    def set_calibration(self, values):
+        # Overwrites the calibration values with the given ones (As returned by get_calibration()).
+
+        self.__min_fb_dc = float(values["min_fb_dc"])
+        self.__max_fb_dc = float(values["max_fb_dc"])
+        self.__min_cw_pw = float(values["min_cw_pw"])
+        self.__min_ccw_pw = float(values["min_ccw_pw"])
+        self.__max_cw_pw = float(values["max_cw_pw"])
+        self.__max_ccw_pw = float(values["max_ccw_pw"])
+
+        # Profiles stored before the speeds were measured lack them.
+
+        self.__max_cw_speed = float(values.get("max_cw_speed", self.__max_cw_speed))
+        self.__max_ccw_speed = float(values.get("max_ccw_speed", self.__max_ccw_speed))
+
+        # Profiles stored without characterizing the speed curve (or before it existed) lack it too.
+
+        self.__speed_curves = {}
+
+        for rotation_dir, key in ((self.CLOCKWISE, "cw_speed_curve"), (self.COUNTER_CLOCKWISE, "ccw_speed_curve")):
+            if values.get(key):
+                self.__speed_curves[rotation_dir] = [[float(pw), float(speed)] for pw, speed in values[key]]
+
+        self.__step_responses = {}
+
+        for rotation_dir, key in ((self.CLOCKWISE, "cw_step_response"), (self.COUNTER_CLOCKWISE, "ccw_step_response")):
+            if values.get(key):
+                self.__step_responses[rotation_dir] = [dict(model) for model in values[key]]
+
+        self.__feedback_reader.set_dc_range(self.__min_fb_dc, self.__max_fb_dc)
+        self.__build_pulse_width_table()
+
+    def check_calibration(self, probe_time = 0.5, max_outliers = 0.02):
+        # A quick sanity probe for the current calibration values: the servo is run slowly for a while
+        # and the feedback signal should look like the one the calibration procedure found. That is,
+        # a ~910 Hz signal whose duty cycle stays between the calibrated bounds and changes as the axle moves.
+        # The raw periods are checked, since the filtered duty cycles of the reader are rebuilt from angles
+        # (always within the bounds) and its periods are gated around 910 Hz. A small fraction of them
+        # (max_outliers) might be glitches beyond the bounds.
+
+        import feedback_analytics
+
+        tolerance = 1.0 # Duty cycle (%) allowed beyond the calibrated bounds
+        frequency_bounds = (800.0, 1000.0) # Hz. According to the datasheet it should be 910 Hz
+
+        self.__run_and_wait((self.__min_ccw_pw + self.__max_ccw_pw) / 2)
+
+        # Slept instead of waiting for feedback periods, which are not counted if gated out.
+
+        seq = self.__feedback_reader.edges()
+        self.__pi.sleep(probe_time)
+
+        ticks, levels, _ = self.__feedback_reader.since(seq)
+        _, high, period = feedback_analytics.periods(ticks, levels)
+
+        self.stop()
+
+        if period.size == 0:
+            return False
+
+        frequency = feedback_analytics.frequency(period)
+
+        if not frequency_bounds[0] <= frequency <= frequency_bounds[1]:
+            return False
+
+        samples = feedback_analytics.duty_cycles(high, period)
+        beyond = (samples < self.__min_fb_dc - tolerance) | (samples > self.__max_fb_dc + tolerance)
+
+        if beyond.mean() > max_outliers:
+            return False
+
+        return samples.max() - samples.min() > tolerance # Did the axle move at all?
+
+    def load_or_calibrate(self, path = calibration_profile.DEFAULT_PROFILE_PATH, max_age = calibration_profile.DEFAULT_MAX_AGE):
+        # The calibration procedure takes minutes, so its results are stored on disk and reused
+        # on the next start as long as they are recent enough and they pass the sanity probe.
+        # Returns True if the stored profile was used, and False if a new calibration was needed.
+
+        key = calibration_profile.profile_key(self.servo_id, self.control_pin, self.feedback_pin)
+
+        values = calibration_profile.load_profile(key, path, max_age)
+
+        if values is not None:
+            previous_values = self.get_calibration()
+
+            self.set_calibration(values)
+
+            if self.check_calibration():
+                self.__print("Calibration profile loaded!")
+                return True
+
+            self.__print("Calibration profile does not match the servo, calibrating again...")
+            self.set_calibration(previous_values)
+
+        self.calibrate()
+
+        calibration_profile.save_profile(key, self.get_calibration(), path)
+
+        return False
+
+    def __measure_speed(self, pulse_width, settle_time = 0.15, measure_time = 0.3):
+        # Returns the angular velocity (degrees per second, positive means counter-clockwise) of the axle
+        # running at the given pulse width. Every feedback period is timestamped with the tick of its rising
+        # edge, so the speed is the least squares slope of the unwrapped angle over those ticks, accurate to
+        # the microsecond instead of depending on whole laps and on the Python scheduler.
+
+        import feedback_analytics
+
+        self.__run_and_wait(pulse_width)
+        self.__pi.sleep(settle_time)
+
+        seq = self.__feedback_reader.edges()
+        self.__wait_for_feedback(round(measure_time / self.__FEEDBACK_PERIOD))
+
+        analysis = self.__analyze_feedback(seq)
+
+        return feedback_analytics.mean_velocity(analysis["time"], analysis["position"])
+
+    def __find_limit_boundaries_adaptive(self, rotation_dir = CLOCKWISE, back_to_back = False):
+
+        # Instead of stepping 1 μs at a time from maximum speed, the speed is measured on a few widely
+        # spaced pulse widths, from beyond the datasheet limit towards the stop boundary. The maximum speed
+        # is the one measured beyond the limit, and the saturation knee (the last pulse width still running
+        # at maximum speed) lies between the last sample at maximum speed and the first one below it.
+        # A line fitted through the samples below maximum speed gives a first guess for the knee, and only
+        # the pulse widths around that guess are measured again.
+
+        slowdown_tolerance = 0.03 # Speed loss (relative to maximum speed) considered noticeable
+        sample_offsets = [0, 20, 45, 80, 130, 200] # μs from the starting point towards the stop boundary
+
+        if rotation_dir is self.CLOCKWISE:
+            direction = -1 # Clockwise means lower pulse widths
+            safe_limit_pulse_width = round(self.__max_cw_pw * 0.995) # Subtly beyond the limit
+            stop_pulse_width = self.__min_cw_pw
+        elif rotation_dir is self.COUNTER_CLOCKWISE:
+            direction = 1
+            safe_limit_pulse_width = round(self.__max_ccw_pw * 1.005) # Subtly beyond the limit
+            stop_pulse_width = self.__min_ccw_pw
+
+        search_time_milestone = self.__pi.time()
+        probes = 0
+
+        def speed_at(pulse_width):
+            nonlocal probes
+            probes += 1
+            self.__print("Measuring speed with", pulse_width, "μs pulse width...", end="\r")
+            return abs(self.__measure_speed(pulse_width))
+
+        # Coarse sampling
+
+        samples = []
+
+        for offset in sample_offsets:
+            pulse_width = safe_limit_pulse_width - direction * offset
+
+            if direction * (pulse_width - stop_pulse_width) <= 0: # Never go into the stop zone
+                break
+
+            samples.append((pulse_width, speed_at(pulse_width)))
+
+        max_speed = samples[0][1]
+        threshold = max_speed * (1.0 - slowdown_tolerance)
+
+        self.__print("Speed at maximum:", round(max_speed, 1), "º/s", " " * 40)
+
+        saturated = samples[0][0]
+        slow = None
+
+        for pulse_width, speed in samples[1:]:
+            if speed >= threshold:
+                saturated = pulse_width
+                max_speed = max(max_speed, speed)
+                threshold = max_speed * (1.0 - slowdown_tolerance)
+            else:
+                slow = pulse_width
+                break
+
+        # The maximum speed is kept for the closed-loop controller.
+
+        if rotation_dir is self.CLOCKWISE:
+            self.__max_cw_speed = max_speed
+        elif rotation_dir is self.COUNTER_CLOCKWISE:
+            self.__max_ccw_speed = max_speed
+
+        if slow is None: # Never slowed down on the range sampled
+            knee = samples[-1][0]
+        else:
+            # Fitting a line through the unsaturated samples closest to the knee, and finding where it
+            # reaches the threshold speed.
+
+            unsaturated = [(pw, v) for pw, v in samples if direction * (pw - slow) <= 0][:2]
+
+            if len(unsaturated) == 2 and unsaturated[0][1] != unsaturated[1][1]:
+                (pw_a, v_a), (pw_b, v_b) = unsaturated
+                guess = pw_a + (threshold - v_a) * (pw_b - pw_a) / (v_b - v_a)
+            else:
+                guess = (saturated + slow) / 2
+
+            # The guess must lie inside the bracket to be of any use.
+
+            low, high = sorted((saturated, slow))
+            guess = round(min(max(guess, low + 1), high - 1)) if high - low > 1 else saturated
+
+            # Refinement: bisection between the saturated and slow ends, probing the fitted guess first.
+
+            candidate = guess
+
+            while abs(slow - saturated) > 1:
+                if speed_at(candidate) >= threshold:
+                    saturated = candidate
+                else:
+                    slow = candidate
+
+                candidate = (saturated + slow) // 2
+
+            knee = saturated
+
+        self.__print("                                                                                                  ", end="\r")
+
+        self.limit_search_stats[rotation_dir] = {"probes": probes, "time": self.__pi.time() - search_time_milestone}
+
+        if rotation_dir is self.CLOCKWISE:
+            self.__print("Clockwise done!")
+            self.__max_cw_pw = knee
+
+            if not back_to_back: # Brings the axle to rest before testing the other direction
+                self.__run_and_wait((self.__min_cw_pw + self.__min_ccw_pw) / 2)
+                self.__pi.sleep(0.5)
+
+            self.__find_limit_boundaries_adaptive(self.COUNTER_CLOCKWISE, back_to_back)
+        elif rotation_dir is self.COUNTER_CLOCKWISE:
+            self.__print("Counter-clockwise done!")
+            self.__max_ccw_pw = knee
+
+    def __measure_steady_speed(self, pulse_width, batch_periods = 45, tolerance = 0.02, max_time = 0.5):
+        # Returns the steady-state angular velocity (degrees per second, positive means counter-clockwise)
+        # of the axle running at the given pulse width. Instead of waiting a fixed settling time and then
+        # measuring, the speed is measured on consecutive batches of feedback periods until two of them
+        # agree: the settling window itself becomes the measurement, which is the mean velocity of both.
+
+        import feedback_analytics
+
+        self.__run_and_wait(pulse_width)
+
+        time_milestone = self.__pi.time()
+        previous_seq = None
+        previous_speed = None
+
+        while True:
+            seq = self.__feedback_reader.edges()
+            self.__wait_for_feedback(batch_periods)
+
+            analysis = self.__analyze_feedback(seq)
+            speed = feedback_analytics.mean_velocity(analysis["time"], analysis["position"])
+
+            if previous_speed is not None and abs(speed - previous_speed) <= max(tolerance * abs(speed), 5.0):
+                analysis = self.__analyze_feedback(previous_seq)
+
+                return feedback_analytics.mean_velocity(analysis["time"], analysis["position"])
+
+            if self.__pi.time() - time_milestone >= max_time: # Never settled, the last batch is the best guess
+                return speed
+
+            previous_seq = seq
+            previous_speed = speed
+
+    def characterize(self, points = 10):
+        # Sweeps the given number of pulse widths per rotation direction, from the stop boundary to the limit
+        # one, measuring the steady-state speed at each of them. The speed curve is steeper close to the stop
+        # boundary, so the pulse widths are packed closer there. The speed never decreasing is forced on the
+        # stored curve, so it can be inverted by run(). Needs the boundaries found by calibrate() first.
+
+        self.__print("Characterizing speed curve...")
+
+        time_milestone = self.__pi.time()
+
+        for rotation_dir, stop_pulse_width, limit_pulse_width in ((self.CLOCKWISE, self.__min_cw_pw, self.__max_cw_pw),
+                                                                  (self.COUNTER_CLOCKWISE, self.__min_ccw_pw, self.__max_ccw_pw)):
+            curve = []
+            top_speed = 0.0
+
+            for i in range(points):
+                pulse_width = round(stop_pulse_width + (limit_pulse_width - stop_pulse_width) * (i / (points - 1)) ** 1.5)
+
+                if curve and pulse_width == curve[-1][0]:
+                    continue
+
+                self.__print("Measuring speed with", pulse_width, "μs pulse width...", end="\r")
+
+                top_speed = max(top_speed, abs(self.__measure_steady_speed(pulse_width)))
+                curve.append([pulse_width, top_speed])
+
+            self.__speed_curves[rotation_dir] = curve
+
+            if rotation_dir is self.CLOCKWISE:
+                self.__max_cw_speed = top_speed
+            elif rotation_dir is self.COUNTER_CLOCKWISE:
+                self.__max_ccw_speed = top_speed
+
+        self.__print("                                                                                                  ", end="\r")
+
+        self.__build_pulse_width_table()
+
+        self.__print("Maximum speed clockwise:", round(self.__max_cw_speed, 1), "º/s")
+        self.__print("Maximum speed counter-clockwise:", round(self.__max_ccw_speed, 1), "º/s")
+        self.__print("Characterization time:", round(self.__pi.time() - time_milestone, 1), "s", end="\n\n")
+
+        self.stop()
+
+    def identify(self, powers = (25, 50, 100), repeats = 3, step_time = 0.3, rest_time = 0.25):
+        # Identifies the dynamics of the servo: for every rotation direction and power given, the axle is
+        # stepped from rest to the pulse width of that power (repeats times) and its feedback is captured at full
+        # edge rate. A first order plus dead time model (steady-state speed, dead time and time constant) is then
+        # fitted on every step at once, averaging its repetitions (see feedback_analytics.fit_fopdt()). The dead time includes the command
+        # latency and the wait for the next PWM period. Needs the boundaries found by calibrate() first.
+        # The models are stored with the calibration values, and returned.
+
+        import feedback_analytics
+
+        self.__print("Identifying step response...")
+
+        time_milestone = self.__pi.time()
+
+        steps = [] # (rotation direction, power, pulse width)
+        groups = [] # Step of every response captured
+        times = []
+        positions = []
+
+        for rotation_dir in (self.CLOCKWISE, self.COUNTER_CLOCKWISE):
+            for power in powers:
+                steps.append((rotation_dir, power, self.get_pulse_width(power if rotation_dir is self.CLOCKWISE else -power)))
+
+        for _ in range(repeats):
+            for step, (rotation_dir, power, pulse_width) in enumerate(steps):
+                self.stop()
+                self.__pi.sleep(rest_time)
+
+                seq = self.__feedback_reader.edges()
+                step_tick = self.__pi.get_current_tick()
+
+                self.__run_and_wait(pulse_width)
+                self.__wait_for_feedback(round(step_time / self.__FEEDBACK_PERIOD))
+
+                ticks, levels, _ = self.__feedback_reader.since(seq)
+                analysis = feedback_analytics.analyze(ticks, levels, self.__min_fb_dc, self.__max_fb_dc)
+
+                # Period times are relative to the first edge captured, which might come right before or right
+                # after the step: the signed (wrapped) difference is taken.
+
+                offset = ((step_tick - int(ticks[0]) + 0x80000000) & 0xFFFFFFFF) - 0x80000000
+
+                groups.append(step)
+                times.append((analysis["time"] - offset) / 1000000.0)
+                positions.append(analysis["position"])
+
+        self.stop()
+
+        gains, dead_times, time_constants, _ = feedback_analytics.fit_fopdt(times, positions, groups)
+
+        self.__step_responses = {}
+
+        for (rotation_dir, power, pulse_width), gain, dead_time, time_constant in zip(steps, gains, dead_times, time_constants):
+            self.__step_responses.setdefault(rotation_dir, []).append({
+                "power": power,
+                "pulse_width": pulse_width,
+                "gain": abs(float(gain)),
+                "dead_time": float(dead_time),
+                "time_constant": float(time_constant)
+            })
+
+            self.__print(rotation_dir.name.capitalize().replace("_", "-"), "step to", power, "% power:",
+                         round(abs(float(gain)), 1), "º/s, dead time", round(dead_time * 1000.0, 1), "ms, time constant",
+                         round(time_constant * 1000.0, 1), "ms")
+
+        self.__print("Identification time:", round(self.__pi.time() - time_milestone, 1), "s", end="\n\n")
+
+        return self.get_step_response()
+
+    def get_step_response(self):
+        # Returns the step response models found by identify(), per rotation direction ("cw" and "ccw").
+
+        return {
+            "cw": [dict(model) for model in self.__step_responses.get(self.CLOCKWISE, [])],
+            "ccw": [dict(model) for model in self.__step_responses.get(self.COUNTER_CLOCKWISE, [])]
+        }
+
+    def calibrate(self, stop_search = LINEAR_SEARCH, limit_search = LINEAR_SEARCH, back_to_back = False, speed_curve = False,
+                  step_response = False):
+        # The stop boundaries might be found by a linear scan (LINEAR_SEARCH) or by bisection
+        # (BISECTION_SEARCH), which needs way less probes on servos with a wide dead band.
+        # The limit boundaries might be found by a linear scan (LINEAR_SEARCH) or by fitting the speed
+        # curve on a few samples (ADAPTIVE_SEARCH). The latter can test both directions back to back,
+        # without bringing the axle to rest in between.
+        # If "speed_curve" is set, the speed curve is characterized afterwards (see characterize()).
+        # If "step_response" is set, the dynamics of the servo are identified afterwards (see identify()).
+
+        self.__print("Starting calibration procedure...", end="\n\n")
+
+        start_timestamp = self.__pi.time()
+
+        # The boundaries are about to change, so any speed curve or step response measured before is useless.
+
+        self.__speed_curves = {}
+        self.__step_responses = {}
+        self.__build_pulse_width_table()
+
+        with self.__phase("calibrate.feedback_dc_bounds"):
+            self.__get_feedback_dc_bounds()
+
+        self.__print("Minimum feedback signal duty cycle readed:", self.__min_fb_dc, "%")
+        self.__print("Maximum feedback signal duty cycle readed:", self.__max_fb_dc, "%", end="\n\n")
+
+        self.__print("Finding stop boundaries...")
+
+        with self.__phase("calibrate.stop_boundaries"):
+            if stop_search is self.BISECTION_SEARCH:
+                self.__find_stop_boundaries_bisection()
+            else:
+                self.__find_stop_boundaries()
 
-        print("Starting calibration procedure...", end="\n\n")
+        self.__print("Stop boundaries found!")
 
-        start_timestamp = time.time()
+        for rotation_dir, stats in self.stop_search_stats.items():
+            self.__print(rotation_dir.name.capitalize().replace("_", "-"), "search:", stats["probes"], "probes in", round(stats["time"], 1), "s")
 
-        self.__get_feedback_dc_bounds()
+        self.__build_pulse_width_table()
 
-        print("Minimum feedback signal duty cycle readed:", self.__min_fb_dc, "%")
-        print("Maximum feedback signal duty cycle readed:", self.__max_fb_dc, "%", end="\n\n")
+        self.__print("Pulse width for minimum speed clockwise:", self.__min_cw_pw, "μs")
+        self.__print("Pulse width for minimum speed counter-clockwise:", self.__min_ccw_pw, "μs", end="\n\n")
 
-        print("Finding stop boundaries...")
+        self.__print("Finding limit boundaries...")
 
-        self.__find_stop_boundaries()
+        with self.__phase("calibrate.limit_boundaries"):
+            if limit_search is self.ADAPTIVE_SEARCH:
+                self.__find_limit_boundaries_adaptive(back_to_back = back_to_back)
+            else:
+                self.__find_limit_boundaries()
 
-        print("Stop boundaries found!")
+        self.__print("Limit boundaries found!")
 
-        print("Pulse width for minimum speed clockwise:", self.__min_cw_pw, "μs")
-        print("Pulse width for minimum speed counter-clockwise:", self.__min_ccw_pw, "μs", end="\n\n")
+        for rotation_dir, stats in self.limit_search_stats.items():
+            self.__print(rotation_dir.name.capitalize().replace("_", "-"), "search:", stats["probes"], "probes in", round(stats["time"], 1), "s")
 
-        print("Finding limit boundaries...")
+        self.__build_pulse_width_table()
 
-        self.__find_limit_boundaries()
+        self.__print("Pulse width for maximum speed clockwise:", self.__max_cw_pw, "μs")
+        self.__print("Pulse width for maximum speed counter-clockwise:", self.__max_ccw_pw, "μs", end="\n\n")
 
-        print("Limit boundaries found!")
+        if speed_curve:
+            with self.__phase("calibrate.speed_curve"):
+                self.characterize()
 
-        print("Pulse width for maximum speed clockwise:", self.__max_cw_pw, "μs")
-        print("Pulse width for maximum speed counter-clockwise:", self.__max_ccw_pw, "μs", end="\n\n")
+        if step_response:
+            with self.__phase("calibrate.step_response"):
+                self.identify()
 
-        print("Calibration time:", round(time.time() - start_timestamp, 1), "s")
+        self.__print("Calibration time:", round(self.__pi.time() - start_timestamp, 1), "s")
 
         self.stop()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# parallax_group.py                                                           #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold a class to run many Parallax Servos at once             #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import parallax, calibration_scheduler
+from backend import PigpioBackend
+
+###############################################################################
+# Main class
+
+class ParallaxGroup:
+    """
+    A set of Parallax servos sharing a single backend (that is, a single
+    connection to the pigpio daemon). pigpio delivers the callbacks of
+    every gpio of a connection from the same thread, so the feedback of
+    every servo is read by one thread instead of one per servo.
+
+    run() computes the pulse width of every servo and sends them all in
+    one batched update (see Backend.set_servo_pulsewidths()), timing it.
+    """
+
+    def __init__(self, backend = None):
+        self.__owns_backend = backend is None
+
+        if backend is None:
+            backend = PigpioBackend()
+
+        self.backend = backend
+        self.servos = []
+
+        # Latency (s) of the batched updates
+
+        self.__updates = 0
+        self.__last_latency = 0.0
+        self.__total_latency = 0.0
+        self.__max_latency = 0.0
+
+    def add(self, c_pin, f_pin, servo_id = None):
+        # Creates a Parallax servo on the shared backend and returns it.
+
+        if servo_id is None:
+            servo_id = "servo" + str(len(self.servos))
+
+        servo = parallax.Parallax(c_pin, f_pin, backend = self.backend, servo_id = servo_id)
+        self.servos.append(servo)
+
+        return servo
+
+    def __getitem__(self, index):
+        return self.servos[index]
+
+    def __len__(self):
+        return len(self.servos)
+
+    def __iter__(self):
+        return iter(self.servos)
+
+    def run(self, powers = None):
+        # Runs every servo at the given power. "powers" might be a single value for every servo, a list with
+        # one value per servo, or a dictionary servo -> power (servos left out keep their power).
+        # If no power is given, every servo runs with its current power attribute.
+
+        if powers is None or isinstance(powers, (int, float)):
+            powers = {servo: powers for servo in self.servos}
+        elif not isinstance(powers, dict):
+            powers = dict(zip(self.servos, powers))
+
+        pulse_widths = {servo.control_pin: servo.run(power, apply = False) for servo, power in powers.items()}
+
+        start = self.backend.time()
+
+        self.backend.set_servo_pulsewidths(pulse_widths)
+
+        latency = self.backend.time() - start
+
+        self.__updates += 1
+        self.__last_latency = latency
+        self.__total_latency += latency
+        self.__max_latency = max(self.__max_latency, latency)
+
+    def stop(self):
+        # Stops every servo at once.
+
+        self.run(0)
+
+    def stats(self):
+        # Returns the number of batched updates sent and their latency (s): last, mean and max.
+
+        return {
+            "updates": self.__updates,
+            "last_latency": self.__last_latency,
+            "mean_latency": self.__total_latency / self.__updates if self.__updates else 0.0,
+            "max_latency": self.__max_latency
+        }
+
+    def calibrate(self, **calibrate_kwargs):
+        # Calibrates every servo concurrently (see calibration_scheduler.calibrate_all()).
+
+        return calibration_scheduler.calibrate_all(self.servos, **calibrate_kwargs)
+
+    def destroy(self):
+        # Stops every servo and releases the shared backend.
+
+        for servo in self.servos:
+            servo.destroy()
+
+        self.servos = []
+
+        if self.__owns_backend:
+            self.backend.stop()
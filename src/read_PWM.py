@@ -4,9 +4,34 @@
 # 2015-12-08
 # Public Domain
 
+import math
 import time
+import threading
+from array import array
 import pigpio # http://abyz.co.uk/rpi/pigpio/python.html
 
+# Filters available for the pulse width.  Measured cost per edge
+# (Python 3.11, x86-64, run benchmark.py to measure your own):
+#
+#  EWMA      exponentially weighted moving average of the pulse
+#            width.  ~1.1 μs.  Not suitable for angle feedback,
+#            since it blends linearly across the 0º/360º wrap.
+#  CIRCULAR  exponentially weighted moving average of the unit
+#            vector of the angle the duty cycle stands for.
+#            Wrap-aware.  ~1.4 μs (two trig calls and an atan2).
+#  MEDIAN    circular median of the last median_window angles,
+#            taken relative to the newest one.  Wrap-aware and
+#            rejects isolated glitches.  ~1.8 μs with the default
+#            window of 5 (a fixed size sort).
+#
+# Period gating adds up to ~0.4 μs per edge and turn counting
+# ~0.6 μs per edge.  At 910 Hz there are 1820 edges per second,
+# so any of them uses well under 1 % of a core.
+
+EWMA = 0
+CIRCULAR = 1
+MEDIAN = 2
+
 class reader:
    """
    A class to read PWM pulses and calculate their frequency
@@ -14,7 +39,11 @@ class reader:
    happens per second.  The duty cycle is the percentage of
    pulse high time per cycle.
    """
-   def __init__(self, pi, gpio, weighting=0.0):
+   def __init__(self, pi, gpio, weighting=0.0, buffer_size=0,
+                filter_mode=EWMA, median_window=5, period_gating=False,
+                nominal_frequency=910.0, period_tolerance=0.1,
+                dc_range=(2.9, 97.1), turn_counting=False, lap_history=64,
+                instrumentation=None):
       """
       Instantiate with the Pi and gpio of the PWM signal
       to monitor.
@@ -24,6 +53,32 @@ class reader:
       affects the new reading.  It defaults to 0 which means
       the old reading has no effect.  This may be used to
       smooth the data.
+
+      Optionally a buffer size may be specified.  If it is not 0
+      the tick and level of the last buffer_size edges are kept
+      on a circular buffer, which can be read in batches with
+      snapshot() and since().
+
+      Optionally a filter mode may be specified (EWMA, CIRCULAR or
+      MEDIAN).  CIRCULAR and MEDIAN treat the duty cycle as an
+      angle, dc_range being the duty cycles at 0º and 360º, so the
+      wrap between both ends does not produce nonsense values.
+      CIRCULAR uses weighting as its smoothing factor and MEDIAN
+      uses median_window samples.
+
+      Optionally periods may be gated.  Periods further than
+      period_tolerance (relative) from 1/nominal_frequency are
+      counted as glitches and dropped, along with their pulse.
+
+      Optionally turns may be counted.  The filtered duty cycle is
+      taken as an angle (see dc_range) and unwrapped on every
+      period, so every crossing of the 0º/360º boundary is timed
+      to the microsecond with the pigpio ticks (interpolating
+      between the periods around it).  The tick and direction of
+      the last lap_history crossings are kept.
+
+      Optionally an instrumentation.Instrumentation object may be
+      given (see set_instrumentation()).
       """
       self.pi = pi
       self.gpio = gpio
@@ -40,21 +95,115 @@ class reader:
       self._period = None
       self._high = None
 
+      self._filter_mode = filter_mode
+      self._min_dc, self._max_dc = dc_range
+
+      self._x = None # Unit vector of the CIRCULAR filter.
+      self._y = None
+
+      self._window = [0.0] * median_window # Angles (º) of the MEDIAN filter.
+      self._window_count = 0
+      self._window_pos = 0
+
+      # With period gating, the pulse of each period is held until the
+      # period ends and is known to be valid.
+
+      self._gating = period_gating
+      nominal_period = 1000000.0 / nominal_frequency
+      self._min_period = nominal_period * (1.0 - period_tolerance)
+      self._max_period = nominal_period * (1.0 + period_tolerance)
+      self._pending_high = None
+      self._glitches = 0
+
+      # Number of complete periods seen, and a condition notified
+      # whenever a new one is seen, so callers can sleep until then.
+
+      self._periods = 0
+      self._period_cond = threading.Condition()
+
+      # Functions called (from the callback thread) whenever a new
+      # period is seen.  They should return quickly.
+
+      self._listeners = []
+
+      # Turn counter.  Positive turns are counter-clockwise, that is,
+      # increasing angles.
+
+      self._turn_counting = turn_counting
+      self._position = None # Unwrapped angle (º) of the last period.
+      self._position_tick = None
+      self._turns = 0
+      self._direction = 0
+      self._lap_tick = None # Tick of the last boundary crossing.
+      self._lap_period = None # μs between the last two crossings.
+      self._laps = 0 # Crossings seen so far.
+      self._lap_ticks = array('I', [0]) * lap_history
+      self._lap_directions = array('b', [0]) * lap_history
+
+      # The edge buffer is allocated once.  Every edge is written
+      # twice, at its position and at its position plus the buffer
+      # size, so the last buffer_size edges are always contiguous
+      # and can be handed out as views without copying them.
+
+      self._buffer_size = buffer_size
+      self._edges = 0 # Edges written so far
+      self._buffer_pos = 0
+
+      if buffer_size > 0:
+         self._buffer_ticks = array('I', [0]) * (2 * buffer_size)
+         self._buffer_levels = array('B', [0]) * (2 * buffer_size)
+         self._np_ticks = None
+         self._np_levels = None
+
+      # Instrumentation.  The callback latency is the time between
+      # the tick of an edge and the moment it reaches Python, beyond
+      # the lowest seen (the clocks of the pi and the daemon do not
+      # share their origin).
+
+      self._instrumentation = instrumentation
+      self._lat_tick = None
+      self._lat_ticks = 0 # Unwrapped tick of the last edge.
+      self._lat_base = None
+
       pi.set_mode(gpio, pigpio.INPUT)
 
-      self._cb = pi.callback(gpio, pigpio.EITHER_EDGE, self._cbf)
+      self._cb = pi.callback(gpio, pigpio.EITHER_EDGE, self._callback())
 
    def _cbf(self, gpio, level, tick):
 
+      if self._buffer_size:
+         pos = self._buffer_pos
+         mirror = pos + self._buffer_size
+
+         self._buffer_ticks[pos] = tick
+         self._buffer_ticks[mirror] = tick
+         self._buffer_levels[pos] = level
+         self._buffer_levels[mirror] = level
+
+         pos += 1
+         if pos == self._buffer_size:
+            pos = 0
+         self._buffer_pos = pos
+
+         self._edges += 1 # Last, so readers never see an edge half written.
+
       if level == 1:
 
          if self._high_tick is not None:
             t = pigpio.tickDiff(self._high_tick, tick)
 
-            if self._period is not None:
-               self._period = (self._old * self._period) + (self._new * t)
+            if self._gating and not self._min_period <= t <= self._max_period:
+               self._glitches += 1
+               self._pending_high = None
             else:
-               self._period = t
+               if self._period is not None:
+                  self._period = (self._old * self._period) + (self._new * t)
+               else:
+                  self._period = t
+
+               if self._pending_high is not None:
+                  self._update_high(self._pending_high, t)
+                  self._pending_high = None
 
          self._high_tick = tick
 
@@ -63,10 +212,211 @@ class reader:
          if self._high_tick is not None:
             t = pigpio.tickDiff(self._high_tick, tick)
 
-            if self._high is not None:
-               self._high = (self._old * self._high) + (self._new * t)
+            if self._gating:
+               self._pending_high = t
+            else:
+               self._update_high(t, self._period)
+
+   def _callback(self):
+      # Without instrumentation the plain callback is registered, so
+      # it costs nothing at all.
+
+      if self._instrumentation is None:
+         return self._cbf
+
+      return self._cbf_instrumented
+
+   def _cbf_instrumented(self, gpio, level, tick):
+
+      stats = self._instrumentation
+      now = stats.clock() * 1000000.0
+
+      if self._lat_tick is not None:
+         dt = pigpio.tickDiff(self._lat_tick, tick)
+         self._lat_ticks += dt
+
+         offset = now - self._lat_ticks
+
+         # The base creeps up 0.05 μs per edge (~90 ppm at 910 Hz),
+         # so drift between both clocks does not add up as latency.
+
+         if self._lat_base is None or offset < self._lat_base + 0.05:
+            self._lat_base = offset
+         else:
+            self._lat_base += 0.05
+
+         stats.observe("callback_latency_us", offset - self._lat_base)
+
+         if level == 1 and self._high_tick is not None:
+            missed = round(pigpio.tickDiff(self._high_tick, tick) /
+                           (self._min_period + self._max_period) * 2.0) - 1
+
+            if missed > 0:
+               stats.count("missed_periods", missed)
+
+      else:
+         self._lat_base = now
+
+      self._lat_tick = tick
+
+      glitches = self._glitches
+      self._cbf(gpio, level, tick)
+
+      stats.count("edges")
+
+      if self._glitches != glitches:
+         stats.count("glitches")
+
+   def set_instrumentation(self, instrumentation):
+      """
+      Starts (or stops, if None) measuring the edges seen, the
+      glitches, the missed periods and the callback latency on
+      the given instrumentation.Instrumentation object.
+      """
+      self._instrumentation = instrumentation
+      self._lat_tick = None
+
+      self._cb.cancel()
+      self._cb = self.pi.callback(self.gpio, pigpio.EITHER_EDGE,
+                                  self._callback())
+
+   def _update_high(self, t, period):
+
+      if self._filter_mode == EWMA or period is None:
+
+         if self._high is not None:
+            self._high = (self._old * self._high) + (self._new * t)
+         else:
+            self._high = t
+
+      else:
+
+         # The pulse is turned into the angle it stands for.
+
+         span = self._max_dc - self._min_dc
+         angle = (100.0 * t / period - self._min_dc) * 360.0 / span
+
+         if self._filter_mode == CIRCULAR:
+            r = math.radians(angle)
+
+            if self._x is not None:
+               self._x = (self._old * self._x) + (self._new * math.cos(r))
+               self._y = (self._old * self._y) + (self._new * math.sin(r))
             else:
-               self._high = t
+               self._x = math.cos(r)
+               self._y = math.sin(r)
+
+            angle = math.degrees(math.atan2(self._y, self._x))
+
+         else: # MEDIAN
+
+            window = self._window
+            window[self._window_pos] = angle
+            self._window_pos = (self._window_pos + 1) % len(window)
+
+            if self._window_count < len(window):
+               self._window_count += 1
+
+            # Every angle is taken relative to the newest one, in the
+            # -180º, 180º range, so the wrap does not split the window.
+
+            relative = sorted(((a - angle + 180.0) % 360.0) - 180.0
+                              for a in window[:self._window_count])
+
+            angle += relative[len(relative) // 2]
+
+         self._high = ((angle % 360.0) * span / 360.0 + self._min_dc) * period / 100.0
+
+      if self._turn_counting and period is not None:
+         self._count_turns(period)
+
+      with self._period_cond:
+         self._periods += 1
+         self._period_cond.notify_all()
+
+      for listener in self._listeners:
+         listener()
+
+   def _count_turns(self, period):
+
+      angle = ((100.0 * self._high / period - self._min_dc) * 360.0 /
+               (self._max_dc - self._min_dc))
+
+      # The pulse of the current period started on its rising edge.
+
+      tick = self._high_tick
+      last = self._position
+
+      if last is None:
+         self._position = angle % 360.0
+         self._position_tick = tick
+         return
+
+      # Less than half a turn per period is assumed (~160000 º/s).
+
+      step = ((angle - last + 180.0) % 360.0) - 180.0
+      position = last + step
+      turn = math.floor(position / 360.0)
+
+      if turn != self._turns:
+
+         if turn > self._turns:
+            direction = 1
+            boundary = turn * 360.0
+         else:
+            direction = -1
+            boundary = self._turns * 360.0
+
+         # The moment the boundary was crossed is interpolated
+         # between both periods.
+
+         lap_tick = (self._position_tick + int((boundary - last) / step *
+                     pigpio.tickDiff(self._position_tick, tick))) & 0xFFFFFFFF
+
+         if direction == self._direction and self._lap_tick is not None:
+            self._lap_period = pigpio.tickDiff(self._lap_tick, lap_tick)
+         else:
+            self._lap_period = None
+
+         pos = self._laps % len(self._lap_ticks)
+         self._lap_ticks[pos] = lap_tick
+         self._lap_directions[pos] = direction
+
+         self._direction = direction
+         self._lap_tick = lap_tick
+         self._turns = turn
+         self._laps += 1
+
+      self._position = position
+      self._position_tick = tick
+
+   def add_listener(self, func):
+      """
+      Calls func() from the callback thread on every new period.
+      """
+      self._listeners = self._listeners + [func]
+
+   def remove_listener(self, func):
+      """
+      Stops calling a function added with add_listener().  Functions
+      are compared by equality, so a bound method might be given
+      again (a new but equal object) to remove it.
+      """
+      self._listeners = [f for f in self._listeners if f != func]
+
+   def set_dc_range(self, min_dc, max_dc):
+      """
+      Sets the duty cycles standing for 0º and 360º, used by the
+      CIRCULAR and MEDIAN filters.
+      """
+      self._min_dc = min_dc
+      self._max_dc = max_dc
+
+   def glitches(self):
+      """
+      Returns the number of periods dropped by period gating.
+      """
+      return self._glitches
 
    def frequency(self):
       """
@@ -95,6 +445,171 @@ class reader:
       else:
          return 0.0
 
+   def periods(self):
+      """
+      Returns the number of complete periods seen so far.
+      """
+      return self._periods
+
+   def wait_for_periods(self, count=1, timeout=None):
+      """
+      Blocks until count new periods have been seen, or until
+      timeout seconds have passed.  Returns True if the periods
+      were seen and False on timeout.
+
+      The wait is done through the pi object if it provides a
+      wait_for() method (see backend.py), so simulated pis can
+      move their own clock while waiting.
+      """
+      target = self._periods + count
+      predicate = lambda: self._periods >= target
+
+      wait_for = getattr(self.pi, "wait_for", None)
+
+      if wait_for is not None:
+         return wait_for(self._period_cond, predicate, timeout)
+
+      with self._period_cond:
+         return self._period_cond.wait_for(predicate, timeout)
+
+   def edges(self):
+      """
+      Returns the number of edges written to the buffer so far.
+      This is the sequence number to pass to since() in order to
+      get the edges seen from now on.
+      """
+      return self._edges
+
+   def snapshot(self, as_numpy=True):
+      """
+      Returns (ticks, levels, seq) with every edge held by the
+      buffer, oldest first.  See since(): once the buffer is full
+      these views must be copied before the next edge arrives.
+      """
+      return self.since(0, as_numpy)
+
+   def since(self, seq, as_numpy=True):
+      """
+      Returns (ticks, levels, next_seq) with the edges written
+      since the sequence number seq, oldest first.  If more than
+      buffer_size edges were written since then, only the last
+      buffer_size are returned.  next_seq is the sequence number
+      to pass on the next call.
+
+      ticks and levels are NumPy views (or memoryviews if as_numpy
+      is False) on the buffer itself, so nothing is copied.  Every
+      new edge overwrites the slot of the oldest one, so views of
+      count edges only remain valid until buffer_size - count more
+      edges are written: a view of the whole buffer (snapshot(), or
+      since() after an overflow) is spoiled by the very next edge.
+      Copy them (e.g. numpy.array(ticks)) to keep them any longer.
+      """
+      if not self._buffer_size:
+         raise RuntimeError("reader created without buffer")
+
+      edges = self._edges
+      count = min(edges - seq, self._buffer_size)
+
+      if count < 0:
+         count = 0
+
+      # The position after the last edge written, as seen when
+      # "edges" was read.
+
+      end = edges % self._buffer_size
+      if count > end:
+         end += self._buffer_size
+      start = end - count
+
+      if as_numpy:
+         if self._np_ticks is None:
+            import numpy
+
+            self._np_ticks = numpy.frombuffer(self._buffer_ticks, dtype=numpy.uint32)
+            self._np_levels = numpy.frombuffer(self._buffer_levels, dtype=numpy.uint8)
+
+         return self._np_ticks[start:end], self._np_levels[start:end], edges
+
+      return (memoryview(self._buffer_ticks)[start:end],
+              memoryview(self._buffer_levels)[start:end], edges)
+
+   def turns(self):
+      """
+      Returns the number of turns counted so far, positive if
+      counter-clockwise.
+      """
+      return self._turns
+
+   def turns_since(self, tick):
+      """
+      Returns the number of turns counted since the given tick,
+      positive if counter-clockwise.  Only the last lap_history
+      crossings are taken into account.
+      """
+      size = len(self._lap_ticks)
+      laps = self._laps
+      turns = 0
+
+      for n in range(laps - 1, max(laps - size, 0) - 1, -1):
+         pos = n % size
+
+         if (self._lap_ticks[pos] - tick) & 0xFFFFFFFF >= 0x80000000:
+            break # Crossed before the tick.
+
+         turns += self._lap_directions[pos]
+
+      return turns
+
+   def position(self):
+      """
+      Returns the unwrapped angle (º) of the last period, or None
+      if no turn counting is done.
+      """
+      return self._position
+
+   def lap_tick(self):
+      """
+      Returns the tick of the last 0º/360º boundary crossing, or
+      None if none was seen yet.
+      """
+      return self._lap_tick
+
+   def lap_period(self):
+      """
+      Returns the μs between the last two boundary crossings in
+      the same direction, or None if there are none.
+      """
+      return self._lap_period
+
+   def direction(self):
+      """
+      Returns the direction of the last boundary crossing: 1 if
+      counter-clockwise, -1 if clockwise, 0 if none was seen yet.
+      """
+      return self._direction
+
+   def rpm(self):
+      """
+      Returns the revolutions per minute, positive if counter-
+      clockwise, from the last lap period.  If the current lap
+      is already longer than that, it is used instead, so the
+      value decays when the axle slows down or stops.
+      """
+      if self._lap_period is None:
+         return 0.0
+
+      period = max(self._lap_period,
+                   pigpio.tickDiff(self._lap_tick, self._high_tick))
+
+      return self._direction * 60000000.0 / period
+
+   def tick(self):
+      """
+      Returns the tick of the last rising edge, or None if no
+      edge has been seen yet.
+      """
+      return self._high_tick
+
    def cancel(self):
       """
       Cancels the reader and releases resources.
@@ -0,0 +1,605 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# servo_daemon.py                                                             #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will share calibrated Parallax Servos through a Unix socket       #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import collections, json, math, os, selectors, socket, struct, threading
+
+# parallax (and pigpio) are only imported by main(), so clients start without them.
+
+###############################################################################
+# Protocol
+
+# Every message is a 4 bytes header (type, servo index, payload length), little-endian, followed by its
+# payload. Clients send requests, one at a time, and the daemon answers each of them with OK (plus its
+# result, if any) or ERROR (plus a UTF-8 message). Feedback samples of the servos subscribed to are sent
+# as SAMPLE messages between them.
+
+DEFAULT_SOCKET_PATH = os.path.join(os.path.expanduser("~"), ".parallax", "servo.sock")
+
+_HEADER = struct.Struct("<BBH")
+
+# Requests
+
+RUN = 1 # <b: power, as Parallax.run() (negative means counter-clockwise)
+STOP = 2
+PULSE_WIDTH = 3 # <H: pulse width (μs), as Parallax.send_pulse_width()
+GOTO = 4 # <f: angle (º), as Parallax.goto_angle()
+SUBSCRIBE = 5 # <H: send every n-th feedback sample
+UNSUBSCRIBE = 6
+STATUS = 7
+CALIBRATION = 8
+STATS = 9
+SERVOS = 10
+
+# Replies
+
+OK = 128
+ERROR = 129
+SAMPLE = 130 # <Ifd: feedback tick (μs), angle (º), unwrapped position (º)
+
+_BYTE = struct.Struct("<b")
+_WORD = struct.Struct("<H")
+_FLOAT = struct.Struct("<f")
+_SAMPLE = struct.Struct("<Ifd")
+_STATUS = struct.Struct("<Ifdfb") # Feedback tick, angle, unwrapped position, RPM, power
+
+###############################################################################
+# Daemon
+
+class _Client:
+
+    def __init__(self, sock, max_queue):
+        self.sock = sock
+
+        self.inbox = bytearray()
+        self.outbox = bytearray() # Replies, and samples taken from the queue, waiting for the socket
+
+        self.samples = collections.deque() # Encoded samples, filled from the feedback callback thread
+        self.max_queue = max_queue
+
+        self.every = {} # Servo index -> send one sample out of that many
+        self.skipped = {} # Servo index -> samples skipped since the last one queued
+
+        self.queued = 0
+        self.dropped = 0
+
+class ServoDaemon:
+    """
+    Serves the given (already calibrated) Parallax servos to any number of
+    local clients (see ServoClient) through a Unix domain socket, using the
+    binary protocol above.
+
+    Requests are handled one at a time by a single thread, which also
+    writes every reply. Feedback samples are encoded once per period on
+    the pigpio callback thread and pushed onto the queue of each
+    subscriber; a queue holds at most max_queue samples, the oldest ones
+    being dropped (and counted) when a client does not keep up, so a slow
+    client never delays the others nor the servos.
+    """
+
+    def __init__(self, servos, path = DEFAULT_SOCKET_PATH, max_queue = 256, max_outbox = 65536):
+        self.servos = list(servos)
+        self.path = path
+
+        self.max_queue = max_queue
+        self.max_outbox = max_outbox # Bytes waiting for a client socket beyond which samples are left queued
+
+        self.__clients = {} # Socket -> _Client
+        self.__subscribers = [()] * len(self.servos) # Servo index -> clients subscribed (replaced, never modified)
+        self.__listeners = []
+
+        self.__selector = None
+        self.__server = None
+        self.__wake_r, self.__wake_w = os.pipe()
+        self.__wake_pending = False
+        self.__running = False
+
+        self.__counters = {"clients": 0, "requests": 0, "errors": 0, "samples": 0, "dropped": 0}
+
+    ###########################################################################
+    # Public API
+
+    def serve_forever(self):
+        self.__listen()
+
+        try:
+            while self.__running:
+                for key, events in self.__selector.select():
+                    if key.fileobj is self.__server:
+                        self.__accept()
+                    elif key.fileobj == self.__wake_r:
+                        os.read(self.__wake_r, 4096)
+                        self.__wake_pending = False
+
+                        for client in list(self.__clients.values()):
+                            if client.samples:
+                                self.__flush(client)
+                    else:
+                        client = self.__clients.get(key.fileobj)
+
+                        if client is not None and events & selectors.EVENT_READ:
+                            self.__receive(client)
+
+                        if client is not None and events & selectors.EVENT_WRITE and client.sock in self.__clients:
+                            self.__flush(client)
+        finally:
+            self.__close()
+
+    def start(self):
+        # Serves from a background thread.
+
+        self.__listen()
+
+        thread = threading.Thread(target=self.serve_forever, name="parallax-daemon", daemon=True)
+        thread.start()
+
+    def stop(self):
+        self.__running = False
+        self.__wake()
+
+    def stats(self):
+        # Returns the number of clients served, requests handled (and failed), and samples queued and dropped,
+        # along with the samples queued and dropped for every client connected.
+
+        stats = dict(self.__counters)
+        stats["connected"] = [{"queued": c.queued, "dropped": c.dropped} for c in list(self.__clients.values())]
+
+        return stats
+
+    ###########################################################################
+    # Connections
+
+    def __listen(self):
+        if self.__running:
+            return
+
+        directory = os.path.dirname(self.path)
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # A socket file left by a daemon that died is removed, but never the one of a daemon still running.
+
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                probe.close()
+                raise RuntimeError("A daemon is already serving on " + self.path)
+
+            probe.close()
+
+        self.__server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__server.bind(self.path)
+        self.__server.listen()
+        self.__server.setblocking(False)
+
+        self.__selector = selectors.DefaultSelector()
+        self.__selector.register(self.__server, selectors.EVENT_READ)
+        self.__selector.register(self.__wake_r, selectors.EVENT_READ)
+
+        for index, servo in enumerate(self.servos):
+            listener = self.__feedback_listener(index, servo)
+            servo.add_feedback_listener(listener)
+            self.__listeners.append((servo, listener))
+
+        self.__running = True
+
+    def __close(self):
+        for servo, listener in self.__listeners:
+            servo.remove_feedback_listener(listener)
+
+        self.__listeners = []
+
+        for client in list(self.__clients.values()):
+            self.__drop(client)
+
+        self.__selector.close()
+        self.__server.close()
+
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __accept(self):
+        try:
+            sock, _ = self.__server.accept()
+        except BlockingIOError:
+            return
+
+        sock.setblocking(False)
+
+        self.__clients[sock] = _Client(sock, self.max_queue)
+        self.__selector.register(sock, selectors.EVENT_READ)
+        self.__counters["clients"] += 1
+
+    def __drop(self, client):
+        self.__unsubscribe(client)
+
+        self.__selector.unregister(client.sock)
+        del self.__clients[client.sock]
+
+        client.sock.close()
+
+    def __receive(self, client):
+        try:
+            data = client.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if not data:
+            self.__drop(client)
+            return
+
+        client.inbox += data
+
+        while len(client.inbox) >= _HEADER.size:
+            kind, index, length = _HEADER.unpack_from(client.inbox)
+
+            if len(client.inbox) < _HEADER.size + length:
+                break
+
+            payload = bytes(client.inbox[_HEADER.size:_HEADER.size + length])
+            del client.inbox[:_HEADER.size + length]
+
+            self.__reply(client, index, *self.__handle(client, kind, index, payload))
+
+        self.__flush(client)
+
+    def __reply(self, client, index, kind, payload = b""):
+        client.outbox += _HEADER.pack(kind, index, len(payload)) + payload
+
+    def __flush(self, client):
+        # Moves queued samples to the outbox (while it is not too full) and writes as much as the socket takes.
+
+        samples = client.samples
+
+        while samples and len(client.outbox) < self.max_outbox:
+            client.outbox += samples.popleft()
+
+        if client.outbox:
+            try:
+                sent = client.sock.send(client.outbox)
+            except (BlockingIOError, InterruptedError):
+                sent = 0
+            except OSError:
+                self.__drop(client)
+                return
+
+            del client.outbox[:sent]
+
+        events = selectors.EVENT_READ
+
+        if client.outbox or samples:
+            events |= selectors.EVENT_WRITE
+
+        self.__selector.modify(client.sock, events)
+
+    ###########################################################################
+    # Requests
+
+    def __handle(self, client, kind, index, payload):
+        # Returns the reply (type and payload) to the given request.
+
+        self.__counters["requests"] += 1
+
+        if kind == SERVOS:
+            return OK, json.dumps([servo.servo_id for servo in self.servos]).encode()
+
+        if kind == STATS:
+            return OK, json.dumps(self.stats()).encode()
+
+        if index >= len(self.servos):
+            return self.__error("No servo " + str(index))
+
+        servo = self.servos[index]
+
+        try:
+            # Open loop commands release the controller a GOTO might have left running, which would
+            # overwrite them on the next feedback period.
+
+            if kind == RUN:
+                power = _BYTE.unpack(payload)[0]
+                servo.release()
+                servo.run(power)
+            elif kind == STOP:
+                servo.stop()
+            elif kind == PULSE_WIDTH:
+                pulse_width = _WORD.unpack(payload)[0]
+                servo.release()
+                servo.send_pulse_width(pulse_width)
+            elif kind == GOTO:
+                servo.goto_angle(_FLOAT.unpack(payload)[0])
+            elif kind == SUBSCRIBE:
+                self.__subscribe(client, index, max(_WORD.unpack(payload)[0], 1))
+            elif kind == UNSUBSCRIBE:
+                self.__unsubscribe(client, index)
+            elif kind == STATUS:
+                return OK, self.__status(servo)
+            elif kind == CALIBRATION:
+                return OK, json.dumps(servo.get_calibration()).encode()
+            else:
+                return self.__error("Unknown request " + str(kind))
+        except Exception as e: # Any failure is reported to the client, the daemon keeps serving the others
+            return self.__error(str(e) or type(e).__name__)
+
+        return OK, b""
+
+    def __error(self, message):
+        self.__counters["errors"] += 1
+
+        return ERROR, message.encode()
+
+    def __status(self, servo):
+        power = servo.get_power()
+
+        if servo.rotation_direction is servo.COUNTER_CLOCKWISE:
+            power = -power
+
+        tick = servo.get_feedback_tick()
+        position = servo.get_position()
+
+        return _STATUS.pack(tick or 0, servo.get_angle(), math.nan if position is None else position, servo.get_rpm() or 0.0, round(power))
+
+    ###########################################################################
+    # Feedback fan-out
+
+    def __subscribe(self, client, index, every):
+        client.every[index] = every
+        client.skipped[index] = every - 1 # The next sample is sent right away
+
+        if client not in self.__subscribers[index]:
+            self.__subscribers[index] = self.__subscribers[index] + (client,)
+
+    def __unsubscribe(self, client, index = None):
+        for i in (range(len(self.servos)) if index is None else (index,)):
+            client.every.pop(i, None)
+            self.__subscribers[i] = tuple(c for c in self.__subscribers[i] if c is not client)
+
+    def __feedback_listener(self, index, servo):
+        header = _HEADER.pack(SAMPLE, index, _SAMPLE.size)
+
+        def on_feedback():
+            # Runs on the pigpio callback thread, once per feedback period.
+
+            subscribers = self.__subscribers[index]
+
+            if not subscribers:
+                return
+
+            position = servo.get_position()
+            sample = header + _SAMPLE.pack(servo.get_feedback_tick() or 0, servo.get_angle(), math.nan if position is None else position)
+
+            queued = False
+
+            for client in subscribers:
+                every = client.every.get(index)
+
+                if every is None:
+                    continue
+
+                skipped = client.skipped[index] + 1
+
+                if skipped < every:
+                    client.skipped[index] = skipped
+                    continue
+
+                client.skipped[index] = 0
+
+                if len(client.samples) >= client.max_queue:
+                    client.samples.popleft()
+                    client.dropped += 1
+                    self.__counters["dropped"] += 1
+
+                client.samples.append(sample)
+                client.queued += 1
+                self.__counters["samples"] += 1
+
+                queued = True
+
+            if queued:
+                self.__wake()
+
+        return on_feedback
+
+    def __wake(self):
+        # Wakes the serving thread up, once no matter how many samples are queued meanwhile.
+
+        if self.__wake_pending:
+            return
+
+        self.__wake_pending = True
+
+        try:
+            os.write(self.__wake_w, b"\0")
+        except OSError:
+            pass
+
+###############################################################################
+# Client
+
+class ServoClient:
+    """
+    Runs a servo served by a ServoDaemon. Connecting takes milliseconds:
+    the daemon already owns the calibrated servo. Requests block until the
+    daemon answers them, raising RuntimeError with its message on failure.
+
+    After subscribe(), feedback samples are kept (at most max_samples,
+    the oldest ones being dropped) until taken with next_sample().
+    """
+
+    def __init__(self, path = DEFAULT_SOCKET_PATH, servo = 0, max_samples = 1024):
+        self.servo = servo # Index of the servo on the daemon
+
+        self.__sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.__sock.connect(path)
+
+        self.__inbox = bytearray()
+        self.__samples = collections.deque(maxlen=max_samples)
+
+    def run(self, power):
+        self.__request(RUN, _BYTE.pack(round(power)))
+
+    def stop(self):
+        self.__request(STOP)
+
+    def send_pulse_width(self, pulse_width):
+        self.__request(PULSE_WIDTH, _WORD.pack(round(pulse_width)))
+
+    def goto_angle(self, angle):
+        self.__request(GOTO, _FLOAT.pack(angle))
+
+    def subscribe(self, every = 1):
+        # Asks for every n-th feedback sample of the servo.
+
+        self.__request(SUBSCRIBE, _WORD.pack(every))
+
+    def unsubscribe(self):
+        self.__request(UNSUBSCRIBE)
+
+    def status(self):
+        tick, angle, position, rpm, power = _STATUS.unpack(self.__request(STATUS))
+
+        return {"tick": tick, "angle": angle, "position": position, "rpm": rpm, "power": power}
+
+    def get_calibration(self):
+        return json.loads(self.__request(CALIBRATION))
+
+    def servos(self):
+        # Returns the ids of the servos served, by index.
+
+        return json.loads(self.__request(SERVOS))
+
+    def stats(self):
+        # Returns the statistics of the daemon (see ServoDaemon.stats()).
+
+        return json.loads(self.__request(STATS))
+
+    def next_sample(self, timeout = None):
+        """
+        Returns the oldest feedback sample received as (tick, angle,
+        position), waiting up to timeout seconds for one (None if none
+        arrived).
+        """
+
+        if not self.__samples:
+            self.__sock.settimeout(timeout)
+
+            try:
+                while not self.__samples:
+                    self.__read_message()
+            except socket.timeout:
+                return None
+            finally:
+                self.__sock.settimeout(None)
+
+        return self.__samples.popleft()
+
+    def close(self):
+        self.__sock.close()
+
+    def __request(self, kind, payload = b""):
+        self.__sock.sendall(_HEADER.pack(kind, self.servo, len(payload)) + payload)
+
+        while True:
+            kind, payload = self.__read_message()
+
+            if kind == OK:
+                return payload
+            if kind == ERROR:
+                raise RuntimeError(payload.decode())
+
+    def __read_message(self):
+        # Reads the next message, keeping it if it is a sample. Returns its type and payload.
+
+        while True:
+            if len(self.__inbox) >= _HEADER.size:
+                kind, index, length = _HEADER.unpack_from(self.__inbox)
+
+                if len(self.__inbox) >= _HEADER.size + length:
+                    payload = bytes(self.__inbox[_HEADER.size:_HEADER.size + length])
+                    del self.__inbox[:_HEADER.size + length]
+
+                    if kind == SAMPLE:
+                        self.__samples.append(_SAMPLE.unpack(payload))
+
+                    return kind, payload
+
+            data = self.__sock.recv(65536)
+
+            if not data:
+                raise ConnectionError("The daemon closed the connection")
+
+            self.__inbox += data
+
+###############################################################################
+# Main
+
+def main():
+    import argparse
+    import parallax
+
+    parser = argparse.ArgumentParser(description="Serves calibrated Parallax Servos through a Unix socket")
+    parser.add_argument("--socket", metavar="PATH", default=DEFAULT_SOCKET_PATH, help="socket path (default: %(default)s)")
+    parser.add_argument("--servo", metavar="ID:CONTROL:FEEDBACK", action="append",
+                        help="servo to serve, as its id and pins (default: default:14:15); might be repeated")
+    parser.add_argument("--simulate", action="store_true", help="serve simulated servos, running on real time")
+    args = parser.parse_args()
+
+    backend = None
+
+    if args.simulate:
+        import simulation
+
+        backend = simulation.SimulatedPi()
+
+    servos = []
+
+    for spec in args.servo or ["default:14:15"]:
+        servo_id, control_pin, feedback_pin = spec.split(":")
+
+        if backend is not None:
+            backend.attach(simulation.ServoPlant(), int(control_pin), int(feedback_pin))
+
+        servo = parallax.Parallax(int(control_pin), int(feedback_pin), backend=backend, servo_id=servo_id)
+
+        if backend is not None:
+            servo.calibrate(stop_search=servo.BISECTION_SEARCH, limit_search=servo.ADAPTIVE_SEARCH)
+        else:
+            servo.load_or_calibrate()
+
+        servos.append(servo)
+
+    if backend is not None:
+        backend.start_realtime()
+
+    daemon = ServoDaemon(servos, args.socket)
+
+    print("Serving", ", ".join(servo.servo_id for servo in servos), "on", args.socket)
+
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for servo in servos:
+            servo.destroy()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# simulation.py                                                               #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will simulate a Parallax Servo so it can be driven without a Pi   #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import heapq, itertools, math, random, threading, time, pigpio
+from backend import Backend, _Timer
+
+###############################################################################
+# Servo model
+
+class ServoPlant:
+    """
+    A simulated Parallax Feedback 360 High Speed Servo.
+
+    The axle speed is modelled after the control pulse width: no motion
+    inside the dead band, a monotone (and asymmetric) curve outside it and
+    a flat maximum speed beyond the saturation pulse widths. The axle
+    reaches the commanded speed through a first order lag (inertia) after
+    a small dead time.
+
+    Positive speeds mean counter-clockwise rotation, which increases the
+    angle reported on the feedback signal. The feedback signal is a PWM
+    running at ~910 Hz whose duty cycle goes from 2.9 % (0º) to 97.1 % (360º).
+    """
+
+    def __init__(self,
+                 min_cw_pw = 1476.0, min_ccw_pw = 1524.0,
+                 max_cw_pw = 1290.0, max_ccw_pw = 1712.0,
+                 max_cw_rpm = 125.0, max_ccw_rpm = 119.0,
+                 curve_exponent = 0.8,
+                 time_constant = 0.03, dead_time = 0.004,
+                 min_fb_dc = 2.9, max_fb_dc = 97.1,
+                 feedback_frequency = 910.0,
+                 tick_jitter = 1,
+                 start_angle = 0.0,
+                 seed = 0):
+
+        # Pulse widths (μs) where the servo starts moving and where it reaches
+        # its top speed, for both rotation directions.
+
+        self.min_cw_pw = min_cw_pw
+        self.min_ccw_pw = min_ccw_pw
+        self.max_cw_pw = max_cw_pw
+        self.max_ccw_pw = max_ccw_pw
+
+        self.max_cw_rpm = max_cw_rpm
+        self.max_ccw_rpm = max_ccw_rpm
+
+        # Speed grows as x^exponent, being x the normalized distance from the
+        # dead band to the saturation pulse width.
+
+        self.curve_exponent = curve_exponent
+
+        self.time_constant = time_constant
+        self.dead_time = dead_time
+
+        self.min_fb_dc = min_fb_dc
+        self.max_fb_dc = max_fb_dc
+
+        self.feedback_period = 1000000.0 / feedback_frequency # μs
+        self.tick_jitter = tick_jitter # ± μs added to every feedback edge
+
+        self.angle = start_angle # Unwrapped, in degrees
+        self.speed = 0.0 # Degrees per second
+
+        self.__random = random.Random(seed)
+
+        self.__pulse_width = 0
+        self.__commands = [] # Commands not applied yet (effective time, pulse width)
+
+        self.__now = 0.0 # Time (μs) the state above belongs to
+        self.__next_period = 0.0 # Time (μs) of the next rising edge on the feedback pin
+        self.__pending_edges = [] # Edges already generated but not emitted yet (time, level)
+
+    def target_speed(self, pulse_width):
+        """
+        Returns the steady-state speed (degrees per second) for the given
+        pulse width.
+        """
+
+        if pulse_width == 0 or self.min_cw_pw <= pulse_width <= self.min_ccw_pw:
+            return 0.0
+
+        if pulse_width < self.min_cw_pw:
+            x = (self.min_cw_pw - pulse_width) / (self.min_cw_pw - self.max_cw_pw)
+            sign = -1.0
+            max_rpm = self.max_cw_rpm
+        else:
+            x = (pulse_width - self.min_ccw_pw) / (self.max_ccw_pw - self.min_ccw_pw)
+            sign = 1.0
+            max_rpm = self.max_ccw_rpm
+
+        return sign * max_rpm * 6.0 * min(x, 1.0) ** self.curve_exponent
+
+    def command(self, now, pulse_width):
+        """
+        Registers a new control pulse width at the given time (μs).
+        """
+
+        self.__commands.append((now + self.dead_time * 1000000.0, pulse_width))
+
+    def __integrate(self, until):
+        # Moves the axle from the current state to the given time (μs) applying
+        # the commands whose dead time has already expired.
+
+        while self.__now < until:
+            step_end = until
+
+            if self.__commands and self.__commands[0][0] <= self.__now:
+                self.__pulse_width = self.__commands.pop(0)[1]
+                continue
+            elif self.__commands and self.__commands[0][0] < until:
+                step_end = self.__commands[0][0]
+
+            dt = (step_end - self.__now) / 1000000.0
+            target = self.target_speed(self.__pulse_width)
+            decay = math.exp(-dt / self.time_constant)
+
+            # Exact solution of the first order lag for a constant target speed.
+
+            new_speed = target + (self.speed - target) * decay
+            self.angle += target * dt + (self.speed - target) * self.time_constant * (1.0 - decay)
+            self.speed = new_speed
+
+            self.__now = step_end
+
+    def duty_cycle(self):
+        """
+        Returns the feedback duty cycle (%) for the current angle.
+        """
+
+        span = self.max_fb_dc - self.min_fb_dc
+
+        return self.min_fb_dc + span * (self.angle % 360.0) / 360.0
+
+    def next_edge_time(self):
+        """
+        Returns the time (μs) of the next feedback edge.
+        """
+
+        if not self.__pending_edges:
+            self.__generate_period()
+
+        return self.__pending_edges[0][0]
+
+    def pop_edge(self):
+        """
+        Returns the next feedback edge as (time in μs, level).
+        """
+
+        if not self.__pending_edges:
+            self.__generate_period()
+
+        return self.__pending_edges.pop(0)
+
+    def __generate_period(self):
+        # The feedback duty cycle is sampled at the beginning of each period.
+
+        start = self.__next_period
+        self.__integrate(start)
+
+        high = self.feedback_period * self.duty_cycle() / 100.0
+
+        rise = start + self.__jitter()
+        fall = start + high + self.__jitter()
+
+        self.__pending_edges.append((rise, 1))
+        self.__pending_edges.append((max(fall, rise + 1), 0))
+
+        self.__next_period = start + self.feedback_period
+
+    def __jitter(self):
+        if self.tick_jitter == 0:
+            return 0
+
+        return self.__random.randint(-self.tick_jitter, self.tick_jitter)
+
+###############################################################################
+# Simulated pigpio
+
+class _SimulatedCallback:
+
+    def __init__(self, owner, gpio, edge, func):
+        self.gpio = gpio
+        self.edge = edge
+        self.func = func
+        self.__owner = owner
+
+    def cancel(self):
+        self.__owner._remove_callback(self)
+
+class SimulatedPi(Backend):
+    """
+    A backend running one or more ServoPlant objects on simulated time.
+
+    Time only moves forward when the backend is used: every call to time()
+    consumes one polling quantum, every call to the daemon related methods
+    consumes one call latency and sleep() consumes the time requested.
+    Feedback edges are delivered synchronously to the registered callbacks
+    as soon as the simulated time reaches them, so the whole simulation is
+    deterministic and runs as fast as the host allows.
+
+    Once start_realtime() is called, the simulated time is only moved by
+    its pacing thread: time() returns clock(), and sleep() and wait_for()
+    block on real time like the pigpio backend.
+    """
+
+    def __init__(self, poll_quantum = 0.0001, call_latency = 0.00005, start_tick = 0):
+        super().__init__()
+
+        self.connected = True
+
+        self.poll_quantum = poll_quantum # Seconds consumed by each time() call
+        self.call_latency = call_latency # Seconds consumed by each "daemon" call
+
+        self.__start_tick = start_tick
+        self.__now = 0.0 # Simulated μs since the backend was created
+
+        self.__servos = {} # Control pin -> ServoPlant
+        self.__feedback_pins = {} # ServoPlant -> Feedback pin
+        self.__pulse_widths = {}
+        self.__callbacks = []
+
+        self.__timers = [] # Heap of (time, order, _Timer) set by call_later()
+        self.__timer_order = itertools.count()
+
+        self.__lock = threading.RLock()
+        self.__realtime = False
+
+    def attach(self, plant, control_pin, feedback_pin):
+        """
+        Wires a ServoPlant to the given control and feedback pins.
+        Returns the plant.
+        """
+
+        with self.__lock:
+            self.__servos[control_pin] = plant
+            self.__feedback_pins[plant] = feedback_pin
+            self.__pulse_widths[control_pin] = 0
+
+        return plant
+
+    def plant(self, control_pin):
+        """
+        Returns the ServoPlant wired to the given control pin.
+        """
+
+        return self.__servos[control_pin]
+
+    def advance(self, seconds):
+        """
+        Moves the simulated time forward, delivering every feedback edge
+        and running every timer found on the way.
+        """
+
+        with self.__lock:
+            target = self.__now + seconds * 1000000.0
+
+            while True:
+                plant = None
+                edge_time = math.inf
+
+                if self.__servos:
+                    plant = min(self.__feedback_pins, key = lambda p: p.next_edge_time())
+                    edge_time = plant.next_edge_time()
+
+                timer_time = self.__timers[0][0] if self.__timers else math.inf
+
+                if min(edge_time, timer_time) > target:
+                    break
+
+                if timer_time <= edge_time:
+                    _, _, timer = heapq.heappop(self.__timers)
+                    self.__now = max(self.__now, timer_time)
+
+                    if not timer.cancelled:
+                        timer.func()
+                else:
+                    edge_time, level = plant.pop_edge()
+                    self.__now = max(self.__now, edge_time)
+                    self.__deliver(self.__feedback_pins[plant], level, self.__tick(edge_time))
+
+            # Timers might have used the backend, moving the time beyond the target already.
+
+            self.__now = max(self.__now, target)
+
+    def start_realtime(self, step = 0.005):
+        """
+        Moves the simulated time along with the real one from a background
+        thread (every step seconds), so the simulated servos can be driven
+        interactively (e.g. by myServo.py or servo_daemon.py). From then
+        on no other thread moves the simulated time.
+        """
+
+        self.__realtime = True
+
+        def pace():
+            last = time.perf_counter()
+
+            while self.connected:
+                time.sleep(step)
+
+                now = time.perf_counter()
+                self.advance(now - last)
+                last = now
+
+        threading.Thread(target=pace, name="parallax-simulation", daemon=True).start()
+
+    def __next_event_time(self):
+        # Time (μs) of the next feedback edge or timer, whichever comes first.
+
+        next_event = self.__timers[0][0] if self.__timers else math.inf
+
+        if self.__servos:
+            next_event = min(next_event, min(p.next_edge_time() for p in self.__feedback_pins))
+
+        return next_event
+
+    def __spend(self, seconds):
+        # Time consumed by the caller itself (polling, daemon calls), unless it is paced by start_realtime().
+
+        if not self.__realtime:
+            self.advance(seconds)
+
+    def __tick(self, now):
+        return (self.__start_tick + int(now)) & 0xFFFFFFFF
+
+    def __deliver(self, gpio, level, tick):
+        for cb in list(self.__callbacks):
+            if cb.gpio != gpio:
+                continue
+
+            if (cb.edge == pigpio.EITHER_EDGE or
+                (cb.edge == pigpio.RISING_EDGE and level == 1) or
+                (cb.edge == pigpio.FALLING_EDGE and level == 0)):
+                cb.func(gpio, level, tick)
+
+    def _remove_callback(self, cb):
+        with self.__lock:
+            if cb in self.__callbacks:
+                self.__callbacks.remove(cb)
+
+    def set_servo_pulsewidth(self, gpio, pulsewidth):
+        if pulsewidth != 0 and not 500 <= pulsewidth <= 2500:
+            raise pigpio.error(pigpio.error_text(pigpio.PI_BAD_PULSEWIDTH))
+
+        with self.__lock:
+            self.__spend(self.call_latency)
+
+            self.__pulse_widths[gpio] = pulsewidth
+
+            if gpio in self.__servos:
+                self.__servos[gpio].command(self.__now, pulsewidth)
+
+        return 0
+
+    def set_servo_pulsewidths(self, pulsewidths):
+        # Like a pigpio script: a single call latency for the whole batch.
+
+        for pulsewidth in pulsewidths.values():
+            if pulsewidth != 0 and not 500 <= pulsewidth <= 2500:
+                raise pigpio.error(pigpio.error_text(pigpio.PI_BAD_PULSEWIDTH))
+
+        with self.__lock:
+            self.__spend(self.call_latency)
+
+            for gpio, pulsewidth in pulsewidths.items():
+                self.__pulse_widths[gpio] = pulsewidth
+
+                if gpio in self.__servos:
+                    self.__servos[gpio].command(self.__now, pulsewidth)
+
+        return 0
+
+    def get_servo_pulsewidth(self, gpio):
+        with self.__lock:
+            self.__spend(self.call_latency)
+
+            return self.__pulse_widths.get(gpio, 0)
+
+    def set_mode(self, gpio, mode):
+        return 0
+
+    def callback(self, gpio, edge, func):
+        with self.__lock:
+            cb = _SimulatedCallback(self, gpio, edge, func)
+            self.__callbacks.append(cb)
+
+        return cb
+
+    def call_later(self, delay, func):
+        with self.__lock:
+            timer = _Timer(self.__now + delay * 1000000.0, func)
+            heapq.heappush(self.__timers, (timer.when, next(self.__timer_order), timer))
+
+        return timer
+
+    def get_current_tick(self):
+        with self.__lock:
+            self.__spend(self.call_latency)
+
+            return self.__tick(self.__now)
+
+    def time(self):
+        with self.__lock:
+            self.__spend(self.poll_quantum)
+
+            return self.__now / 1000000.0
+
+    def clock(self):
+        # Unlike time(), the simulated time is not moved forward.
+
+        return self.__now / 1000000.0
+
+    def sleep(self, seconds):
+        if self.__realtime:
+            time.sleep(seconds)
+        else:
+            self.advance(max(seconds, self.poll_quantum))
+
+    def wait_for(self, condition, predicate, timeout = None):
+        if self.__realtime: # The pacing thread delivers the edges, notifying the condition
+            return super().wait_for(condition, predicate, timeout)
+
+        # Nothing would notify the condition while the simulated time is stopped, so the time is moved
+        # forward straight to the next feedback edge or timer (the only things that can change the
+        # predicate) until the predicate holds.
+
+        deadline = None if timeout is None else self.__now + timeout * 1000000.0
+
+        while not predicate():
+            if deadline is not None and self.__now >= deadline:
+                return False
+
+            with self.__lock:
+                step = max(self.__next_event_time() - self.__now, 0.0)
+
+                if step == math.inf:
+                    step = self.poll_quantum * 1000000.0
+
+                if deadline is not None:
+                    step = min(step, deadline - self.__now)
+
+                self.advance(step / 1000000.0)
+
+        return True
+
+    def stop(self):
+        with self.__lock:
+            for control_pin in self.__servos:
+                self.set_servo_pulsewidth(control_pin, 0)
+
+            self.__callbacks = []
+            self.connected = False
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# telemetry.py                                                                #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will record and replay the signals of a Parallax Servo            #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import mmap, struct, threading, time
+import pigpio
+
+###############################################################################
+# File format
+
+# A 16 bytes header (magic, version, record size) followed by fixed size records:
+# tick (uint32, μs), kind (uint8), gpio (uint8), value (uint16), little-endian.
+# Feedback edges store their level as value, commands their pulse width.
+
+MAGIC = b"PRXTELEM"
+VERSION = 1
+
+EDGE = 0
+COMMAND = 1
+
+_HEADER = struct.Struct("<8sII")
+_RECORD = struct.Struct("<IBBH")
+
+RECORD_SIZE = _RECORD.size
+
+###############################################################################
+# Recorder
+
+class Recorder:
+    """
+    Streams the feedback edges of the given gpio and the commands passed to
+    command() into a binary file (see the format above).
+
+    Records are packed into a preallocated in-memory buffer; full buffers
+    are handed to a background thread which writes them to disk, also
+    flushing the partial buffer every flush_interval seconds. The callback
+    thread never touches the file. At most max_buffers full buffers wait
+    for the disk: beyond that, records are dropped (and counted), so
+    captures of any length use bounded memory.
+    """
+
+    def __init__(self, pi, path, feedback_gpio = None, buffer_records = 4096, max_buffers = 64, flush_interval = 0.5):
+        self.pi = pi
+        self.path = path
+
+        self.flush_interval = flush_interval
+
+        self.__buffer_records = buffer_records
+        self.__max_buffers = max_buffers
+
+        self.__buffer = bytearray(buffer_records * RECORD_SIZE)
+        self.__count = 0 # Records on the current buffer
+        self.__full = [] # Buffers waiting to be written
+
+        self.__lock = threading.Lock()
+        self.__wake = threading.Event()
+        self.__running = True
+
+        self.__records = 0
+        self.__dropped = 0
+
+        self.__anchor = None # (tick, backend clock) commands are timestamped from
+
+        self.__file = open(path, "wb")
+        self.__file.write(_HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+
+        self.__thread = threading.Thread(target=self.__writer, name="parallax-telemetry", daemon=True)
+        self.__thread.start()
+
+        self.__cb = None
+
+        if feedback_gpio is not None:
+            self.__cb = pi.callback(feedback_gpio, pigpio.EITHER_EDGE, self.edge)
+
+    def edge(self, gpio, level, tick):
+        # Records a feedback edge. Its signature matches a pigpio callback.
+
+        self.__anchor = (tick, self.pi.clock())
+        self.__append(tick, EDGE, gpio, level)
+
+    def command(self, gpio, pulse_width):
+        # Records a pulse width command. Asking the daemon for the current tick would take a round trip per
+        # command, so the tick is extrapolated on the backend clock from the last edge seen (or from the
+        # tick asked on the first command, if no feedback edge is recorded).
+
+        anchor = self.__anchor
+
+        if anchor is None:
+            tick = self.pi.get_current_tick()
+            self.__anchor = (tick, self.pi.clock())
+        else:
+            tick = anchor[0] + round((self.pi.clock() - anchor[1]) * 1000000.0)
+
+        self.__append(tick, COMMAND, gpio, round(pulse_width))
+
+    def stats(self):
+        # Returns the number of records taken and dropped.
+
+        return {"records": self.__records, "dropped": self.__dropped}
+
+    def close(self):
+        # Stops recording, writing every record left to the file.
+
+        if self.__cb is not None:
+            self.__cb.cancel()
+            self.__cb = None
+
+        if not self.__running:
+            return
+
+        self.__running = False
+        self.__wake.set()
+        self.__thread.join()
+
+        self.__file.close()
+
+    def __append(self, tick, kind, gpio, value):
+        with self.__lock:
+            if self.__count == self.__buffer_records:
+                if len(self.__full) >= self.__max_buffers: # The disk can not keep up
+                    self.__dropped += 1
+                    return
+
+                self.__full.append(self.__buffer)
+                self.__buffer = bytearray(self.__buffer_records * RECORD_SIZE)
+                self.__count = 0
+                self.__wake.set()
+
+            _RECORD.pack_into(self.__buffer, self.__count * RECORD_SIZE, tick & 0xFFFFFFFF, kind, gpio, value)
+            self.__count += 1
+            self.__records += 1
+
+    def __take(self):
+        # Takes every buffer waiting to be written, plus the records of the current one.
+
+        with self.__lock:
+            buffers, self.__full = self.__full, []
+
+            if self.__count:
+                buffers.append(self.__buffer[:self.__count * RECORD_SIZE])
+                self.__count = 0
+
+        return buffers
+
+    def __writer(self):
+        while True:
+            self.__wake.wait(self.flush_interval)
+            self.__wake.clear()
+
+            running = self.__running
+
+            for buffer in self.__take():
+                self.__file.write(buffer)
+
+            self.__file.flush()
+
+            if not running:
+                return
+
+###############################################################################
+# Replay
+
+class Replay:
+    """
+    Read-only view of a file written by Recorder. The file is memory-mapped,
+    so captures of any length can be replayed without loading them in RAM:
+    records() is backed by the map itself, and edges() and commands() copy
+    only the range of records asked for (see chunks() to go through a long
+    capture a range at a time).
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self.__file = open(path, "rb")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, record_size = _HEADER.unpack_from(self.__map, 0)
+
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError(path + " is not a telemetry file")
+
+        # A capture cut short (e.g. by a power loss) might end with half a record.
+
+        self.__records = (len(self.__map) - _HEADER.size) // RECORD_SIZE
+        self.__array = None
+
+    def __len__(self):
+        return self.__records
+
+    def records(self):
+        """
+        Returns every record as a NumPy structured array (fields "tick",
+        "kind", "gpio" and "value") backed by the memory map.
+        """
+
+        if self.__array is None:
+            import numpy
+
+            dtype = numpy.dtype([("tick", "<u4"), ("kind", "u1"), ("gpio", "u1"), ("value", "<u2")])
+            self.__array = numpy.frombuffer(self.__map, dtype=dtype, count=self.__records, offset=_HEADER.size)
+
+        return self.__array
+
+    def edges(self, gpio = None, start = 0, stop = None):
+        """
+        Returns (ticks, levels) of the feedback edges recorded (of the
+        given gpio, if any) among the records from start to stop, ready for
+        feedback_analytics.analyze(). The selection is copied to RAM.
+        """
+
+        return self.__select(EDGE, gpio, start, stop)
+
+    def commands(self, gpio = None, start = 0, stop = None):
+        """
+        Returns (ticks, pulse widths) of the commands recorded (of the
+        given gpio, if any) among the records from start to stop.
+        """
+
+        return self.__select(COMMAND, gpio, start, stop)
+
+    def chunks(self, chunk_records = 1 << 20):
+        """
+        Yields (start, stop) ranges of at most chunk_records records
+        covering the whole capture, to pass to edges() and commands() so
+        long captures are analyzed with bounded memory.
+        """
+
+        for start in range(0, self.__records, chunk_records):
+            yield start, min(start + chunk_records, self.__records)
+
+    def feed(self, func, speed = None):
+        """
+        Calls func(gpio, level, tick) for every feedback edge recorded, in
+        order, like a pigpio callback would (e.g. read_PWM.reader._cbf).
+        By default it runs as fast as possible; if speed is given, the
+        edges are paced at that many times real time.
+        """
+
+        # Ticks wrap every 2^32 μs (~72 minutes), so the time elapsed is added up edge by edge.
+
+        last_tick = None
+        elapsed = 0
+        start = None
+
+        for offset in range(_HEADER.size, _HEADER.size + self.__records * RECORD_SIZE, RECORD_SIZE):
+            tick, kind, gpio, value = _RECORD.unpack_from(self.__map, offset)
+
+            if kind != EDGE:
+                continue
+
+            if speed is not None:
+                if last_tick is None:
+                    start = time.perf_counter()
+                else:
+                    elapsed += (tick - last_tick) & 0xFFFFFFFF
+
+                last_tick = tick
+
+                delay = elapsed / 1000000.0 / speed - (time.perf_counter() - start)
+
+                if delay > 0:
+                    time.sleep(delay)
+
+            func(gpio, value, tick)
+
+    def close(self):
+        self.__array = None
+
+        try:
+            self.__map.close()
+        except BufferError: # Arrays handed out still use the map, it will be released along with them
+            pass
+
+        self.__file.close()
+
+    def __select(self, kind, gpio, start, stop):
+        records = self.records()[start:stop] # A view, only the selection below is copied
+        mask = records["kind"] == kind
+
+        if gpio is not None:
+            mask &= records["gpio"] == gpio
+
+        selected = records[mask]
+
+        return selected["tick"], selected["value"]
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# trajectory.py                                                               #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will run timed motion profiles on Parallax Servos                 #
+###############################################################################
+
+###############################################################################
+# Neccesary modules
+
+import collections, math, os, threading
+
+###############################################################################
+# Segments
+
+def _trapezoid_velocities(distance, max_velocity, acceleration, frame_period):
+    # Returns the mean velocity (degrees per second) of every frame of a trapezoidal velocity profile covering
+    # the given distance (degrees, signed). Each frame covers exactly the distance the profile covers during
+    # it, so the frames add up to the whole distance.
+
+    total = abs(distance)
+
+    if total == 0 or max_velocity <= 0 or acceleration <= 0:
+        return []
+
+    peak = max_velocity
+    ramp_time = peak / acceleration
+
+    if peak * ramp_time > total: # The peak velocity is never reached: triangular profile
+        peak = math.sqrt(total * acceleration)
+        ramp_time = peak / acceleration
+
+    flat_time = (total - peak * ramp_time) / peak
+    end_time = 2 * ramp_time + flat_time
+
+    def travelled(t):
+        t = min(max(t, 0.0), end_time)
+
+        if t < ramp_time:
+            return acceleration * t * t / 2
+        if t < ramp_time + flat_time:
+            return peak * ramp_time / 2 + peak * (t - ramp_time)
+
+        left = end_time - t
+
+        return total - acceleration * left * left / 2
+
+    frames = math.ceil(end_time / frame_period - 1e-9)
+    sign = 1.0 if distance > 0 else -1.0
+
+    return [sign * (travelled((k + 1) * frame_period) - travelled(k * frame_period)) / frame_period for k in range(frames)]
+
+class Trapezoid:
+    """
+    Turns the axle the given distance (degrees, positive means
+    counter-clockwise) with a trapezoidal velocity profile.
+    """
+
+    def __init__(self, distance, max_velocity = 360.0, acceleration = 1800.0):
+        self.distance = distance
+        self.max_velocity = max_velocity # Degrees per second
+        self.acceleration = acceleration # Degrees per second squared
+
+    def plan(self, servo, position, frame_period):
+        # Returns the pulse width of every frame, and the unwrapped position expected at the end.
+
+        return _plan_velocities(servo, self.distance, self.max_velocity, self.acceleration, frame_period), position + self.distance
+
+class MoveTo:
+    """
+    Moves the axle to the given angle (0º-360º) the shortest way, with a
+    trapezoidal velocity profile planned from the angle found when the
+    segment starts.
+    """
+
+    def __init__(self, angle, max_velocity = 360.0, acceleration = 1800.0):
+        self.angle = angle
+        self.max_velocity = max_velocity
+        self.acceleration = acceleration
+
+    def plan(self, servo, position, frame_period):
+        distance = ((self.angle - position + 180.0) % 360.0) - 180.0
+
+        return _plan_velocities(servo, distance, self.max_velocity, self.acceleration, frame_period), position + distance
+
+class Dwell:
+    """
+    Keeps the servo stopped for the given time (s).
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    def plan(self, servo, position, frame_period):
+        return [servo.get_pulse_width(0)] * math.ceil(self.duration / frame_period - 1e-9), None
+
+def _plan_velocities(servo, distance, max_velocity, acceleration, frame_period):
+    # The velocity is limited by the maximum speed of the servo in that direction, and every frame velocity is
+    # turned into its pulse width with the calibration data of the servo.
+
+    max_velocity = min(max_velocity, servo.get_max_speed(distance))
+
+    velocities = _trapezoid_velocities(distance, max_velocity, acceleration, frame_period)
+
+    return [servo.get_pulse_width(servo.get_power_for_velocity(velocity)) for velocity in velocities]
+
+###############################################################################
+# Scheduler
+
+class TrajectoryScheduler:
+    """
+    Runs queues of segments (Trapezoid, MoveTo, Dwell) on one or more
+    Parallax servos sharing a backend clock.
+
+    Each segment is turned into a pulse width per PWM frame (20 ms) when
+    it starts, so the timing thread only has to send them: it wakes up on
+    every frame boundary (with real-time priority if the system allows
+    it) and sends the pulse width of that frame to every servo.
+
+    report() returns, per segment, its planned and actual duration, the
+    timing error between both, the worst lateness of its frames and, for
+    motions, the position error at its end. The worst lateness of any
+    frame is reported too.
+    """
+
+    def __init__(self, frame_period = 0.02, realtime_priority = True):
+        self.frame_period = frame_period
+        self.realtime_priority = realtime_priority
+
+        self.__queues = collections.OrderedDict() # servo -> deque of segments
+        self.__segments = [] # Reports of the segments finished
+        self.__worst_lateness = 0.0
+        self.__frames = 0
+
+        self.__running = False
+        self.__thread = None
+
+    def add(self, servo, *segments):
+        # Queues the given segments on the servo.
+
+        self.__queues.setdefault(servo, collections.deque()).extend(segments)
+
+    def start(self):
+        if self.__running or not self.__queues:
+            return
+
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__loop, name="parallax-trajectory", daemon=True)
+        self.__thread.start()
+
+    def wait(self, timeout = None):
+        # Waits for every queue to be done (or for the timeout), returning the report.
+
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+
+        return self.report()
+
+    def run(self):
+        # Runs every queue, returning the report once they are done.
+
+        self.start()
+
+        return self.wait()
+
+    def stop(self):
+        self.__running = False
+        self.wait()
+
+    def report(self):
+        return {"segments": list(self.__segments), "frames": self.__frames, "worst_lateness": self.__worst_lateness}
+
+    def __loop(self):
+        if self.realtime_priority:
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(os.sched_get_priority_min(os.SCHED_FIFO)))
+            except (AttributeError, OSError): # Only on Linux, and only with enough privileges
+                pass
+
+        servos = list(self.__queues)
+        clock = servos[0] # Every servo is assumed to share its backend clock
+
+        states = {servo: {"frames": [], "next": 0, "report": None} for servo in servos}
+
+        start = clock.get_time()
+        frame = 0
+
+        try:
+            while self.__running:
+                deadline = start + frame * self.frame_period
+
+                now = clock.get_time()
+
+                if deadline > now:
+                    clock.sleep(deadline - now)
+                    now = clock.get_time()
+
+                lateness = max(now - deadline, 0.0)
+                self.__worst_lateness = max(self.__worst_lateness, lateness)
+
+                busy = False
+
+                for servo in servos:
+                    state = states[servo]
+
+                    if state["next"] == len(state["frames"]):
+                        self.__finish(servo, state, now)
+                        self.__begin(servo, state, now)
+
+                    if state["next"] < len(state["frames"]):
+                        servo.send_pulse_width(state["frames"][state["next"]])
+                        state["next"] += 1
+
+                        report = state["report"]
+                        report["max_lateness"] = max(report["max_lateness"], lateness)
+
+                        busy = True
+
+                if not busy:
+                    break
+
+                frame += 1
+                self.__frames += 1
+        finally:
+            self.__running = False
+
+            for servo in servos:
+                servo.run(0)
+
+    def __begin(self, servo, state, now):
+        # Plans the next segment of the servo, skipping the ones with nothing to do.
+
+        queue = self.__queues[servo]
+
+        while queue:
+            segment = queue.popleft()
+            frames, target = segment.plan(servo, servo.get_position(), self.frame_period)
+
+            if frames:
+                state["frames"] = frames
+                state["next"] = 0
+                state["report"] = {
+                    "servo": servo.servo_id,
+                    "segment": type(segment).__name__,
+                    "start": now,
+                    "planned": len(frames) * self.frame_period,
+                    "max_lateness": 0.0,
+                    "target": target
+                }
+                return
+
+    def __finish(self, servo, state, now):
+        report = state["report"]
+
+        if report is None:
+            return
+
+        report["actual"] = now - report["start"]
+        report["timing_error"] = report["actual"] - report["planned"]
+
+        target = report.pop("target")
+        report["position_error"] = None if target is None else servo.get_position() - target
+
+        self.__segments.append(report)
+        state["report"] = None
@@ -0,0 +1,56 @@
+###############################################################################
+# conftest.py                                                                 #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will hold the fixtures shared by the tests                        #
+###############################################################################
+
+import os, sys, time
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+import parallax, simulation
+
+@pytest.fixture
+def sim():
+    # A simulated Pi with a single servo wired to pins 14 and 15.
+
+    pi = simulation.SimulatedPi()
+    plant = pi.attach(simulation.ServoPlant(seed=3), 14, 15)
+
+    return pi, plant
+
+@pytest.fixture
+def servo(sim):
+    pi, _ = sim
+
+    myParallax = parallax.Parallax(14, 15, backend=pi)
+    myParallax.verbose = False
+
+    yield myParallax
+
+    myParallax.destroy()
+
+def wait_simulated(pi, seconds):
+    # Waits (on real time) until another thread moved the simulated clock the given number of seconds.
+
+    end = pi.clock() + seconds
+
+    while pi.clock() < end:
+        time.sleep(0.005)
+
+def plant_calibration(plant):
+    # The calibration values matching the simulated servo exactly, so tests need not calibrate it first.
+
+    return {
+        "min_fb_dc": plant.min_fb_dc,
+        "max_fb_dc": plant.max_fb_dc,
+        "min_cw_pw": plant.min_cw_pw,
+        "min_ccw_pw": plant.min_ccw_pw,
+        "max_cw_pw": plant.max_cw_pw,
+        "max_ccw_pw": plant.max_ccw_pw,
+        "max_cw_speed": plant.max_cw_rpm * 6.0,
+        "max_ccw_speed": plant.max_ccw_rpm * 6.0
+    }
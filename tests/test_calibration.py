@@ -0,0 +1,65 @@
+###############################################################################
+# test_calibration.py                                                         #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the calibration searches against simulated servos       #
+###############################################################################
+
+import pytest
+import parallax, simulation
+
+def simulated_servo(plant):
+    pi = simulation.SimulatedPi()
+    pi.attach(plant, 14, 15)
+
+    myParallax = parallax.Parallax(14, 15, backend=pi)
+    myParallax.verbose = False
+
+    return myParallax
+
+@pytest.mark.parametrize("dead_band", [(1476.0, 1524.0), (1450.0, 1530.0)])
+def test_bisection_finds_the_stop_boundaries(dead_band):
+    # The stop boundaries are the first pulse widths moving the axle, right outside the dead band.
+
+    plant = simulation.ServoPlant(seed=3, min_cw_pw=dead_band[0], min_ccw_pw=dead_band[1])
+    myParallax = simulated_servo(plant)
+
+    try:
+        myParallax.calibrate(stop_search=myParallax.BISECTION_SEARCH, limit_search=myParallax.ADAPTIVE_SEARCH)
+        values = myParallax.get_calibration()
+    finally:
+        myParallax.destroy()
+
+    assert values["min_cw_pw"] == plant.min_cw_pw - 1
+    assert values["min_ccw_pw"] == plant.min_ccw_pw + 1
+
+    # A handful of motion tests, instead of one per μs of the dead band.
+
+    for stats in myParallax.stop_search_stats.values():
+        assert stats["probes"] <= 12
+
+@pytest.mark.parametrize("curve_exponent", [0.8, 1.0])
+def test_adaptive_search_finds_the_saturation_knee(curve_exponent):
+    # The limit boundary is the pulse width closest to the dead band still running within 3 % of the
+    # maximum speed, which the speed curve of the plant tells exactly.
+
+    plant = simulation.ServoPlant(seed=3, curve_exponent=curve_exponent)
+    myParallax = simulated_servo(plant)
+
+    try:
+        myParallax.calibrate(stop_search=myParallax.BISECTION_SEARCH, limit_search=myParallax.ADAPTIVE_SEARCH)
+        values = myParallax.get_calibration()
+    finally:
+        myParallax.destroy()
+
+    knee = 0.97 ** (1.0 / curve_exponent) # Fraction of the way from the dead band to saturation
+
+    assert abs(values["max_cw_pw"] - (plant.min_cw_pw - knee * (plant.min_cw_pw - plant.max_cw_pw))) <= 3
+    assert abs(values["max_ccw_pw"] - (plant.min_ccw_pw + knee * (plant.max_ccw_pw - plant.min_ccw_pw))) <= 3
+
+    assert values["max_cw_speed"] == pytest.approx(plant.max_cw_rpm * 6.0, rel=0.02)
+    assert values["max_ccw_speed"] == pytest.approx(plant.max_ccw_rpm * 6.0, rel=0.02)
+
+    for stats in myParallax.limit_search_stats.values():
+        assert stats["probes"] <= 12
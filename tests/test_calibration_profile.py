@@ -0,0 +1,109 @@
+###############################################################################
+# test_calibration_profile.py                                                 #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the calibration profiles and their sanity probe         #
+###############################################################################
+
+import os
+import pytest
+import calibration_profile, parallax, simulation
+from conftest import plant_calibration
+
+def test_check_calibration_accepts_the_right_values(sim, servo):
+    _, plant = sim
+
+    servo.set_calibration(plant_calibration(plant))
+
+    assert servo.check_calibration()
+
+def test_check_calibration_rejects_narrow_duty_cycle_bounds(sim, servo):
+    # The filtered duty cycles always fall within the bounds, so only the raw ones can tell them wrong.
+
+    _, plant = sim
+
+    values = plant_calibration(plant)
+    values["min_fb_dc"], values["max_fb_dc"] = 30.0, 60.0
+
+    servo.set_calibration(values)
+
+    assert not servo.check_calibration()
+
+def test_check_calibration_rejects_another_frequency():
+    pi = simulation.SimulatedPi()
+    plant = pi.attach(simulation.ServoPlant(seed=3, feedback_frequency=600.0), 14, 15)
+
+    myParallax = parallax.Parallax(14, 15, backend=pi)
+    myParallax.verbose = False
+
+    try:
+        myParallax.set_calibration(plant_calibration(plant))
+        assert not myParallax.check_calibration()
+    finally:
+        myParallax.destroy()
+
+def test_profile_round_trip_keeps_other_servos(tmp_path):
+    path = str(tmp_path / "profiles.json")
+
+    calibration_profile.save_profile("a:14:15", {"min_cw_pw": 1475}, path)
+    calibration_profile.save_profile("b:17:18", {"min_cw_pw": 1480}, path)
+
+    assert calibration_profile.load_profile("a:14:15", path) == {"min_cw_pw": 1475}
+    assert calibration_profile.load_profile("b:17:18", path) == {"min_cw_pw": 1480}
+    assert calibration_profile.load_profile("c:22:23", path) is None
+
+    calibration_profile.delete_profile("a:14:15", path)
+
+    assert calibration_profile.load_profile("a:14:15", path) is None
+    assert calibration_profile.load_profile("b:17:18", path) == {"min_cw_pw": 1480}
+    assert not os.path.exists(path + ".tmp")
+
+def test_stale_or_corrupted_profiles_are_ignored(tmp_path):
+    path = str(tmp_path / "profiles.json")
+
+    calibration_profile.save_profile("a:14:15", {"min_cw_pw": 1475}, path)
+
+    assert calibration_profile.load_profile("a:14:15", path, max_age=60) is not None
+    assert calibration_profile.load_profile("a:14:15", path, max_age=-1) is None # Older than "now"
+    assert calibration_profile.load_profile("a:14:15", path, max_age=None) is not None
+
+    with open(path, "w") as f:
+        f.write("{not json")
+
+    assert calibration_profile.load_profile("a:14:15", path) is None
+
+def test_load_or_calibrate_uses_a_matching_profile(sim, servo, tmp_path, monkeypatch):
+    _, plant = sim
+    path = str(tmp_path / "profiles.json")
+
+    key = calibration_profile.profile_key(servo.servo_id, servo.control_pin, servo.feedback_pin)
+    calibration_profile.save_profile(key, plant_calibration(plant), path)
+
+    monkeypatch.setattr(servo, "calibrate", lambda: pytest.fail("calibrated despite a matching profile"))
+
+    assert servo.load_or_calibrate(path)
+    assert servo.get_calibration()["min_cw_pw"] == plant.min_cw_pw
+
+def test_load_or_calibrate_calibrates_when_the_probe_fails(sim, servo, tmp_path, monkeypatch):
+    _, plant = sim
+    path = str(tmp_path / "profiles.json")
+
+    key = calibration_profile.profile_key(servo.servo_id, servo.control_pin, servo.feedback_pin)
+
+    values = plant_calibration(plant)
+    values["min_fb_dc"], values["max_fb_dc"] = 30.0, 60.0
+
+    calibration_profile.save_profile(key, values, path)
+
+    # The quick searches, so the test does not take the whole linear calibration.
+
+    calibrate = servo.calibrate
+    monkeypatch.setattr(servo, "calibrate", lambda: calibrate(stop_search=servo.BISECTION_SEARCH, limit_search=servo.ADAPTIVE_SEARCH))
+
+    assert not servo.load_or_calibrate(path)
+
+    stored = calibration_profile.load_profile(key, path)
+
+    assert stored == servo.get_calibration()
+    assert stored["min_fb_dc"] < 5.0 and stored["max_fb_dc"] > 95.0
@@ -0,0 +1,68 @@
+###############################################################################
+# test_command_writer.py                                                      #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the coalescing of pulse width commands                  #
+###############################################################################
+
+import simulation
+from command_writer import CommandWriter
+
+def make_writer(**kwargs):
+    pi = simulation.SimulatedPi()
+    pi.attach(simulation.ServoPlant(), 14, 15)
+
+    return pi, CommandWriter(pi, 14, **kwargs)
+
+def test_burst_is_coalesced_into_its_latest_value():
+    pi, writer = make_writer()
+
+    assert writer.write(1500) # Nothing sent before, so it goes right away
+
+    for pulse_width in range(1501, 1551):
+        assert not writer.write(pulse_width)
+
+    assert pi.get_servo_pulsewidth(14) == 1500
+    assert writer.get_pulse_width() == 1550
+
+    pi.sleep(writer.min_interval)
+
+    assert pi.get_servo_pulsewidth(14) == 1550
+
+    stats = writer.stats()
+    assert stats["requested"] == 51
+    assert stats["sent"] == 2
+    assert stats["coalesced"] == 49
+
+def test_unchanged_values_are_not_sent():
+    pi, writer = make_writer()
+
+    writer.write(1600)
+    pi.sleep(writer.min_interval)
+
+    assert not writer.write(1600)
+    assert writer.stats() == {"requested": 2, "sent": 1, "suppressed": 1, "unchanged": 1, "coalesced": 0}
+
+def test_immediate_write_drops_the_pending_command():
+    pi, writer = make_writer()
+
+    writer.write(1400)
+    writer.write(1450) # Pending
+
+    assert writer.write(1700, immediate=True)
+
+    pi.sleep(2 * writer.min_interval) # The timer of the pending command must not fire
+
+    assert pi.get_servo_pulsewidth(14) == 1700
+    assert writer.stats()["sent"] == 2
+
+def test_record_does_not_move_the_simulated_clock():
+    pi, writer = make_writer()
+
+    now = pi.clock()
+
+    for _ in range(1000):
+        writer.record(1500)
+
+    assert pi.clock() == now
@@ -0,0 +1,76 @@
+###############################################################################
+# test_drift_monitor.py                                                       #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the drift monitor on simulated servos                   #
+###############################################################################
+
+import parallax, simulation
+from conftest import wait_simulated
+
+def calibrated_servo(plant):
+    pi = simulation.SimulatedPi()
+    pi.attach(plant, 14, 15)
+
+    myParallax = parallax.Parallax(14, 15, backend=pi)
+    myParallax.verbose = False
+    myParallax.calibrate(stop_search=myParallax.BISECTION_SEARCH, limit_search=myParallax.ADAPTIVE_SEARCH)
+
+    return pi, myParallax
+
+def test_undrifted_servo_is_left_alone():
+    # A linear speed curve runs power 1 at a few º/s, slow but still moving for calibration.
+
+    pi, myParallax = calibrated_servo(simulation.ServoPlant(seed=3, curve_exponent=1.0))
+    values = myParallax.get_calibration()
+
+    monitor = myParallax.start_drift_monitor()
+    events = []
+    monitor.add_listener(events.append)
+
+    try:
+        myParallax.run(1)
+        wait_simulated(pi, 3.0) # The monitor thread moves the simulated clock
+
+        myParallax.run(0)
+        wait_simulated(pi, 5.0)
+    finally:
+        myParallax.stop_drift_monitor()
+        myParallax.destroy()
+
+    assert monitor.stats()["checks"] > 0
+    assert events == []
+    assert monitor.suspects() == {}
+    assert myParallax.get_calibration() == values
+
+def test_grown_dead_band_is_corrected():
+    plant = simulation.ServoPlant(seed=3, curve_exponent=1.0)
+    pi, myParallax = calibrated_servo(plant)
+
+    plant.min_cw_pw -= 8
+
+    monitor = myParallax.start_drift_monitor()
+
+    try:
+        myParallax.run(1)
+        wait_simulated(pi, 3.0)
+
+        myParallax.run(0)
+        wait_simulated(pi, 12.0)
+    finally:
+        myParallax.stop_drift_monitor()
+
+    # Once probing ends the stop pulse width is applied again, so the axle stays still.
+
+    try:
+        start = myParallax.get_position()
+        pi.sleep(2.0)
+        moved = myParallax.get_position() - start
+    finally:
+        myParallax.destroy()
+
+    assert myParallax.get_power() == 0
+    assert abs(moved) < 3.0
+    assert monitor.stats()["adjustments"] >= 1
+    assert plant.min_cw_pw - 2 * monitor.step <= myParallax.get_calibration()["min_cw_pw"] < plant.min_cw_pw
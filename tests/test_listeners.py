@@ -0,0 +1,106 @@
+###############################################################################
+# test_listeners.py                                                           #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test adding and removing feedback and event listeners        #
+###############################################################################
+
+import asyncio
+import async_parallax, drift_monitor
+
+class Counter:
+
+    def __init__(self):
+        self.calls = 0
+
+    def on_feedback(self):
+        self.calls += 1
+
+def test_bound_method_listener_is_removed(sim, servo):
+    pi, _ = sim
+    counter = Counter()
+
+    servo.add_feedback_listener(counter.on_feedback)
+    pi.sleep(0.05)
+
+    calls = counter.calls
+    assert calls > 0
+
+    servo.remove_feedback_listener(counter.on_feedback) # A new bound method object
+    pi.sleep(0.05)
+
+    assert counter.calls == calls
+
+def test_async_parallax_close_removes_its_listener(sim, servo):
+    pi, _ = sim
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        bridge = async_parallax.AsyncParallax(servo)
+
+        task = asyncio.ensure_future(bridge.next_sample())
+        await asyncio.sleep(0)
+
+        pi.sleep(0.01)
+        await task
+
+        bridge.close()
+
+        # Any listener left would keep scheduling wake-ups on the loop.
+
+        wakeups = []
+        call_soon_threadsafe = loop.call_soon_threadsafe
+        loop.call_soon_threadsafe = lambda *args: wakeups.append(args) or call_soon_threadsafe(*args)
+
+        pi.sleep(0.05)
+
+        return wakeups
+
+    assert asyncio.run(main()) == []
+
+def test_async_parallax_idles_without_waiting_tasks(sim, servo):
+    pi, _ = sim
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        bridge = async_parallax.AsyncParallax(servo)
+
+        task = asyncio.ensure_future(bridge.next_sample())
+        await asyncio.sleep(0)
+
+        pi.sleep(0.01)
+        await task
+
+        wakeups = []
+        call_soon_threadsafe = loop.call_soon_threadsafe
+        loop.call_soon_threadsafe = lambda *args: wakeups.append(args) or call_soon_threadsafe(*args)
+
+        pi.sleep(0.05) # Still listening, but nobody is waiting
+
+        loop.call_soon_threadsafe = call_soon_threadsafe
+
+        # A task waiting again is still woken up.
+
+        task = asyncio.ensure_future(bridge.next_sample())
+        await asyncio.sleep(0)
+
+        pi.sleep(0.01)
+        await asyncio.wait_for(task, 1.0)
+
+        bridge.close()
+
+        return wakeups
+
+    assert asyncio.run(main()) == []
+
+def test_drift_monitor_listener_is_removed(servo):
+    monitor = drift_monitor.DriftMonitor(servo)
+    events = []
+
+    monitor.add_listener(events.append)
+    monitor.remove_listener(events.append) # A new bound method object
+
+    monitor._DriftMonitor__publish("test")
+
+    assert events == []
@@ -0,0 +1,45 @@
+###############################################################################
+# test_parallax.py                                                            #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the Parallax class on a simulated servo                 #
+###############################################################################
+
+from conftest import plant_calibration
+
+def table_matches_interpolation(servo):
+    # Integer powers are looked up on the table, float ones are interpolated.
+
+    return all(servo.get_pulse_width(power) == servo.get_pulse_width(float(power)) for power in range(-100, 101))
+
+def test_pulse_width_table_matches_interpolation(sim, servo):
+    _, plant = sim
+
+    assert table_matches_interpolation(servo) # Datasheet values
+
+    values = plant_calibration(plant)
+    servo.set_calibration(values)
+
+    assert table_matches_interpolation(servo)
+
+    # With a speed curve, power is a fraction of the maximum speed.
+
+    values["cw_speed_curve"] = [[1475, 20.0], [1400, 400.0], [1350, 650.0], [1296, 750.0]]
+    values["ccw_speed_curve"] = [[1525, 20.0], [1600, 380.0], [1706, 714.0]]
+    servo.set_calibration(values)
+
+    assert table_matches_interpolation(servo)
+    assert servo.get_pulse_width(100) == 1296
+    assert servo.get_pulse_width(-100) == 1706
+
+def test_run_sends_the_table_pulse_width(sim, servo):
+    pi, plant = sim
+    servo.set_calibration(plant_calibration(plant))
+
+    for power in (1, 37, 100, -1, -63, -100, 0):
+        pulse_width = servo.run(power)
+        pi.sleep(0.05)
+
+        assert pulse_width == servo.get_pulse_width(power)
+        assert pi.get_servo_pulsewidth(14) == pulse_width
@@ -0,0 +1,109 @@
+###############################################################################
+# test_read_PWM.py                                                            #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the feedback reader on synthetic edges                  #
+###############################################################################
+
+import pytest
+import read_PWM, simulation
+
+PERIOD = 1099 # μs, ~910 Hz
+
+def make_reader(**kwargs):
+    # Edges are fed by hand to the callback, so no servo is wired to the pin.
+
+    return read_PWM.reader(simulation.SimulatedPi(), 15, **kwargs)
+
+def feed(reader, duty_cycles, tick = 0xFFFFFFFF - 5000):
+    # Feeds one period per duty cycle (%), starting near the 32 bit tick wrap. Returns the next tick.
+
+    for dc in duty_cycles:
+        reader._cbf(15, 1, tick & 0xFFFFFFFF)
+        reader._cbf(15, 0, (tick + round(PERIOD * dc / 100.0)) & 0xFFFFFFFF)
+        tick += PERIOD
+
+    reader._cbf(15, 1, tick & 0xFFFFFFFF) # Closes the last period
+
+    return tick
+
+@pytest.mark.parametrize("filter_mode", [read_PWM.MEDIAN, read_PWM.CIRCULAR])
+def test_filters_cross_the_wrap(filter_mode):
+    # The axle crossing 360º -> 0º goes from ~97 % to ~3 %: filtered values must stay at either end,
+    # never averaging both into a mid-range angle.
+
+    reader = make_reader(filter_mode=filter_mode, weighting=0.5, period_gating=True)
+    outputs = []
+    reader.add_listener(lambda: outputs.append(reader.duty_cycle()))
+
+    feed(reader, [95.0, 95.8, 96.6, 97.0, 3.1, 3.6, 4.4, 5.2, 6.0])
+
+    assert len(outputs) == 9
+    assert all(dc >= 94.0 or dc <= 7.0 for dc in outputs)
+    assert outputs[-1] <= 7.0
+
+def test_ewma_does_not_cross_the_wrap():
+    # The plain filter averages both ends, which is why the servo uses the angle based ones.
+
+    reader = make_reader(weighting=0.5)
+    outputs = []
+    reader.add_listener(lambda: outputs.append(reader.duty_cycle()))
+
+    feed(reader, [97.0, 97.0, 3.0, 3.0])
+
+    assert any(20.0 < dc < 80.0 for dc in outputs)
+
+def test_period_gating_drops_glitches():
+    reader = make_reader(filter_mode=read_PWM.MEDIAN, period_gating=True)
+
+    tick = feed(reader, [50.0] * 5)
+
+    # A spurious pulse 100 μs into the next period splits it in two short ones.
+
+    reader._cbf(15, 0, (tick + 20) & 0xFFFFFFFF)
+    reader._cbf(15, 1, (tick + 100) & 0xFFFFFFFF)
+    reader._cbf(15, 0, (tick + 120) & 0xFFFFFFFF)
+
+    feed(reader, [50.0] * 5, tick + PERIOD)
+
+    assert reader.glitches() >= 1
+    assert reader.duty_cycle() == pytest.approx(50.0, abs=0.5)
+    assert reader.frequency() == pytest.approx(1000000.0 / PERIOD, rel=0.01)
+
+def angle_duty_cycles(start, step, count):
+    # Duty cycles of an axle starting at the given angle and turning step degrees per period.
+
+    return [2.9 + ((start + step * n) % 360.0) * 94.2 / 360.0 for n in range(count)]
+
+def test_turns_and_lap_period():
+    reader = make_reader(filter_mode=read_PWM.MEDIAN, period_gating=True, turn_counting=True)
+
+    # 10º per period counter-clockwise: a lap every 36 periods, 2.5 laps in total.
+
+    tick = feed(reader, angle_duty_cycles(5.0, 10.0, 90))
+
+    assert reader.turns() == 2
+    assert reader.direction() == 1
+    assert reader.lap_period() == pytest.approx(36 * PERIOD, abs=2)
+    assert reader.rpm() == pytest.approx(60000000.0 / (36 * PERIOD), rel=0.01)
+
+    # Back clockwise across the boundary: the lap period restarts with the new direction.
+
+    feed(reader, angle_duty_cycles(15.0, -10.0, 10), tick + PERIOD)
+
+    assert reader.turns() == 1
+    assert reader.direction() == -1
+    assert reader.lap_period() is None
+
+def test_turns_on_the_simulated_servo(sim, servo):
+    pi, plant = sim
+
+    servo.run(-100) # Counter-clockwise at full speed, ~714 º/s
+    pi.sleep(0.5)
+
+    turns, position = servo.get_turns(), plant.angle
+    pi.sleep(2.0)
+
+    assert servo.get_turns() - turns == pytest.approx((plant.angle - position) / 360.0, abs=1)
+    assert servo.get_lap_period() == pytest.approx(360.0 / plant.speed * 1000000.0, rel=0.02)
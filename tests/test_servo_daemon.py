@@ -0,0 +1,102 @@
+###############################################################################
+# test_servo_daemon.py                                                        #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the servo daemon protocol on a simulated servo          #
+###############################################################################
+
+import os, shutil, tempfile, time
+import pytest
+import servo_daemon
+
+@pytest.fixture
+def daemon(sim, servo):
+    pi, _ = sim
+
+    servo.calibrate(stop_search=servo.BISECTION_SEARCH, limit_search=servo.ADAPTIVE_SEARCH)
+    pi.start_realtime()
+
+    # Unix socket paths are short, so the socket lives on a short temporary directory.
+
+    directory = tempfile.mkdtemp(prefix="prx")
+    path = os.path.join(directory, "servo.sock")
+
+    myDaemon = servo_daemon.ServoDaemon([servo], path)
+    myDaemon.start()
+
+    yield myDaemon, path
+
+    myDaemon.stop()
+    time.sleep(0.05)
+    shutil.rmtree(directory)
+
+def test_request_round_trip(daemon, servo):
+    _, path = daemon
+    client = servo_daemon.ServoClient(path)
+
+    try:
+        assert client.servos() == ["default"]
+        assert client.get_calibration() == servo.get_calibration()
+
+        client.run(-40)
+        status = client.status()
+
+        assert status["power"] == -40
+        assert 0.0 <= status["angle"] <= 360.0
+
+        client.send_pulse_width(1600)
+        client.stop()
+
+        assert client.status()["power"] == 0
+        assert client.stats()["requests"] >= 6
+    finally:
+        client.close()
+
+def test_errors_are_reported(daemon):
+    _, path = daemon
+    client = servo_daemon.ServoClient(path, servo=3)
+
+    try:
+        with pytest.raises(RuntimeError, match="No servo 3"):
+            client.stop()
+
+        assert client.stats()["errors"] == 1
+    finally:
+        client.close()
+
+def test_feedback_subscription(daemon):
+    _, path = daemon
+    client = servo_daemon.ServoClient(path)
+
+    try:
+        client.subscribe(every=5)
+
+        samples = [client.next_sample(timeout=1.0) for _ in range(3)]
+
+        assert None not in samples
+        assert samples[0][0] != samples[-1][0] # Every sample has its own tick
+    finally:
+        client.close()
+
+def test_run_releases_the_controller(daemon, sim):
+    _, path = daemon
+    pi, _ = sim
+    client = servo_daemon.ServoClient(path)
+
+    try:
+        start, simulated_start = time.perf_counter(), pi.clock()
+
+        client.goto_angle(90)
+        time.sleep(0.5)
+
+        client.run(-60)
+        time.sleep(0.3)
+
+        assert client.status()["power"] == -60
+
+        # The controller thread must not move the simulated time beyond the real one.
+
+        assert pi.clock() - simulated_start <= time.perf_counter() - start + 0.05
+    finally:
+        client.close()
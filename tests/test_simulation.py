@@ -0,0 +1,63 @@
+###############################################################################
+# test_simulation.py                                                          #
+#                                                                             #
+# Authors: Ioana Carmen, Diego García                                         #
+#                                                                             #
+# This code will test the simulated servo the other tests run on              #
+###############################################################################
+
+import pytest
+import pigpio, simulation
+
+def test_speed_curve_has_a_dead_band_and_saturates():
+    plant = simulation.ServoPlant()
+
+    assert plant.target_speed(1500) == 0.0
+    assert plant.target_speed(plant.min_cw_pw) == 0.0
+    assert plant.target_speed(plant.min_cw_pw - 1) < 0.0 < plant.target_speed(plant.min_ccw_pw + 1)
+
+    assert plant.target_speed(plant.max_cw_pw) == plant.target_speed(plant.max_cw_pw - 50) == -plant.max_cw_rpm * 6.0
+    assert plant.target_speed(plant.max_ccw_pw) == plant.target_speed(plant.max_ccw_pw + 50) == plant.max_ccw_rpm * 6.0
+
+def test_feedback_signal_and_motion():
+    pi = simulation.SimulatedPi()
+    plant = pi.attach(simulation.ServoPlant(seed=1), 14, 15)
+
+    edges = []
+    pi.callback(15, pigpio.EITHER_EDGE, lambda gpio, level, tick: edges.append((level, tick)))
+
+    pi.set_servo_pulsewidth(14, 1712)
+    pi.sleep(1.0)
+
+    # ~910 Hz, alternating levels, duty cycles within the datasheet range.
+
+    rises = [tick for level, tick in edges if level == 1]
+
+    assert len(rises) == pytest.approx(910, abs=2)
+    assert all(a[0] != b[0] for a, b in zip(edges, edges[1:]))
+
+    assert edges[0][0] == 1
+
+    duty_cycles = [100.0 * pigpio.tickDiff(rise[1], fall[1]) / 1099.0 for rise, fall in zip(edges[::2], edges[1::2])]
+
+    assert 2.5 <= min(duty_cycles) and max(duty_cycles) <= 97.5
+
+    # At full speed after the time constant, about 714 º/s.
+
+    assert plant.speed == pytest.approx(plant.max_ccw_rpm * 6.0, rel=0.01)
+    assert plant.angle == pytest.approx(plant.max_ccw_rpm * 6.0, rel=0.1)
+
+def test_time_only_moves_when_used():
+    pi = simulation.SimulatedPi()
+
+    start = pi.clock()
+    assert pi.clock() == start # clock() has no side effects
+
+    pi.time()
+    assert pi.clock() == pytest.approx(start + pi.poll_quantum)
+
+    calls = []
+    pi.call_later(0.5, lambda: calls.append(pi.clock()))
+    pi.sleep(1.0)
+
+    assert calls == [pytest.approx(start + pi.poll_quantum + 0.5)]